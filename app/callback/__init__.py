@@ -9,8 +9,10 @@ if APP_MODE == ApplicationMode.server:
     from .track_stream import Tracking_Stream
     from .webhook_stream import Webhook_Stream
     from .error_stream import Profile_Error_Stream
+    from .cache_sub import Cache_Sub
 
     Callbacks_Sub.update(Process_Sub)
+    Callbacks_Sub.update(Cache_Sub)
     Callbacks_Stream.update(Events_Stream)
     Callbacks_Stream.update(Tracking_Stream)
     Callbacks_Stream.update(Profile_Error_Stream)
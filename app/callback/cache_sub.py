@@ -0,0 +1,30 @@
+from app.container import Get
+from app.depends.orm_cache import ORM_CACHE_REGISTRY, cache_origin
+from app.services.assets_service import AssetService
+from app.utils.constant import SubConstant
+from app.utils.globals import CAPABILITIES
+
+
+async def Invalidate_ORM_Cache(message:dict):
+    if message.get('origin',None) == cache_origin():
+        return
+    
+    cache = ORM_CACHE_REGISTRY.get(message.get('cache',None),None)
+    if cache == None:
+        return
+    cache.InvalidLocal(message.get('keys',None))
+
+
+async def Reload_Assets(message:dict):
+    assetService:AssetService = Get(AssetService)
+    await assetService.reload_objects(message.get('objects',[]))
+
+
+Cache_Sub = {
+    SubConstant.ORM_CACHE_INVALIDATION: Invalidate_ORM_Cache,
+}
+
+# NOTE only the server processes hold the assets: a route renders the template and offloads the built content,
+# so a celery worker has nothing to reload and does not subscribe
+if CAPABILITIES['object']:
+    Cache_Sub[SubConstant.ASSET_RELOAD] = Reload_Assets
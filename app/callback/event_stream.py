@@ -10,10 +10,12 @@ from app.models.link_model import LinkEventORM,bulk_upsert_analytics, bulk_upser
 from app.models.contacts_model import ContactORM, bulk_upsert_contact_analytics, bulk_upsert_contact_creation_analytics
 from app.models.twilio_model import CallEventORM, CallStatusEnum, CallTrackingORM, SMSEventORM, SMSStatusEnum,SMSTrackingORM, bulk_upsert_call_analytics, bulk_upsert_sms_analytics
 from app.services.database.tortoise_service import TortoiseConnectionService
-from app.utils.constant import StreamConstant
+from app.services.link_service import LinkService
+from app.services.monitoring_service import MonitoringService
+from app.utils.constant import MonitorConstant, StreamConstant
 from tortoise.transactions import in_transaction
 from app.utils.transformer import empty_str_to_none
-from device_detector import DeviceDetector
+from app.classes.user_agent import UserAgentParser
 from tortoise.exceptions import IntegrityError
 
 Call_Ids:dict[str|dict]={}
@@ -67,6 +69,11 @@ async def Add_Link_Event(entries:list[tuple[str,dict]]):
     }
 
     print('Link Event Callback:','Treating',len(entries), 'entries')
+    linkService:LinkService = Get(LinkService)
+    # NOTE the location was not resolved on the redirect path
+    await linkService.resolve_geo_many([val for _,val in entries if not val.get('country',None) and val.get('ip_address',None)])
+
+    hits,misses = UserAgentParser.hits,UserAgentParser.misses
     for ids,val in entries:
         try:
             empty_str_to_none(val)
@@ -76,15 +83,7 @@ async def Add_Link_Event(entries:list[tuple[str,dict]]):
                 event_count[link_id] =0
             
             event_count[link_id]+=1
-            user_agent = val.get('user_agent',None)
-            if user_agent == None:
-                device_type = 'unknown'
-            else:
-                dd = DeviceDetector(user_agent).parse()
-                device_type = dd.device_type()
-                device_type = device_type.strip()
-                if not device_type:
-                    device_type = 'unknown'
+            device_type = UserAgentParser.parse(val.get('user_agent',None)).device_type
 
             if val.get('country',None) == None:
                 analytics_key=(link_id,N_A,N_A,N_A,device_type)
@@ -103,6 +102,10 @@ async def Add_Link_Event(entries:list[tuple[str,dict]]):
             print(e)
             invalid_entries.add(ids)
 
+    monitoringService:MonitoringService = Get(MonitoringService)
+    monitoringService.counter_inc(MonitorConstant.USER_AGENT_CACHE,UserAgentParser.hits - hits,result='hit')
+    monitoringService.counter_inc(MonitorConstant.USER_AGENT_CACHE,UserAgentParser.misses - misses,result='miss')
+
     analytics_inputs = []
 
 
@@ -123,7 +126,7 @@ async def Add_Link_Event(entries:list[tuple[str,dict]]):
         
         async with in_transaction():
             await bulk_upsert_analytics(analytics_inputs)
-        
+
         return list(valid_entries.union(invalid_entries))
     except Exception as e:
         print(e)
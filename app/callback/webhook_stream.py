@@ -1,21 +1,54 @@
+import json
 from typing import Any, TypedDict
+from urllib.parse import unquote_plus
 from app.errors.service_error import MiniServiceDoesNotExistsError
 from app.services.mini.webhook.db_webhook_service import DBPayload, DBWebhookInterface, WebhookBulkUploadError
 from app.services.ntfr.webhook_service import WebhookService
-from app.utils.constant import StreamConstant
+from app.utils.constant import MinioConstant, StreamConstant, SubConstant
 from app.definition._service import StateProtocol
 from app.services import RedisService
 from app.container import Get
 
+def parse_s3_event(value:Any)->list[str]:
+    """
+    Return the keys of the assets bucket found in a bucket notification, the records are either in `Records`
+    or in the `Event` list of the access format
+    """
+    if isinstance(value,str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return []
+    
+    if isinstance(value,list):
+        return [key for v in value for key in parse_s3_event(v)]
+    if not isinstance(value,dict):
+        return []
+    
+    keys = []
+    for record in value.get('Records',None) or value.get('Event',None) or []:
+        s3 = record.get('s3',{})
+        if s3.get('bucket',{}).get('name',None) != MinioConstant.ASSETS_BUCKET:
+            continue
+        key = s3.get('object',{}).get('key',None)
+        if key:
+            keys.append(unquote_plus(key))
+    return keys
+
 async def S3_Event_Stream(entries:list[tuple[str,dict]]):
 
     redisService = Get(RedisService)
     valid_entries = set()
-    invalid_entries = set()
+    object_names = set()
 
-    print(entries)
     for ids,val in entries:
+        for field in val.values():
+            object_names.update(parse_s3_event(field))
         valid_entries.add(ids)
+    
+    if object_names:
+        # NOTE every worker reloads its own stores, the stream only hands the batch to one of them
+        await redisService.publish_data(SubConstant.ASSET_RELOAD,{'objects':sorted(object_names)})
         
     return valid_entries
 
@@ -0,0 +1,129 @@
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import time
+import jinja2
+
+ARTIFACT_VERSION = 2
+TMP_PREFIX = '.tmp-'
+TMP_MAX_AGE = 3600 # NOTE seconds before a temporary file left by a crashed writer is pruned
+
+
+def code_version()->str:
+    """Hash of the template module: a change of the state it exports must not restore the artifacts of the previous code"""
+    with open(os.path.join(os.path.dirname(__file__),'template.py'),'rb') as f:
+        return hashlib.blake2b(f.read(),digest_size=8).hexdigest()
+
+
+class AssetArtifactStore:
+    """
+    Directory of the loaded assets shared by the processes of the host, an artifact is addressed by the object name and
+    its etag so a new version of the object never reads the artifact of the previous one. The key also holds the python
+    and jinja versions since the compiled template modules are marshalled, and the hash of the template module.
+
+    The artifacts are marshalled: loading one only builds plain values, it never calls into the code like unpickling would.
+    The compiled template modules it holds are still run when the template renders, so the directory is private to the
+    user of the processes.
+
+    An artifact is written to a temporary file renamed over its final path, a process never reads a partial artifact.
+    """
+
+    def __init__(self,directory:str):
+        self.directory = directory
+        self.salt = f'{ARTIFACT_VERSION}:{sys.version}:{jinja2.__version__}:{code_version()}'
+        self.make_private(directory)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_private(directory:str):
+        os.makedirs(directory,mode=0o700,exist_ok=True)
+        if not hasattr(os,'getuid'):
+            return
+
+        stat = os.stat(directory)
+        if stat.st_uid != os.getuid():
+            raise PermissionError(f'{directory} is not owned by the user of the process')
+        if stat.st_mode & 0o077:
+            os.chmod(directory,0o700)
+
+    def path(self,object_name:str,etag:str):
+        key = hashlib.blake2b(f'{self.salt}:{object_name}:{etag}'.encode(),digest_size=20).hexdigest()
+        return os.path.join(self.directory,key[:2],key)
+
+    def exists(self,object_name:str,etag:str)->bool:
+        return os.path.exists(self.path(object_name,etag))
+
+    def load(self,object_name:str,etag:str)->dict|None:
+        try:
+            with open(self.path(object_name,etag),'rb') as f:
+                artifact = marshal.loads(f.read())
+            if not isinstance(artifact,dict) or not isinstance(artifact.get('state',None),dict):
+                raise ValueError('malformed artifact')
+        except FileNotFoundError:
+            self.misses+=1
+            return None
+        except Exception as e:
+            print('Artifact:',object_name,e.__class__,e)
+            self.misses+=1
+            return None
+
+        self.hits+=1
+        return artifact
+
+    def store(self,object_name:str,etag:str,artifact:dict)->bool:
+        path = self.path(object_name,etag)
+        directory = os.path.dirname(path)
+        try:
+            data = marshal.dumps(artifact)
+            os.makedirs(directory,mode=0o700,exist_ok=True)
+            fd,tmp = tempfile.mkstemp(dir=directory,prefix=TMP_PREFIX)
+        except (OSError,ValueError) as e:
+            print('Artifact:',object_name,e.__class__,e)
+            return False
+
+        try:
+            with os.fdopen(fd,'wb') as f:
+                f.write(data)
+            os.replace(tmp,path)
+            return True
+        except Exception as e:
+            print('Artifact:',object_name,e.__class__,e)
+            os.unlink(tmp)
+            return False
+
+    def prune(self,etags:dict[str,str])->int:
+        """
+        Remove the artifacts of every version but the `etags` of the objects in the bucket, with those of a previous salt
+        """
+        keep = {os.path.basename(self.path(object_name,etag)) for object_name,etag in etags.items()}
+        now = time.time()
+        removed = 0
+        for root,_,files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root,name)
+                try:
+                    if name.startswith(TMP_PREFIX):
+                        # NOTE another process may be writing it
+                        if now - os.path.getmtime(path) < TMP_MAX_AGE:
+                            continue
+                    elif name in keep:
+                        continue
+                    os.unlink(path)
+                    removed+=1
+                except OSError:
+                    continue
+        return removed
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits':self.hits,
+            'misses':self.misses,
+            'hit_ratio':self.hits/total if total else 0.0,
+            'directory':self.directory,
+        }
@@ -52,6 +52,14 @@ class TaskExecutionResult():
         self.expected_tbd = expected_tdb
 
 
+class CeleryBatchItem(TypedDict):
+    index:Optional[int]
+    weight:float
+    args:tuple
+    kwargs:dict[str,Any]
+    result:TaskExecutionResult
+
+
 class TaskHeaviness(Enum):
     VERY_LIGHT = 1  # Minimal effort required
     LIGHT = 2       # Some effort, but not demanding
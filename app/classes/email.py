@@ -17,6 +17,22 @@ from dataclasses import dataclass, field
 
 from app.utils.helper import get_value_in_list
 import copy
+import re
+from uuid import uuid4
+
+CRLF = '\r\n'
+_EOL_RE = re.compile(r'(?:\r\n|\n|\r(?!\n))')
+_PERIOD_RE = re.compile(br'(?m)^\.')
+
+def encode_smtp_data(text:str)->bytes:
+    """
+    Encode a chunk of message starting at a line boundary the way `smtplib` does before the DATA command:
+    CRLF line endings and dot-stuffing
+    """
+    return _PERIOD_RE.sub(b'..',_EOL_RE.sub(CRLF,text).encode('ascii'))
+
+def make_boundary():
+    return '='*15 + uuid4().hex + '=='
 
 class NotSameDomainEmailError(BaseError):
     ...
@@ -82,6 +98,10 @@ class EmailBuilder():
         self.images=images
         self.attachements = attachments
         self.id = emailMetaData._Message_ID
+        self._segments:tuple[str,list[str]] = None
+        self._encoded_segments:tuple[bytes,list[bytes]] = None
+        self._content_parts:list[str] = None
+        self._encoded_content_parts:list[bytes] = None
 
         self.create_mime(emailMetaData)
         self.add_attachements()
@@ -109,18 +129,107 @@ class EmailBuilder():
     def __repr__(self):
         return self.emailMetadata.__str__()
     
-    def create_for_recipient(self):
+    def _recipient_headers(self,i:int)->list[tuple[str,str]]:
+        headers = [('Message-ID',self.id() if callable(self.id) else self.id[i])]
+        if get_value_in_list(self.emailMetadata._X_Email_ID,i):
+            headers.append(('X_Email_ID',self.emailMetadata._X_Email_ID[i]))
+        if self.emailMetadata._contact and  get_value_in_list(self.emailMetadata._contact,i):
+            headers.append(('X_Contact_ID',self.emailMetadata._contact[i]))
+        return headers
+
+    def _prepare_segments(self)->tuple[str,list[str]]:
+        """
+        Serialize once the parts shared by every recipient: the top level headers, the images and the attachments
+        """
+        if self._segments != None:
+            return self._segments
+
+        if self.message.get_boundary() == None:
+            self.message.set_boundary(make_boundary())
+        # NOTE as_string() does not fold the headers
+        self.policy = self.message.policy.clone(max_line_length=0)
+
+        head = ''.join(self.policy.fold(h,v) for h,v in self.message.raw_items())
+        shared_parts = [part.as_string() for part in self.message.get_payload()]
+        self._segments = head,shared_parts
+        return self._segments
+
+    def _recipient_content_parts(self,i:int)->list[str]:
+        if isinstance(self.contents,list):
+            return [part.as_string() for part in self.content_parts(i)]
+
+        if self._content_parts == None:
+            self._content_parts = [part.as_string() for part in self.content_parts(i)]
+        return self._content_parts
+
+    def _multipart_body(self,parts:list[str|bytes],encoded:bool)->list[str|bytes]:
+        """
+        Join the parts with the boundary delimiters the same way `email.generator.Generator` does
+        """
+        boundary = self.message.get_boundary()
+        sep,end = f'\n--{boundary}\n',f'\n--{boundary}--\n'
+        if encoded:
+            sep,end = encode_smtp_data(sep),encode_smtp_data(end)
+
+        pieces = []
+        for j,part in enumerate(parts):
+            if j > 0:
+                pieces.append(sep)
+            pieces.append(part)
+        pieces.append(end)
+        return pieces
+
+    def _fallback_message(self,headers:list[tuple[str,str]],i:int)->str:
+        message = copy.deepcopy(self.message)
+        for h,v in headers:
+            message[h] = v
+        self.set_content(i,message)
+        return message.as_string()
+
+    def _create_for_recipient(self,encoded:bool):
+        head,shared_parts = self._prepare_segments()
+        boundary = self.message.get_boundary()
+        if encoded:
+            if self._encoded_segments == None:
+                self._encoded_segments = encode_smtp_data(head),[encode_smtp_data(part) for part in shared_parts]
+            head,shared_parts = self._encoded_segments
+
         for i,To in enumerate(self.To):
-            message = copy.deepcopy(self.message)
-            message['Message-ID'] =self.id() if callable(self.id) else self.id[i]
-            if get_value_in_list(self.emailMetadata._X_Email_ID,i):
-                message['X_Email_ID'] = self.emailMetadata._X_Email_ID[i]
-            self.set_content(i,message)
-            if self.emailMetadata._contact and  get_value_in_list(self.emailMetadata._contact,i):
-                message['X_Contact_ID'] = self.emailMetadata._contact[i]
-            yield message["Message-ID"],message.as_string()
-
-    def add_attachements(self, attachement_name, attachment_data):
+            headers = self._recipient_headers(i)
+            message_id = headers[0][1]
+            content_parts = self._recipient_content_parts(i)
+
+            if any(f'--{boundary}' in part for part in content_parts):
+                # NOTE the boundary appears in the content, let the generator pick another one
+                message = self._fallback_message(headers,i)
+                yield message_id, encode_smtp_data(message) if encoded else message
+                continue
+
+            recipient_head = ''.join(self.policy.fold(h,v) for h,v in headers) + f'\n--{boundary}\n'
+            if encoded:
+                recipient_head = encode_smtp_data(recipient_head)
+                if isinstance(self.contents,list) or self._encoded_content_parts == None:
+                    self._encoded_content_parts = [encode_smtp_data(part) for part in content_parts]
+                content_parts = self._encoded_content_parts
+
+            pieces = [head,recipient_head,*self._multipart_body(shared_parts+content_parts,encoded)]
+            yield message_id, b''.join(pieces) if encoded else ''.join(pieces)
+
+    def create_for_recipient(self):
+        """
+        Yield the message of each recipient. The shared parts are serialized once, only the recipient headers
+        and body parts are generated for each one.
+        """
+        return self._create_for_recipient(False)
+
+    def create_encoded_for_recipient(self):
+        """
+        Same as `create_for_recipient` but yield the messages as bytes ready to be sent after the DATA command
+        (CRLF line endings and dot-stuffing), the shared parts being encoded only once.
+        """
+        return self._create_for_recipient(True)
+
+    def attach_file(self, attachement_name, attachment_data):
         part = MIMEBase("application", "octet-stream")
         part.set_payload(attachment_data)
         encoders.encode_base64(part)
@@ -128,21 +237,25 @@ class EmailBuilder():
             "Content-Disposition",
             f"attachment; filename= {attachement_name}",
         )
-        pass
+        self.message.attach(part)
 
-    def set_content(self, i,message):
+    def content_parts(self, i)->list[MIMEText]:
         if isinstance(self.contents,list):
             content = self.contents[i]
         else:
             content = self.contents
         
+        parts = []
         html_content, text_content = content
         if text_content:
-            part1 = MIMEText(text_content, "plain")
-            message.attach(part1)
+            parts.append(MIMEText(text_content, "plain"))
         if html_content:
-            part2 = MIMEText(html_content, "html")
-            message.attach(part2)
+            parts.append(MIMEText(html_content, "html"))
+        return parts
+
+    def set_content(self, i,message):
+        for part in self.content_parts(i):
+            message.attach(part)
 
     def attach_image(self, image_path, image_data, disposition: Literal["inline", "attachment"] = "inline"):
         img = MIMEImage(image_data)
@@ -157,7 +270,7 @@ class EmailBuilder():
             self.attach_image(path, img_data)
         for attachment in self.attachements:
             path, att_data = attachment
-            self.add_attachements(path, att_data)
+            self.attach_file(path, att_data)
 
     pass
 
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import math
+import os
+import sqlite3
+from array import array
+from threading import Lock
+from typing import Awaitable, Callable
+
+LLAMA_INSTALLED = True
+try:
+    from llama_index.core.base.embeddings.base import BaseEmbedding
+    from pydantic import PrivateAttr
+except ImportError:
+    LLAMA_INSTALLED = False
+
+EmbedBatch = Callable[[list[str]],Awaitable[list[list[float]]]]
+
+
+def embedding_key(model:str,dimensions:int,text:str)->str:
+    return hashlib.sha256(f'{model}:{dimensions}:{text}'.encode()).hexdigest()
+
+
+class StubEmbedding:
+    """
+    Deterministic embedder for the offline runs: the vector of a text is derived from its hash and normalized,
+    the same text always gets the same vector and no request leaves the process.
+    """
+
+    def __init__(self,dimensions:int=512,model:str='stub'):
+        self.dimensions = dimensions
+        self.model = model
+
+    def embed(self,text:str)->list[float]:
+        values = array('f')
+        counter = 0
+        while len(values) < self.dimensions:
+            digest = hashlib.blake2b(f'{counter}:{text}'.encode(),digest_size=64).digest()
+            values.extend(byte/127.5 - 1 for byte in digest)
+            counter+=1
+
+        vector = values[:self.dimensions].tolist()
+        norm = math.sqrt(sum(x*x for x in vector)) or 1
+        return [x/norm for x in vector]
+
+    async def aget_text_embedding_batch(self,texts:list[str],**kwargs)->list[list[float]]:
+        return [self.embed(text) for text in texts]
+
+    async def aget_query_embedding(self,query:str)->list[float]:
+        return self.embed(query)
+
+
+if LLAMA_INSTALLED:
+    class StubParseEmbedding(BaseEmbedding):
+        """
+        The `StubEmbedding` as a llama-index embedding, for the semantic splitter of the file ingestion
+        """
+        _stub:StubEmbedding = PrivateAttr()
+
+        def __init__(self,stub:StubEmbedding,**kwargs):
+            super().__init__(model_name=stub.model,**kwargs)
+            self._stub = stub
+
+        def _get_text_embedding(self,text:str)->list[float]:
+            return self._stub.embed(text)
+
+        def _get_query_embedding(self,query:str)->list[float]:
+            return self._stub.embed(query)
+
+        async def _aget_query_embedding(self,query:str)->list[float]:
+            return self._stub.embed(query)
+
+
+class EmbeddingCache:
+    """
+    SQLite file keyed by the hash of the model, the dimensions and the text, shared by the ingestion workers of the host.
+    The vectors are stored packed as float32.
+    """
+
+    def __init__(self,path:str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory,exist_ok=True)
+
+        self.connection = sqlite3.connect(path,check_same_thread=False,isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        self.lock = Lock()
+
+    def get_many(self,keys:list[str])->dict[str,list[float]]:
+        vectors = {}
+        with self.lock:
+            # NOTE stay under the default limit of bound parameters
+            for i in range(0,len(keys),500):
+                chunk = keys[i:i+500]
+                rows = self.connection.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({",".join("?"*len(chunk))})',chunk)
+                for key,vector in rows:
+                    vectors[key] = array('f',vector).tolist()
+        return vectors
+
+    def set_many(self,vectors:dict[str,list[float]]):
+        with self.lock:
+            with self.connection:
+                self.connection.execute('BEGIN')
+                self.connection.executemany('INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)',[(key,array('f',vector).tobytes()) for key,vector in vectors.items()])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class BatchEmbedder:
+    """
+    Embed a list of texts by batches of `batch_size`, with at most `concurrency` batches in flight. The duplicated texts
+    are embedded once and the texts already embedded by the same model with the same dimensions come from the cache.
+
+    The embedded vectors are rounded to float32 like the cached ones, a text gets the same vector from either.
+    """
+
+    def __init__(self,embed_batch:EmbedBatch,model:str,dimensions:int,cache:EmbeddingCache=None,batch_size:int=100,concurrency:int=4):
+        self.embed_batch = embed_batch
+        self.model = model
+        self.dimensions = dimensions
+        self.cache = cache
+        self.batch_size = max(batch_size,1)
+        self.semaphore = asyncio.Semaphore(max(concurrency,1))
+
+        self.cache_hits = 0
+        self.embedded = 0
+        self.requests = 0
+
+    async def _embed(self,batch:list[tuple[str,str]])->dict[str,list[float]]:
+        async with self.semaphore:
+            self.requests+=1
+            vectors = await self.embed_batch([text for _,text in batch])
+        return {key:array('f',vector).tolist() for (key,_),vector in zip(batch,vectors)}
+
+    async def embed(self,texts:list[str])->list[list[float]]:
+        keys = [embedding_key(self.model,self.dimensions,text) for text in texts]
+        pending = dict(zip(keys,texts))
+
+        vectors:dict[str,list[float]] = {}
+        if self.cache != None:
+            vectors = await asyncio.to_thread(self.cache.get_many,list(pending))
+            self.cache_hits+=len(vectors)
+
+        missing = [(key,text) for key,text in pending.items() if key not in vectors]
+        if missing:
+            batches = [missing[i:i+self.batch_size] for i in range(0,len(missing),self.batch_size)]
+            embedded:dict[str,list[float]] = {}
+            for result in await asyncio.gather(*(self._embed(batch) for batch in batches)):
+                embedded.update(result)
+
+            self.embedded+=len(embedded)
+            vectors.update(embedded)
+            if self.cache != None:
+                await asyncio.to_thread(self.cache.set_many,embedded)
+
+        return [vectors[key] for key in keys]
+
+    @property
+    def stats(self):
+        return {
+            'cache_hits':self.cache_hits,
+            'embedded':self.embedded,
+            'requests':self.requests,
+        }
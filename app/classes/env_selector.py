@@ -1,5 +1,6 @@
 import random
 import math
+from threading import Lock
 from abc import ABC, abstractmethod
 from typing import Dict, Literal, List, Optional
 
@@ -169,10 +170,152 @@ class BoltzmannEnvSelector(ProbabilisticEnvSelector):
         return random.choices(keys, weights=[e/total for e in exps])[0]
 
 
+# ======================================================================
+# =============== LIVE SIGNALS =========================================
+# ======================================================================
+class EnvFeedback:
+    """
+    Process wide signals of the task environments: the length of the Celery queues sampled by the `CeleryService`,
+    the background tasks running in this process, and an EWMA of the latency and of the failures of each environment.
+
+    The latency of `worker` and `aps` is the time they take to accept the task, the one of `route` and `routebkg`
+    is the time the task keeps the process busy, a background task also counts the time it waited to start.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.lock = Lock()
+
+        self.latency: Dict[EnvSelection, float] = {}
+        self.failure: Dict[EnvSelection, float] = {env: 0.0 for env in ENVS}
+        self.samples: Dict[EnvSelection, int] = {env: 0 for env in ENVS}
+
+        self.celery_queue_length = 0
+        self.background_count = 0
+
+    def record(self, env: EnvSelection, latency: float, success: bool = True):
+        with self.lock:
+            previous = self.latency.get(env, None)
+            self.latency[env] = latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+            self.failure[env] = self.alpha * (0.0 if success else 1.0) + (1 - self.alpha) * self.failure[env]
+            self.samples[env] += 1
+
+    def set_queue_length(self, length: int):
+        self.celery_queue_length = max(length, 0)
+
+    def background_started(self):
+        with self.lock:
+            self.background_count += 1
+
+    def background_done(self):
+        with self.lock:
+            self.background_count = max(self.background_count - 1, 0)
+
+    @property
+    def stats(self):
+        return {
+            'celery_queue_length': self.celery_queue_length,
+            'background_count': self.background_count,
+            'latency': dict(self.latency),
+            'failure': dict(self.failure),
+            'samples': dict(self.samples),
+        }
+
+
+TaskEnvFeedback = EnvFeedback()
+
+
+class FeedbackEnvSelector(ProbabilisticEnvSelector):
+    """
+    Bandit over the environments allowed by the mask. The arm value is the static score of `compute_scores` minus the penalties
+    of the live signals, plus an exploration bonus for the environments with few samples, and the arm is drawn with a Boltzmann policy.
+
+    Guardrails, applied before the draw as long as another environment stays allowed:
+        - `worker` is removed when no worker answered the last ping or when the backlog per worker reaches `queue_max`
+        - `routebkg` is removed when `background_max` background tasks are already running in the process
+        - an environment is removed when its failure EWMA reaches `max_failure` after `min_samples` samples
+    """
+
+    def __init__(
+        self,
+        temp: float = 1.0,
+        *,
+        feedback: EnvFeedback = TaskEnvFeedback,
+        queue_max: int = 100,
+        background_max: int = 50,
+        max_failure: float = 0.5,
+        min_samples: int = 5,
+        latency_weight: float = 1.0,
+        exploration: float = 0.5,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.temperature = temp
+        self.feedback = feedback
+        self.queue_max = max(queue_max, 1)
+        self.background_max = max(background_max, 1)
+        self.max_failure = max_failure
+        self.min_samples = min_samples
+        self.latency_weight = latency_weight
+        self.exploration = exploration
+
+    def guard(self, scores: Dict[EnvSelection, float], p1: float) -> Dict[EnvSelection, float]:
+        feedback = self.feedback
+        removed = set()
+
+        if 'worker' in scores and (p1 <= 0 or feedback.celery_queue_length / max(p1, 1) >= self.queue_max):
+            removed.add('worker')
+
+        if 'routebkg' in scores and feedback.background_count >= self.background_max:
+            removed.add('routebkg')
+
+        for env in scores:
+            if feedback.samples[env] >= self.min_samples and feedback.failure[env] >= self.max_failure:
+                removed.add(env)
+
+        guarded = {env: score for env, score in scores.items() if env not in removed}
+        return guarded if guarded else scores
+
+    def adjust_scores(self, scores: Dict[EnvSelection, float], p1: float) -> Dict[EnvSelection, float]:
+        feedback = self.feedback
+        observed = [feedback.latency[env] for env in scores if env in feedback.latency]
+        best_latency = max(min(observed), 1e-6) if observed else None
+        total_samples = sum(feedback.samples[env] for env in scores)
+
+        adjusted = {}
+        for env, score in scores.items():
+            if best_latency is not None and env in feedback.latency:
+                score -= self.latency_weight * math.log(max(feedback.latency[env], 1e-6) / best_latency)
+
+            score -= 4 * feedback.failure[env]
+
+            if env == 'worker':
+                score -= 2 * feedback.celery_queue_length / (max(p1, 1) * self.queue_max)
+            elif env == 'routebkg':
+                score -= 2 * feedback.background_count / self.background_max
+
+            score += self.exploration * math.sqrt(math.log(total_samples + 1) / (feedback.samples[env] + 1))
+            adjusted[env] = score
+        return adjusted
+
+    def select(self, p1, p2, p3, mask=DEFAULT_MASK):
+        scores = self.apply_mask(self.compute_scores(p1, p2, p3), mask)
+        scores = self.adjust_scores(self.guard(scores, p1), p1)
+
+        keys = list(scores.keys())
+        raw_scores = list(scores.values())
+
+        max_score = max(raw_scores)
+        exps = [math.exp((s - max_score) / self.temperature) for s in raw_scores]
+        total = sum(exps)
+
+        return random.choices(keys, weights=[e/total for e in exps])[0]
+
+
 # ======================================================================
 # =============== FACTORY ==============================================
 # ======================================================================
-StrategyType = Literal['random', 'softmax', 'epsilon_greedy', 'boltzmann']
+StrategyType = Literal['random', 'softmax', 'epsilon_greedy', 'boltzmann', 'feedback']
 
 
 def get_selector(strategy: StrategyType, **kwargs) -> ProbabilisticEnvSelector:
@@ -184,5 +327,7 @@ def get_selector(strategy: StrategyType, **kwargs) -> ProbabilisticEnvSelector:
         return EpsilonGreedyEnvSelector(**kwargs)
     elif strategy == 'boltzmann':
         return BoltzmannEnvSelector(**kwargs)
+    elif strategy == 'feedback':
+        return FeedbackEnvSelector(**kwargs)
     else:
         raise ValueError(f"Unknown strategy: {strategy}")
@@ -0,0 +1,302 @@
+import asyncio
+import ipaddress
+import os
+import time
+from threading import Lock
+from typing import Any, Awaitable, Callable, TypedDict
+import aiohttp
+from cachetools import LRUCache
+from redis.exceptions import RedisError
+from app.definition._error import BaseError
+
+MAXMIND_INSTALLED = True
+try:
+    import maxminddb
+except ImportError:
+    MAXMIND_INSTALLED = False
+
+
+class GeoResolutionError(BaseError):
+    ...
+
+
+class GeoData(TypedDict):
+    country:str|None
+    geo_lat:float|None
+    geo_long:float|None
+    region:str|None
+    city:str|None
+    timezone:str|None
+
+
+def normalize_ip(ip_address:str|None)->str|None:
+    """
+    Keep the client address of an `x-forwarded-for` header and drop the addresses that can not be located
+    """
+    if not ip_address:
+        return None
+    ip_address = ip_address.split(',')[0].strip()
+    try:
+        ip = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+    if not ip.is_global:
+        return None
+    return ip_address
+
+
+GEO_LOOKUP_PREFIX = 'geo-lookup'
+
+
+class GeoResolver:
+    name = 'none'
+    remote = False
+    """
+    The lookups leave the host, their results are worth sharing between the workers
+    """
+
+    async def resolve(self,ip_address:str)->GeoData|None:
+        return None
+
+    async def close(self):
+        ...
+
+
+class MMDBGeoResolver(GeoResolver):
+    """
+    Read a MaxMind City database (GeoLite2 or GeoIP2). The file is memory-mapped so the pages are shared by every worker
+    of the host through the page cache, a lookup does no I/O once the pages are loaded. At most every `check_interval`
+    seconds the mtime of the file is checked, the database is reopened once geoipupdate replaced it.
+    """
+    name = 'mmdb'
+
+    def __init__(self,path:str,check_interval:float=60):
+        self.path = path
+        self.check_interval = check_interval
+        self.mtime = os.stat(path).st_mtime
+        self.reader = maxminddb.open_database(path,maxminddb.MODE_MMAP)
+        self.checked_at = time.monotonic()
+
+    def reopen_if_replaced(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return
+            reader = maxminddb.open_database(self.path,maxminddb.MODE_MMAP)
+        except (OSError,maxminddb.InvalidDatabaseError) as e:
+            # NOTE keep the current database while the file is being replaced, the next check tries again
+            print('GeoIP database could not be reopened:',e)
+            return
+
+        previous,self.reader,self.mtime = self.reader,reader,mtime
+        previous.close()
+
+    def lookup(self,ip_address:str)->GeoData|None:
+        self.reopen_if_replaced()
+        record = self.reader.get(ip_address)
+        if not record:
+            return None
+
+        location = record.get('location',{})
+        subdivisions = record.get('subdivisions',[])
+        return GeoData(
+            country=record.get('country',{}).get('iso_code',None),
+            geo_lat=location.get('latitude',None),
+            geo_long=location.get('longitude',None),
+            region=subdivisions[0].get('names',{}).get('en',None) if subdivisions else None,
+            city=record.get('city',{}).get('names',{}).get('en',None),
+            timezone=location.get('time_zone',None),
+        )
+
+    async def resolve(self,ip_address:str)->GeoData|None:
+        return self.lookup(ip_address)
+
+    async def close(self):
+        self.reader.close()
+
+
+class IPInfoGeoResolver(GeoResolver):
+    name = 'ipinfo'
+    remote = True
+
+    def __init__(self,api_key:str,timeout:float=2):
+        self.headers = {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session:aiohttp.ClientSession = None
+
+    async def resolve(self,ip_address:str)->GeoData|None:
+        if self.session == None or self.session.closed:
+            self.session = aiohttp.ClientSession(headers=self.headers,timeout=self.timeout)
+        try:
+            async with self.session.get(f"https://ipinfo.io/{ip_address}") as response:
+                if response.status == 429 or response.status >= 500:
+                    raise GeoResolutionError(response.status)
+                if response.status != 200:
+                    return None
+                data = await response.json()
+        except (aiohttp.ClientError,asyncio.TimeoutError) as e:
+            raise GeoResolutionError(e)
+
+        loc:str = data.get('loc',None)
+        lat, long = loc.split(',') if loc else (None,None)
+        return GeoData(
+            country=data.get('country',None),
+            geo_lat=float(lat) if lat != None else None,
+            geo_long=float(long) if long != None else None,
+            region=data.get('region',None),
+            city=data.get('city',None),
+            timezone=data.get('timezone',None),
+        )
+
+    async def close(self):
+        if self.session != None:
+            await self.session.close()
+
+
+class CachedGeoResolver(GeoResolver):
+    """
+    Keep the last `maxsize` lookups in memory, including the addresses that could not be located. When the resolver is
+    remote the lookups are also kept `ttl` seconds in the Redis cache database shared by every worker, so a restart or
+    another worker does not query the provider again. A lookup in flight is shared by the callers asking for the same address.
+    A `GeoResolutionError` is not cached so the address is looked up again on the next call.
+
+    `resolve_many` reads the addresses of a batch with one `retrieve_many` round trip, looks the remaining ones up
+    concurrently and writes them back with one `store_many` round trip.
+    """
+
+    def __init__(self,resolver:GeoResolver,maxsize:int=10000,retrieve:Callable[[str],Awaitable[Any]]=None,store:Callable[[str,Any,int],Awaitable[Any]]=None,ttl:int=60*60*24,
+                retrieve_many:Callable[[list[str]],Awaitable[list[Any]]]=None,store_many:Callable[[list[tuple[str,Any,int]]],Awaitable[Any]]=None):
+        self.resolver = resolver
+        self.name = resolver.name
+        self.remote = resolver.remote
+        self.cache:LRUCache[str,GeoData|None] = LRUCache(maxsize)
+        self.lock = Lock()
+        self.in_flight:dict[str,asyncio.Future] = {}
+
+        shared = resolver.remote and retrieve != None and store != None
+        self.retrieve = retrieve if shared else None
+        self.store = store if shared else None
+        self.retrieve_many = retrieve_many if shared else None
+        self.store_many = store_many if shared else None
+        self.ttl = ttl
+
+    @staticmethod
+    def key(ip_address:str):
+        return f'{GEO_LOOKUP_PREFIX}:{ip_address}'
+
+    async def resolve(self,ip_address:str|None)->GeoData|None:
+        ip_address = normalize_ip(ip_address)
+        if ip_address == None:
+            return None
+
+        with self.lock:
+            if ip_address in self.cache:
+                return self.cache[ip_address]
+
+        return await self._shared(ip_address,self._resolve)
+
+    async def resolve_many(self,ip_addresses:list[str|None])->list[GeoData|None]:
+        ip_addresses = [normalize_ip(ip_address) for ip_address in ip_addresses]
+        results:dict[str,GeoData|None] = {}
+        misses = []
+        with self.lock:
+            for ip_address in dict.fromkeys(ip_addresses):
+                if ip_address == None:
+                    continue
+                if ip_address in self.cache:
+                    results[ip_address] = self.cache[ip_address]
+                else:
+                    misses.append(ip_address)
+
+        if misses and self.retrieve_many != None:
+            try:
+                entries = await self.retrieve_many([self.key(ip_address) for ip_address in misses])
+            except RedisError:
+                entries = [None]*len(misses)
+            remaining = []
+            for ip_address,entry in zip(misses,entries):
+                if isinstance(entry,dict):
+                    results[ip_address] = entry.get('data',None)
+                    self._remember(ip_address,results[ip_address])
+                else:
+                    remaining.append(ip_address)
+            misses = remaining
+
+        to_store = []
+
+        async def lookup(ip_address:str):
+            try:
+                data = await self.resolver.resolve(ip_address)
+            except GeoResolutionError:
+                return None
+            self._remember(ip_address,data)
+            to_store.append((self.key(ip_address),{'data':data},self.ttl))
+            return data
+
+        resolved = await asyncio.gather(*(self._shared(ip_address,lookup) for ip_address in misses))
+        results.update(zip(misses,resolved))
+
+        if to_store and self.store_many != None:
+            try:
+                await self.store_many(to_store)
+            except RedisError:
+                ...
+        return [results.get(ip_address,None) if ip_address != None else None for ip_address in ip_addresses]
+
+    async def _shared(self,ip_address:str,resolve:Callable[[str],Awaitable[GeoData|None]])->GeoData|None:
+        future = self.in_flight.get(ip_address,None)
+        if future != None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[ip_address] = future
+        try:
+            data = await resolve(ip_address)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            # NOTE mark the exception as retrieved when no other caller is waiting on it
+            future.exception()
+            raise
+        finally:
+            self.in_flight.pop(ip_address,None)
+
+    async def _resolve(self,ip_address:str)->GeoData|None:
+        if self.retrieve != None:
+            try:
+                entry = await self.retrieve(self.key(ip_address))
+            except RedisError:
+                entry = None
+            if isinstance(entry,dict):
+                data = entry.get('data',None)
+                self._remember(ip_address,data)
+                return data
+
+        try:
+            data = await self.resolver.resolve(ip_address)
+        except GeoResolutionError:
+            return None
+
+        self._remember(ip_address,data)
+        if self.store != None:
+            try:
+                await self.store(self.key(ip_address),{'data':data},self.ttl)
+            except RedisError:
+                ...
+        return data
+
+    def _remember(self,ip_address:str,data:GeoData|None):
+        with self.lock:
+            self.cache[ip_address] = data
+
+    async def close(self):
+        await self.resolver.close()
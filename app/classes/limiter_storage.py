@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import inspect
+import time
+from threading import Lock
+from typing import Callable
+from limits.storage import RedisStorage
+from slowapi import Limiter
+from starlette.requests import Request
+from starlette.responses import Response
+
+LEASED_REDIS_SCHEME = 'notifyr+redis'
+
+
+class LeasedRedisStorage(RedisStorage):
+    """
+    Redis storage of the limiter where a worker reserves `lease_size` extra entries of a sliding window in the same script call
+    and spends them locally for `lease_ttl` seconds, so most of the checks do not reach Redis.
+
+    The reserved entries are counted in Redis when they are taken: the workers can never admit more than the limit together,
+    the entries a worker does not spend before its lease expires are lost for the current window.
+    A lease is only taken when the limit is at least ten times the lease, the small limits always check Redis.
+    """
+    STORAGE_SCHEME = [LEASED_REDIS_SCHEME]
+
+    def __init__(self, uri: str, lease_size: int = 0, lease_ttl: float = 1, **options):
+        super().__init__(uri.replace(LEASED_REDIS_SCHEME,'redis',1), **options)
+        self.lease_size = int(lease_size)
+        self.lease_ttl = float(lease_ttl)
+        self.leases:dict[str,list[float]] = {}
+        self.lease_lock = Lock()
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        lease = min(self.lease_size,limit//10)
+        if lease <= 0:
+            return super().acquire_sliding_window_entry(key,limit,expiry,amount)
+
+        now = time.time()
+        with self.lease_lock:
+            tokens = self.leases.get(key,None)
+            if tokens != None and tokens[1] > now and tokens[0] >= amount:
+                tokens[0]-=amount
+                return True
+
+        if not super().acquire_sliding_window_entry(key,limit,expiry,amount+lease):
+            # NOTE not enough room left in the window for a lease, fall back to the exact amount
+            return super().acquire_sliding_window_entry(key,limit,expiry,amount)
+
+        with self.lease_lock:
+            self.leases[key] = [lease,now + min(self.lease_ttl,expiry)]
+        return True
+
+    def clear(self, key: str) -> None:
+        with self.lease_lock:
+            self.leases.pop(key,None)
+        return super().clear(key)
+
+    def reset(self) -> int | None:
+        with self.lease_lock:
+            self.leases.clear()
+        return super().reset()
+
+
+class NotifyrLimiter(Limiter):
+    """
+    slowapi limiter whose checks and header injections on async routes run in a worker thread,
+    the storage calls of slowapi are blocking and would otherwise stall the event loop on every request.
+
+    `on_fallback` is called with the new state each time the limiter switches to or back from the in memory storage.
+    """
+
+    def __init__(self, *args, on_fallback:Callable[[bool],None]=None, **kwargs):
+        self.on_fallback = on_fallback
+        super().__init__(*args,**kwargs)
+
+    @property
+    def _storage_dead(self)->bool:
+        return self.__dict__.get('storage_dead',False)
+
+    @_storage_dead.setter
+    def _storage_dead(self,value:bool):
+        previous = self.__dict__.get('storage_dead',False)
+        self.__dict__['storage_dead'] = value
+        if previous != value and self.on_fallback != None:
+            self.on_fallback(value)
+
+    def limit(self, limit_value, key_func=None, **kwargs):
+        return self._offload(super().limit(limit_value,key_func,**kwargs))
+
+    def shared_limit(self, limit_value, scope, key_func=None, **kwargs):
+        return self._offload(super().shared_limit(limit_value,scope,key_func,**kwargs))
+
+    def _offload(self,decorator:Callable):
+
+        def wrapper(func:Callable):
+            checked = decorator(func) # NOTE registers the limits of the route
+            if not asyncio.iscoroutinefunction(func):
+                return checked
+
+            parameters = list(inspect.signature(func).parameters)
+            idx = parameters.index('request') if 'request' in parameters else parameters.index('websocket')
+
+            @functools.wraps(func)
+            async def async_wrapper(*args,**kwargs):
+                if not self.enabled:
+                    return await func(*args,**kwargs)
+
+                request:Request = kwargs.get('request',args[idx] if args else None)
+                if not isinstance(request,Request):
+                    raise Exception('parameter `request` must be an instance of starlette.requests.Request')
+
+                if self._auto_check and not getattr(request.state,'_rate_limiting_complete',False):
+                    await asyncio.to_thread(self._check_request_limit,request,func,False)
+                    request.state._rate_limiting_complete = True
+
+                response = await func(*args,**kwargs)
+                target = response if isinstance(response,Response) else kwargs.get('response')
+                await asyncio.to_thread(self._inject_headers,target,request.state.view_rate_limit)
+                return response
+
+            return async_wrapper
+
+        return wrapper
@@ -0,0 +1,171 @@
+import asyncio
+from threading import Lock
+from typing import Any, Awaitable, Callable
+import aiohttp
+from cachetools import TLRUCache
+from redis.exceptions import RedisError
+from twilio.base.exceptions import TwilioRestException
+
+LookupResult = tuple[int,dict]
+
+PHONE_LOOKUP_PREFIX = 'phone-lookup'
+
+
+def is_transient(status_code:int)->bool:
+    """
+    A 429, a 5xx or a connection error (returned as a 503) says nothing about the number, the lookup can succeed later
+    """
+    return status_code == 429 or status_code >= 500
+
+
+def is_unknown_number(status_code:int)->bool:
+    """
+    A 404 or a 400 is Twilio saying the number does not exist or is not valid, any other 4xx (a 401, a 403...) is about the
+    account and says nothing about the number
+    """
+    return status_code in (400,404)
+
+
+class PhoneLookupCache:
+    """
+    Keep the Twilio lookups of the phone numbers in two tiers: an in-process LRU that expires after `local_ttl` seconds and
+    the Redis cache database, shared by every worker, that keeps a number for `ttl` seconds.
+
+    A number Twilio does not know (a 404 or a 400) is cached as well for `negative_ttl` seconds, any other failure is
+    returned without being cached. A lookup in flight is shared by the callers asking for the same number.
+    """
+
+    def __init__(self,lookup:Callable[[str,list[str]],Awaitable[dict]],retrieve_many:Callable[[list[str]],Awaitable[list]],store_many:Callable[[list[tuple[str,Any,int]]],Awaitable[Any]],maxsize:int=10000,local_ttl:int=3600,ttl:int=60*60*24*30,negative_ttl:int=60*60*24,concurrency:int=10):
+        self.lookup = lookup
+        self.retrieve_many = retrieve_many
+        self.store_many = store_many
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local_ttl = local_ttl
+
+        self.cache:TLRUCache[str,LookupResult] = TLRUCache(maxsize,self._ttu)
+        self.lock = Lock()
+        self.semaphore = asyncio.Semaphore(max(concurrency,1))
+        self.in_flight:dict[str,asyncio.Future] = {}
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.lookups = 0
+
+    def _ttu(self,key:str,value:LookupResult,now:float):
+        return now + min(self.local_ttl,self.ttl if value[0] == 200 else self.negative_ttl)
+
+    @staticmethod
+    def key(phone_number:str,query:list[str]):
+        return f'{PHONE_LOOKUP_PREFIX}:{",".join(query)}:{phone_number}'
+
+    async def get(self,phone_number:str,query:list[str])->LookupResult:
+        results = await self.get_many([phone_number],query)
+        return results[phone_number]
+
+    async def get_many(self,phone_numbers:list[str],query:list[str])->dict[str,LookupResult]:
+        """
+        `phone_numbers` must already be in the E.164 format. The numbers missing from both tiers are looked up with at most
+        `concurrency` requests in flight, their results are written back to Redis in a single pipeline.
+        """
+        results:dict[str,LookupResult] = {}
+        pending:dict[str,str] = {}
+
+        with self.lock:
+            for phone_number in dict.fromkeys(phone_numbers):
+                key = self.key(phone_number,query)
+                entry = self.cache.get(key,None)
+                if entry != None:
+                    self.local_hits+=1
+                    results[phone_number] = entry
+                else:
+                    pending[phone_number] = key
+
+        if not pending:
+            return results
+
+        try:
+            values = await self.retrieve_many(list(pending.values()))
+        except RedisError:
+            values = [None]*len(pending)
+
+        missing:dict[str,str] = {}
+        for (phone_number,key),value in zip(pending.items(),values):
+            if not isinstance(value,dict):
+                missing[phone_number] = key
+                continue
+            entry = (value['status'],value['data'])
+            self._remember(key,entry)
+            self.redis_hits+=1
+            results[phone_number] = entry
+
+        if not missing:
+            return results
+
+        fetched = await asyncio.gather(*(self._fetch(phone_number,key,query) for phone_number,key in missing.items()))
+        items = []
+        for (phone_number,key),(entry,owner,cacheable) in zip(missing.items(),fetched):
+            results[phone_number] = entry
+            if owner and cacheable:
+                items.append((key,{'status':entry[0],'data':entry[1]},self.ttl if entry[0] == 200 else self.negative_ttl))
+
+        if items:
+            try:
+                await self.store_many(items)
+            except RedisError:
+                ...
+        return results
+
+    def _remember(self,key:str,entry:LookupResult):
+        with self.lock:
+            self.cache[key] = entry
+
+    async def _fetch(self,phone_number:str,key:str,query:list[str])->tuple[LookupResult,bool,bool]:
+        future = self.in_flight.get(key,None)
+        if future != None:
+            entry,_ = await asyncio.shield(future)
+            return entry,False,False
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            entry,cacheable = await self._lookup(phone_number,query)
+            if cacheable:
+                self._remember(key,entry)
+            future.set_result((entry,cacheable))
+            return entry,True,cacheable
+        except BaseException as e:
+            future.set_exception(e)
+            # NOTE mark the exception as retrieved when no other caller is waiting on it
+            future.exception()
+            raise
+        finally:
+            self.in_flight.pop(key,None)
+
+    async def _lookup(self,phone_number:str,query:list[str])->tuple[LookupResult,bool]:
+        async with self.semaphore:
+            self.lookups+=1
+            try:
+                return (200,await self.lookup(phone_number,query)),True
+            except TwilioRestException as e:
+                entry = (e.status,{'message':e.msg,'code':e.code,'phone_number':phone_number})
+                return entry,is_unknown_number(e.status)
+            except (aiohttp.ClientConnectionError,asyncio.TimeoutError) as e:
+                return (503,{'message':str(e),'phone_number':phone_number}),False
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.local_hits = 0
+            self.redis_hits = 0
+            self.lookups = 0
+
+    @property
+    def stats(self):
+        return {
+            'local_hits':self.local_hits,
+            'redis_hits':self.redis_hits,
+            'lookups':self.lookups,
+            'size':len(self.cache),
+            'maxsize':self.cache.maxsize,
+        }
@@ -0,0 +1,292 @@
+from collections import deque
+from dataclasses import dataclass, field
+from email.utils import parseaddr
+import smtplib as smtp
+from threading import Condition
+import time
+from typing import Callable
+
+from app.definition._error import BaseError
+
+
+class SMTPPoolTimeoutError(BaseError):
+    ...
+
+class SMTPPoolClosedError(BaseError):
+    ...
+
+
+@dataclass
+class PooledSMTPConnection:
+    connector: smtp.SMTP
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    messages: int = 0
+    direct: bool = False
+    """
+    Opened outside of the pool, closed when released
+    """
+
+
+class SMTPConnectionPool:
+    """
+    The `SMTPConnectionPool` class keeps authenticated SMTP connections of a single profile open between calls,
+    so the TLS handshake and the AUTH round trips are paid once per connection instead of once per send.
+
+    A connection is checked with a NOOP before being reused, dropped once it stayed idle longer than `idle_ttl`
+    seconds (above `min_size`) and closed once it sent `max_messages` messages so the provider limits are respected.
+    The pool is thread-safe since the sending methods run in the thread pool of the server.
+
+    The pool is filled up to `min_size` on the first borrow: it is built before the server forks its workers, a connection
+    opened then would be shared by every worker.
+    """
+
+    def __init__(self,open_connection:Callable[[],smtp.SMTP|None],close_connection:Callable[[smtp.SMTP],None],min_size:int=1,max_size:int=4,idle_ttl:float=60,max_messages:int=100,timeout:float=30):
+        self.open_connection = open_connection
+        self.close_connection = close_connection
+
+        self.min_size = min(min_size,max_size)
+        self.max_size = max(max_size,1)
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+        self._idle:deque[PooledSMTPConnection] = deque()
+        self._size = 0
+        self._closed = False
+        self._filled = False
+        self._cond = Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def fill(self):
+        """
+        Open the connections needed to reach `min_size`
+        """
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size+=1
+
+            pooled = self._open()
+            if pooled is None:
+                return
+            self.release(pooled)
+
+    def _open(self)->PooledSMTPConnection|None:
+        try:
+            connector = self.open_connection()
+        except Exception:
+            connector = None
+
+        if connector is None:
+            with self._cond:
+                self._size-=1
+                self._cond.notify()
+            return None
+        return PooledSMTPConnection(connector)
+
+    def _close(self,pooled:PooledSMTPConnection):
+        try:
+            self.close_connection(pooled.connector)
+        except Exception:
+            ...
+
+    @staticmethod
+    def _healthy(pooled:PooledSMTPConnection)->bool:
+        try:
+            code,_ = pooled.connector.noop()
+            return code == 250
+        except (smtp.SMTPException,OSError):
+            return False
+
+    def _reap(self)->list[PooledSMTPConnection]:
+        now = time.monotonic()
+        expired = []
+        while len(self._idle) > 0 and self._size > self.min_size:
+            oldest = self._idle[0]
+            if now - oldest.last_used < self.idle_ttl:
+                break
+            expired.append(self._idle.popleft())
+            self._size-=1
+        return expired
+
+    def acquire(self)->PooledSMTPConnection|None:
+        """
+        Borrow a healthy connection, opening one if the pool is not full. Return None when no connection could be opened
+        """
+        if not self._filled:
+            self._filled = True
+            self.fill()
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise SMTPPoolClosedError
+
+                expired = self._reap()
+                pooled = None
+                while True:
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size+=1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise SMTPPoolTimeoutError
+                    self._cond.wait(remaining)
+
+            for e in expired:
+                self._close(e)
+
+            if pooled is None:
+                return self._open()
+
+            if self._healthy(pooled):
+                return pooled
+            self.release(pooled,discard=True)
+
+    def release(self,pooled:PooledSMTPConnection|None,discard:bool=False):
+        if pooled is None:
+            return
+
+        with self._cond:
+            if discard or self._closed or pooled.messages >= self.max_messages:
+                self._size-=1
+                to_close = True
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+                to_close = False
+            self._cond.notify()
+
+        if to_close:
+            self._close(pooled)
+
+    def rotate(self,pooled:PooledSMTPConnection|None)->PooledSMTPConnection|None:
+        """
+        Return the connection to the pool when it reached `max_messages` and borrow another one
+        """
+        if pooled is not None and pooled.messages < self.max_messages:
+            return pooled
+        self.release(pooled)
+        return self.acquire()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for pooled in idle:
+            self._close(pooled)
+
+
+def _quoteaddr(addr:str)->str:
+    _,address = parseaddr(addr)
+    return f"<{address or addr.strip()}>"
+
+def _option_list(connector:smtp.SMTP,options:list[str])->str:
+    if options and connector.does_esmtp:
+        return ' ' + ' '.join(options)
+    return ''
+
+def _abort_transaction(connector:smtp.SMTP,data_code:int):
+    if data_code == 354:
+        # NOTE the server accepted the DATA command of the pipelined group and reads every line as the message, ending it
+        # or sending RSET would commit it: the session is dropped, the pool discards the connection on its next check
+        connector.close()
+        return
+    connector.rset()
+
+def pipelined_sendmail(connector:smtp.SMTP,from_addr:str,to_addrs:str|list[str],data:bytes,mail_options:list[str]=[],rcpt_options:list[str]=[])->dict[str,tuple[int,bytes]]:
+    """
+    Send a message already encoded for the DATA command (CRLF line endings and dot-stuffing) over an open session.
+    When the server supports PIPELINING, MAIL FROM, every RCPT TO and DATA are written in a single round trip.
+    Raise and return the same values as `smtplib.SMTP.sendmail`.
+    """
+    connector.ehlo_or_helo_if_needed()
+    if isinstance(to_addrs,str):
+        to_addrs = [to_addrs]
+
+    if not connector.has_extn('pipelining'):
+        # NOTE sendmail would dot-stuff the message a second time
+        return _sequential_sendmail(connector,from_addr,to_addrs,data,mail_options,rcpt_options)
+
+    esmtp_opts = list(mail_options)
+    if connector.does_esmtp and connector.has_extn('size'):
+        esmtp_opts.append(f"size={len(data)}")
+
+    commands = [f"mail FROM:{_quoteaddr(from_addr)}{_option_list(connector,esmtp_opts)}"]
+    commands.extend(f"rcpt TO:{_quoteaddr(to)}{_option_list(connector,rcpt_options)}" for to in to_addrs)
+    commands.append('data')
+    connector.send(''.join(f"{command}\r\n" for command in commands))
+
+    mail_code,mail_resp = connector.getreply()
+    rcpt_replies = [connector.getreply() for _ in to_addrs]
+    data_code,data_resp = connector.getreply()
+
+    if mail_code != 250:
+        _abort_transaction(connector,data_code)
+        raise smtp.SMTPSenderRefused(mail_code,mail_resp,from_addr)
+
+    senderrs = {to:(code,resp) for to,(code,resp) in zip(to_addrs,rcpt_replies) if code not in (250,251)}
+    if len(senderrs) == len(to_addrs):
+        _abort_transaction(connector,data_code)
+        raise smtp.SMTPRecipientsRefused(senderrs)
+
+    if data_code != 354:
+        connector.rset()
+        raise smtp.SMTPDataError(data_code,data_resp)
+
+    return _send_data(connector,data,senderrs)
+
+def _sequential_sendmail(connector:smtp.SMTP,from_addr:str,to_addrs:list[str],data:bytes,mail_options:list[str],rcpt_options:list[str]):
+    esmtp_opts = list(mail_options)
+    if connector.does_esmtp and connector.has_extn('size'):
+        esmtp_opts.append(f"size={len(data)}")
+
+    code,resp = connector.mail(from_addr,esmtp_opts)
+    if code != 250:
+        connector.rset()
+        raise smtp.SMTPSenderRefused(code,resp,from_addr)
+
+    senderrs = {}
+    for to in to_addrs:
+        code,resp = connector.rcpt(to,rcpt_options)
+        if code not in (250,251):
+            senderrs[to] = (code,resp)
+    if len(senderrs) == len(to_addrs):
+        connector.rset()
+        raise smtp.SMTPRecipientsRefused(senderrs)
+
+    code,resp = connector.docmd('data')
+    if code != 354:
+        connector.rset()
+        raise smtp.SMTPDataError(code,resp)
+    return _send_data(connector,data,senderrs)
+
+def _send_data(connector:smtp.SMTP,data:bytes,senderrs:dict):
+    if data[-2:] != b'\r\n':
+        data += b'\r\n'
+    connector.send(data + b'.\r\n')
+    code,resp = connector.getreply()
+    if code != 250:
+        if code == 421:
+            connector.close()
+        else:
+            connector.rset()
+        raise smtp.SMTPDataError(code,resp)
+    return senderrs
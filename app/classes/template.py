@@ -1,11 +1,14 @@
 from enum import Enum
+import hashlib
+import marshal
+from threading import Lock
 from typing import Any, Self, overload
 from aiohttp_retry import Callable
 from bs4 import BeautifulSoup, PageElement, Tag, element
 from app.definition._error import BaseError
 from app.classes.schema import MLSchemaBuilder
 from app.utils.constant import HTMLTemplateConstant
-from app.utils.helper import strict_parseToBool, flatten_dict
+from app.utils.helper import generateId, strict_parseToBool, flatten_dict
 from app.utils.tools import Time
 from app.utils.validation import CustomValidator
 # import fitz as pdf
@@ -14,7 +17,9 @@ import os
 import re
 from app.utils.prettyprint import printJSON
 from cerberus import schema_registry
-from jinja2 import Environment, Template as JJ2Template
+from jinja2 import Environment, Template as JJ2Template, pass_context
+from jinja2.runtime import Context
+from cachetools import LRUCache
 from app.utils.transformer import transform,coerce
 
 
@@ -86,6 +91,111 @@ class TemplateCreationError(BaseError):
     ...
 # ============================================================================================================
 
+COMPILED_SIZE_FACTOR = 4
+"""
+Rough ratio between the size of a template source and the memory held by its compiled `jinja2.Template`
+"""
+
+def content_hash(content:str|None)->str|None:
+    if content is None:
+        return None
+    return hashlib.blake2b(content.encode(),digest_size=16).hexdigest()
+
+URL_PATTERN = re.compile(r'https?://[^\s"<>()]+')
+"""
+Urls rewritten by the `sub_url` filter
+"""
+
+@pass_context
+def _sub_url(context:Context,value):
+    re_replace = context.get(HTMLTemplateConstant._sub_url,None)
+    if re_replace is None:
+        return value
+    return re_replace(value)
+
+class CompiledTemplateCache:
+    """
+    The `CompiledTemplateCache` class holds the compiled `jinja2.Template` of every `MLTemplate` keyed by the hash
+    of its content, so the lexer/parser/compiler only runs once per template version. The cache is bounded by an
+    approximate memory size (in bytes) and shared by every template of the process.
+    """
+
+    def __init__(self,max_memory:int=64*1024*1024):
+        self.env = Environment()
+        self.env.filters.update(transform)
+        self.env.filters.update(coerce)
+        self.env.filters['sub_url'] = _sub_url
+
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.resize(max_memory)
+
+    @staticmethod
+    def _sizeof(entry:tuple[JJ2Template,int])->int:
+        return entry[1]
+
+    def resize(self,max_memory:int):
+        with self._lock:
+            self.max_memory = max_memory
+            self._cache:LRUCache[str,tuple[JJ2Template,int]] = LRUCache(max_memory,getsizeof=self._sizeof)
+
+    def get(self,key:str,source:str,globals:dict=None,code:bytes=None)->JJ2Template:
+        """
+        Return the compiled template of `source`, compiling and storing it on a miss. With the marshalled `code` of
+        `compile_code`, a miss skips the lexer/parser/compiler.
+        """
+        with self._lock:
+            entry = self._cache.get(key,None)
+            if entry is not None:
+                self.hits+=1
+                return entry[0]
+            self.misses+=1
+
+        if code is not None:
+            template = self.env.template_class.from_code(self.env,marshal.loads(code),self.env.make_globals(globals),None)
+        else:
+            template = self.env.from_string(source,globals=globals)
+        size = len(source)*COMPILED_SIZE_FACTOR
+        if size > self.max_memory:
+            return template
+
+        with self._lock:
+            self._cache[key] = (template,size)
+        return template
+
+    def compile_code(self,source:str)->bytes:
+        return marshal.dumps(self.env.compile(source))
+
+    def invalidate(self,key:str|None):
+        if key is None:
+            return
+        with self._lock:
+            self._cache.pop(key,None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits':self.hits,
+                'misses':self.misses,
+                'hit_ratio':self.hits/total if total else 0.0,
+                'entries':len(self._cache),
+                'memory':self._cache.currsize,
+                'max_memory':self.max_memory,
+            }
+
+TemplateCache = CompiledTemplateCache()
+
+# ============================================================================================================
+
 
 class Asset():
     def __init__(self, filename: str, content: str, dirName: str,size:int=0) -> None:
@@ -168,9 +278,20 @@ class Template(Asset):
 
 
 
+def register_schema(registry_key:str,schema:dict):
+    _hash = hash(schema)
+    if _hash not in MLSchemaBuilder.CurrentHashRegistry.keys():
+        MLSchemaBuilder.CurrentHashRegistry[_hash] = registry_key
+        schema_registry.add(registry_key, schema)
+    else:
+        MLSchemaBuilder.HashSchemaRegistry[registry_key] = MLSchemaBuilder.CurrentHashRegistry[_hash]
+
+
 class MLTemplate(Template):
     _globals = {}
 
+    ARTIFACT_EXCLUDED = ('bs4','validation_balise','translator','_code')
+
     DefaultValidatorConstructorParamValues = {
         "require_all": True,
         "ignore_none_values": False,
@@ -180,35 +301,73 @@ class MLTemplate(Template):
     }
 
     def __init__(self, filename: str, content: str, dirName: str,extension:str,validation_selector:str,size:int=0) -> None:
-        self.content_to_inject = None
+        self._content_to_inject = None
+        self.content_hash = None
         self.extension = extension
         self.validation_selector = validation_selector
         super().__init__(filename, content, dirName,size)
         self.ignore = self.filename.endswith(f".registry.{self.extension}")
         self.parser:str = None
 
+    @property
+    def content_to_inject(self)->str|None:
+        return self._content_to_inject
+
+    @content_to_inject.setter
+    def content_to_inject(self,content:str|None):
+        TemplateCache.invalidate(getattr(self,'content_hash',None))
+        self.__dict__.pop('_code',None)
+        self._content_to_inject = content
+        self.content_hash = content_hash(content)
+
     def _built_template(self,content):
         ...
     
+    def compiled(self)->JJ2Template:
+        content_html = str(self.content_to_inject)
+        return TemplateCache.get(self.content_hash,content_html,self._globals,getattr(self,'_code',None))
+
+    def __getattr__(self,name:str):
+        # NOTE a template restored from an artifact parses its tree on the first access only
+        if name != 'bs4' or 'parser' not in self.__dict__:
+            raise AttributeError(name)
+        self.bs4 = BeautifulSoup(self._bs4_source(),self.parser)
+        return self.bs4
+
+    def _bs4_source(self)->str:
+        return self.content
+
+    def to_artifact(self)->dict:
+        """
+        Export the state of the loaded template, with the compiled module of its jinja source, so `from_artifact` can
+        rebuild it without parsing the template again
+        """
+        state = {key:value for key,value in self.__dict__.items() if key not in self.ARTIFACT_EXCLUDED}
+        return {
+            'state':state,
+            'registry':getattr(self,'schema_registry',[]),
+            'code':TemplateCache.compile_code(str(self.content_to_inject)),
+        }
+
+    @classmethod
+    def from_artifact(cls,artifact:dict)->Self:
+        template = cls.__new__(cls)
+        template.__dict__.update(artifact['state'])
+        template.translator = ...
+        template._code = artifact['code']
+        for registry_key,schema in artifact['registry']:
+            register_schema(registry_key,schema)
+        return template
 
     def inject(self, data:dict, re_replace:Callable[[str],str]=None):
         #return super().inject(data, re_replace)
-        env = Environment()
-        
-        env.filters['sub_url'] = lambda v:v if re_replace == None else re_replace 
         # for t in self.transform.values():
         #     if t not in transform:
         #         raise TemplateInjectError()
         #     env.filters[t] = transform[t]
-        env.filters.update(transform)
-        env.filters.update(coerce)
-
-        env.globals.update(self._globals)
-
-        content_html = str(self.content_to_inject)
         try:
-            template = env.from_string(content_html)
-            template = template.render(**data)
+            template = self.compiled()
+            template = template.render(**data,**{HTMLTemplateConstant._sub_url:re_replace})
             return self._built_template(template)
         except Exception as e:
             raise TemplateBuildError()
@@ -267,18 +426,15 @@ class MLTemplate(Template):
 
     def extractExtraSchemaRegistry(self):
 
+        self.schema_registry:list[tuple[str,dict]] = []
         if self.validation_balise is None:
             return
         for registry in self.validation_balise.find_all(VALIDATION_REGISTRY_SELECTOR, recursive=False):
             registry: Tag = registry
             registry_key = registry.attrs["id"]
             schema = MLSchemaBuilder(registry).schema
-            _hash = hash(schema)
-            if _hash not in MLSchemaBuilder.CurrentHashRegistry.keys():
-                MLSchemaBuilder.CurrentHashRegistry[_hash] = registry_key
-                schema_registry.add(registry_key, schema)
-            else:
-                MLSchemaBuilder.HashSchemaRegistry[registry_key] = MLSchemaBuilder.CurrentHashRegistry[_hash]
+            register_schema(registry_key,schema)
+            self.schema_registry.append((registry_key,schema))
 
     def extractValidation(self,):
         try:
@@ -374,6 +530,9 @@ class HTMLTemplate(MLTemplate):
         super().load()
         self.extractImageKey()
     
+    def _bs4_source(self)->str:
+        return self.content_to_inject
+
     def loadImage(self, image_path, imageContent: str):
         if image_path in self.image_needed:
             self.images.append((image_path, imageContent))
@@ -381,8 +540,7 @@ class HTMLTemplate(MLTemplate):
     def set_content(self,):
         super().set_content("html5")
 
-    def build(self,data:dict,target_lang=None,re_replace=None,validate=False,bs4=False,tracking_url=None,signature=None):
-
+    def _build_data(self,data:dict,target_lang=None,validate=False,tracking_url=None,signature=None):
         if len(HTMLTemplateConstant.values.intersection(data.keys())) > 0: 
             raise TemplateInjectError("Data contains reserved keys: {}".format(HTMLTemplateConstant.values))
         
@@ -394,7 +552,12 @@ class HTMLTemplate(MLTemplate):
 
         if signature:
             data[HTMLTemplateConstant._signature] = signature[1]
+        
+        return data
 
+    def build(self,data:dict,target_lang=None,re_replace=None,validate=False,bs4=False,tracking_url=None,signature=None):
+
+        data = self._build_data(data,target_lang,validate,tracking_url,signature)
         content_html, content_text = self.inject(data,re_replace=re_replace)
         if not target_lang or target_lang == Template.LANG:
             if bs4:
@@ -406,6 +569,30 @@ class HTMLTemplate(MLTemplate):
         content_text = self.translate(target_lang, content_text)
         return True, (content_html, content_text)
     
+    def prepare(self,data:dict,target_lang=None,validate=False,bs4=False,signature=None,slot_keys:list[str]=[])->'PreparedTemplate':
+        """
+        First phase of the per-recipient render: render and parse the shared body once, leaving a slot for the tracking pixel,
+        every url passed through the `sub_url` filter and every key of `slot_keys`. The slot keys must be rendered verbatim
+        by the template since the value injected is a marker. Call `PreparedTemplate.build` to splice each recipient values.
+        """
+        nonce = generateId(8)
+        links:list[str] = []
+
+        def _slot(match:re.Match):
+            url = match.group(0)
+            if url not in links:
+                links.append(url)
+            return PreparedTemplate.marker(nonce,f'{LINK_SLOT}{links.index(url)}')
+
+        def link_slot(content:str):
+            if content == None:
+                return None
+            return URL_PATTERN.sub(_slot,content)
+
+        data = {**data,**{key:PreparedTemplate.marker(nonce,f'{KEY_SLOT}{i}') for i,key in enumerate(slot_keys)}}
+        _,(content_html,content_text) = self.build(data,target_lang,link_slot,validate,bs4,PreparedTemplate.marker(nonce,PIXEL_SLOT),signature)
+        return PreparedTemplate(nonce,str(content_html),content_text,links,slot_keys)
+
     def _built_template(self,content):
         content_text = self.exportText(content)
         return content, content_text
@@ -475,6 +662,65 @@ class HTMLTemplate(MLTemplate):
         return str(body)
     
 
+PIXEL_SLOT = 'p'
+LINK_SLOT = 'l'
+KEY_SLOT = 'k'
+
+class PreparedTemplate:
+    """
+    The shared body of an `HTMLTemplate` rendered once and cut at the offsets of the per-recipient slots,
+    so each recipient only costs a string join instead of a full render and parse.
+    """
+
+    def __init__(self,nonce:str,content_html:str,content_text:str,links:list[str],slot_keys:list[str]):
+        self.links = links
+        self.slot_keys = slot_keys
+        self.pattern = re.compile(PreparedTemplate.marker(nonce,r'(\w+)'))
+        self.html = self._cut(content_html)
+        self.text = self._cut(content_text)
+
+    @staticmethod
+    def marker(nonce:str,slot:str):
+        return f"@@ntfr-slot-{nonce}-{slot}@@"
+
+    def _cut(self,content:str)->tuple[list[str],list[str],list[int]]:
+        segments:list[str] = []
+        slots:list[str] = []
+        offsets:list[int] = []
+        cursor = 0
+        for match in self.pattern.finditer(content):
+            segments.append(content[cursor:match.start()])
+            slots.append(match.group(1))
+            offsets.append(match.start())
+            cursor = match.end()
+        segments.append(content[cursor:])
+        return segments,slots,offsets
+
+    @staticmethod
+    def _splice(parts:tuple[list[str],list[str],list[int]],values:dict[str,str]):
+        segments,slots,_ = parts
+        if not slots:
+            return segments[0]
+        
+        buffer = [segments[0]]
+        for slot,segment in zip(slots,segments[1:]):
+            buffer.append(values.get(slot,''))
+            buffer.append(segment)
+        return ''.join(buffer)
+
+    def build(self,tracking_url:str=None,links:list[str]=None,slot_data:dict[str,Any]={}):
+        """
+        Second phase: splice the recipient values into the shared body. `links` must be aligned with `self.links`
+        """
+        values = {PIXEL_SLOT:tracking_url or ''}
+        for i,url in enumerate(self.links):
+            values[f'{LINK_SLOT}{i}'] = url if links is None else links[i]
+        for i,key in enumerate(self.slot_keys):
+            values[f'{KEY_SLOT}{i}'] = str(slot_data.get(key,''))
+
+        return True,(self._splice(self.html,values),self._splice(self.text,values))
+    
+
 class PDFTemplate(Template):
     def __init__(self, filename: str, dirName: str,size=0) -> None:
         super().__init__(filename, None, dirName,size)
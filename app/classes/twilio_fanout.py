@@ -0,0 +1,106 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+import aiohttp
+from aiohttp import ClientSession, TCPConnector
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+
+# NOTE creating a message or a call is not idempotent, a retry could send it twice: only the failures where
+# twilio did not take the request are retried. A 429 or a 503 is rejected before any processing, and a connector error
+# or a connect timeout is raised before the request is written. A timeout or a disconnection after the request was sent
+# and the other 5xx leave the outcome unknown, so they are not retried.
+RETRYABLE_STATUS = (429,503)
+
+def is_retryable(error:BaseException)->bool:
+    if isinstance(error,TwilioRestException):
+        return error.status in RETRYABLE_STATUS
+    return isinstance(error,(aiohttp.ClientConnectorError,aiohttp.ConnectionTimeoutError))
+
+
+class KeepAliveTwilioHttpClient(AsyncTwilioHttpClient):
+    """
+    The session is created on the first request, inside the event loop, with a connector sized for the fan-out
+    of the account, so the requests of every send reuse the same kept-alive connections.
+    """
+
+    def __init__(self,limit:int=10,keepalive_timeout:float=30,timeout:float|None=None):
+        super().__init__(pool_connections=False,timeout=timeout)
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+
+    async def request(self,*args,**kwargs):
+        if self.session == None or self.session.closed:
+            self.session = ClientSession(connector=TCPConnector(limit=self.limit,keepalive_timeout=self.keepalive_timeout))
+        return await super().request(*args,**kwargs)
+
+
+class TokenBucket:
+
+    def __init__(self,rate:float,burst:float|None=None):
+        self.rate = rate
+        self.capacity = burst if burst != None else max(rate,1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class FanOutResult:
+    index:int
+    to:str
+    date:str
+    result:Any = None
+    error:BaseException|None = None
+    attempts:int = 0
+
+
+class TwilioFanOut:
+    """
+    Send one request per recipient with at most `concurrency` requests in flight for the account, paced by a token bucket
+    at `rate` requests per second. A failure where the request was not taken by twilio (see `is_retryable`) is retried `max_retries` times
+    with a full jitter exponential backoff, every other error fails the recipient right away. The limits are shared by every send of the account.
+    """
+
+    def __init__(self,concurrency:int=10,rate:float=10,max_retries:int=3,backoff:float=0.5,max_backoff:float=8):
+        self.semaphore = asyncio.Semaphore(max(concurrency,1))
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    async def _send(self,index:int,to:str,send:Callable[[int,str],Awaitable[Any]])->FanOutResult:
+        attempts = 0
+        while True:
+            attempts += 1
+            async with self.semaphore:
+                await self.bucket.acquire()
+                date = datetime.now(timezone.utc).isoformat()
+                try:
+                    return FanOutResult(index,to,date,await send(index,to),None,attempts)
+                except Exception as e:
+                    if attempts > self.max_retries or not is_retryable(e):
+                        return FanOutResult(index,to,date,None,e,attempts)
+
+            await asyncio.sleep(random.uniform(0,min(self.max_backoff,self.backoff * 2 ** (attempts - 1))))
+
+    async def run(self,recipients:list[str],send:Callable[[int,str],Awaitable[Any]])->list[FanOutResult]:
+        return await asyncio.gather(*(self._send(i,to,send) for i,to in enumerate(recipients)))
@@ -0,0 +1,109 @@
+from threading import Lock
+from typing import NamedTuple
+from cachetools import LRUCache
+from device_detector import DeviceDetector
+
+UNKNOWN = 'unknown'
+
+
+class UserAgentInfo(NamedTuple):
+    device_type:str
+    os:str
+    browser:str
+    is_bot:bool
+
+
+UNKNOWN_USER_AGENT = UserAgentInfo(UNKNOWN,UNKNOWN,UNKNOWN,False)
+
+
+def parse_user_agent(user_agent:str)->UserAgentInfo:
+    dd = DeviceDetector(user_agent).parse()
+    return UserAgentInfo(
+        device_type=dd.device_type().strip() or UNKNOWN,
+        os=dd.os_name().strip() or UNKNOWN,
+        browser=dd.client_name().strip() or UNKNOWN,
+        is_bot=dd.is_bot(),
+    )
+
+
+class UserAgentCache:
+    """
+    The `UserAgentCache` class keeps the result of `DeviceDetector` per user agent, since the regex battery is the main cost
+    of the event ingestion while the number of distinct user agents stays small.
+
+    The `top_n` most looked up user agents are pinned in a plain dict every `promote_every` lookups, so a burst of rare
+    user agents can not evict them from the LRU.
+    """
+
+    def __init__(self,maxsize:int=10000,top_n:int=100,promote_every:int=10000):
+        self.maxsize = maxsize
+        self.top_n = top_n
+        self.promote_every = promote_every
+
+        self._cache:LRUCache[str,list] = LRUCache(maxsize)
+        self._pinned:dict[str,UserAgentInfo] = {}
+        self._lock = Lock()
+        self._lookups = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self,user_agent:str|None)->UserAgentInfo:
+        if not user_agent:
+            return UNKNOWN_USER_AGENT
+
+        info = self._pinned.get(user_agent,None)
+        if info != None:
+            self.hits+=1
+            return info
+
+        with self._lock:
+            entry = self._cache.get(user_agent,None)
+            if entry != None:
+                entry[1]+=1
+                self.hits+=1
+                self._tick()
+                return entry[0]
+
+        info = parse_user_agent(user_agent)
+        with self._lock:
+            self._cache[user_agent] = [info,1]
+            self.misses+=1
+            self._tick()
+        return info
+
+    def _tick(self):
+        self._lookups+=1
+        if self.top_n <= 0 or self._lookups < self.promote_every:
+            return
+        self._lookups = 0
+
+        ranked = sorted(self._cache.items(),key=lambda item:item[1][1],reverse=True)[:self.top_n]
+        self._pinned = {user_agent:entry[0] for user_agent,entry in ranked}
+        for entry in self._cache.values():
+            # NOTE age the counts so the pinned set follows the recent traffic
+            entry[1] //= 2
+
+    def clear(self):
+        """
+        Drop the parsed user agents, `hits` and `misses` are totals since the start of the process and keep counting
+        """
+        with self._lock:
+            self._cache.clear()
+            self._pinned = {}
+            self._lookups = 0
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits':self.hits,
+            'misses':self.misses,
+            'hit_ratio':self.hits/total if total else 0,
+            'size':len(self._cache),
+            'pinned':len(self._pinned),
+            'maxsize':self.maxsize,
+        }
+
+
+UserAgentParser = UserAgentCache()
@@ -198,6 +198,19 @@ class TransitVaultEngine(VaultEngine):
             return b64_decode(encoded_response)
         return decrypted_response
 
+    def decrypt_batch(self, ciphertexts: list[str], key: VaultConstant.NotifyrTransitKeyType) -> list[str]:
+        """Decrypts every ciphertext in a single transit call, the plaintexts are returned in the same order."""
+        decrypted_response = self.client.secrets.transit.decrypt_data(
+            name=key,
+            batch_input=[{'ciphertext':ciphertext} for ciphertext in ciphertexts],
+            mount_point=self.mount_point
+        )
+        results = decrypted_response['data']['batch_results']
+        for result in results:
+            if 'error' in result:
+                raise VaultError(result['error'])
+        return [b64_decode(result['plaintext']) for result in results]
+
     def sign(self, input_data: str, key: VaultConstant.NotifyrTransitKeyType, algorithm: str = "sha2-256",signature_only:bool=True) -> str:
         """Signs the given input using Vault transit engine."""
         encoded_input = b64_encode(input_data)
@@ -239,10 +239,12 @@ async def process_website_crawling(ctx:dict[str,Any],vector_config:VectorConfig|
                 if not result.chunks:
                     continue
 
-                for chunk in result.chunks:
-                    if vector_config != None:
-                        chunk.vector = await qdrantService.embed_query(chunk.payload['text'])
+                if vector_config != None:
+                    vectors = await qdrantService.embed_texts([chunk.payload['text'] for chunk in result.chunks])
+                    for chunk,vector in zip(result.chunks,vectors):
+                        chunk.vector = vector
 
+                for chunk in result.chunks:
                     if graph_config != None:
                         await graphitiService.add_chunk_episode(
                             chunk,
@@ -341,7 +343,7 @@ async def process_research_task(ctx:dict[str,Any],vector_config:VectorConfig|Non
     markdownResearch: MarkdownCostDefinition = ctx[RESEARCH_MARKDOWN_KEY]
 
     researcher =  ResearchIngestion(
-        researchTask=ResearchDataIngestModel(lang=lang,vector_config=vector_config,graph_config=graph_config,lang=lang,name=uri,**slice_dict(kwargs,['subject'],'exclude')),
+        researchTask=ResearchDataIngestModel(lang=lang,vector_config=vector_config,graph_config=graph_config,name=uri,**slice_dict(kwargs,['subject'],'exclude')),
         research_llm_config=researchLLMProvider.crawl_llm,
         crawl_llm_config=crawlLLMProvider.crawl_llm,
         base_dir=f"{configService.DATA_INGESTION_DIR}crawl4ai/",
@@ -1,6 +1,7 @@
 from typing import Any, List, Literal, Type
 from app.classes.auth_permission import AuthPermission, PolicyModel, RefreshPermission
 from app.classes.cost_definition import CreditNotInPlanError
+from app.classes.phone_lookup import is_unknown_number
 from app.classes.mongo import BaseDocument
 from app.definition._error import ServerFileError
 from app.definition._utils_decorator import Guard
@@ -177,39 +178,56 @@ if CAPABILITIES['twilio']:
         def __init__(self,accept_landline:bool,accept_voip:bool=False,accept_unknown:bool=False,):
             super().__init__()
             self.twilioService:TwilioService = Get(TwilioService)
+            self.configService:ConfigService = Get(ConfigService)
             self.accept_voip = accept_voip
             self.accept_unknown = accept_unknown
             self.accept_landline = accept_landline
         
         async def guard(self,otpModel:OTPModel=None,contact:ContactORM=None,scheduler:SchedulerModel=None):
-            return True
+            if not self.configService.CARRIER_GUARD_FLAG:
+                return True,''
+
             if otpModel != None:
-                phone_number = [[otpModel.to]]
+                phone_numbers = [otpModel.to]
             elif contact != None:
-                phone_number = [[contact.phone]]
+                phone_numbers = [contact.phone]
             else:
+                # NOTE the contact ids are resolved by the pipes, only the raw numbers are known here
+                phone_numbers = [to for content in scheduler.content if getattr(content,'sender_type','raw') == 'raw' for to in content.to]
+
+            if not phone_numbers:
+                return True,''
+
+            try:
+                results = await self.twilioService.phone_lookup_many(phone_numbers,True)
+            except Exception as e:
+                # NOTE fail open: a lookup outage must not block the sends, the carrier of the numbers is not checked
+                print(f'[CarrierTypeGuard] Lookup failed with {e.__class__.__name__}: {e}, the carrier is not checked')
+                return True,''
+
+            for pn,(status_code,data) in results.items():
+                if status_code != 200 and not is_unknown_number(status_code):
+                    # NOTE fail open: a lookup outage must not block the sends, the carrier of the number is not checked
+                    print(f'[CarrierTypeGuard] Lookup of {pn} failed with {status_code}, the carrier is not checked')
+                    continue
+
+                if status_code != 200:
+                    return False,f'Callee Information not found: {pn}'
+                
+                carrier:dict= data.get('carrier',None)
+                if carrier == None:
+                    return False,f'Carrier Information not found: {pn}'
 
-                phone_number = [[to for to in content.to] for content in scheduler.content]
-            for _phone_number in phone_number:
-                for pn in _phone_number:
-                    status_code,data = await self.twilioService.phone_lookup(phone_number,True)
-                    if status_code != 200:
-                        return False,f'Callee Information not found: {pn}'
+                carrier_type = carrier.get('type','unknown')
+                if carrier_type ==None:
+                    carrier_type = 'unknown'
                     
-                    carrier:dict= data.get('carrier',None)
-                    if carrier == None:
-                        return False,f'Carrier Information not found: {pn}'
-
-                    carrier_type = carrier.get('type','unknown')
-                    if carrier_type ==None:
-                        carrier_type = 'unknown'
-                        
-                    if carrier_type == 'voip' and not self.accept_voip:
-                        return False,f'Carrier Type is Voip: {pn}'
-                    if carrier_type == 'landline' and not self.accept_landline:
-                        return False,f'Carrier Type is Landline: {pn}'
-                    if carrier_type == 'unknown' and not self.accept_unknown:
-                        return False,f'Carrier Type is Unknown: {pn}'
+                if carrier_type == 'voip' and not self.accept_voip:
+                    return False,f'Carrier Type is Voip: {pn}'
+                if carrier_type == 'landline' and not self.accept_landline:
+                    return False,f'Carrier Type is Landline: {pn}'
+                if carrier_type == 'unknown' and not self.accept_unknown:
+                    return False,f'Carrier Type is Unknown: {pn}'
                     
             return True,''
 
@@ -23,7 +23,8 @@ class RegisterBackgroundTaskInterceptor(Interceptor):
     def intercept_before(self):
         ...
 
-    def intercept_after(self, result:Any,taskManager:TaskManager):
+    async def intercept_after(self, result:Any,taskManager:TaskManager):
+        await taskManager.flush_worker_batch()
         taskManager.register_backgroundTask()
 
 class KeepAliveResponseInterceptor(Interceptor):
@@ -122,6 +123,11 @@ class TaskCostInterceptor(Interceptor):
         cost.reset_bill()
 
     async def intercept_after(self, result:Any,cost:SimpleTaskCost,broker:Broker,response:Response,taskManager:TaskManager):
+        # NOTE the batched worker tasks are published before the bill is settled, the ones that failed are refunded
+        failed = await taskManager.flush_worker_batch()
+        if failed > 0 and taskManager.task_result:
+            cost.refund('unpublished_task',cost.last_total*failed//len(taskManager.task_result))
+
         bill = cost.generate_bill()
         if bill['total'] != 0:
             await self.costService.refund_credits(cost.credit_key,bill)
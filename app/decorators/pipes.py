@@ -507,17 +507,37 @@ async def force_task_manager_attributes_pipe(taskManager:TaskManager):
 
 class ContactToInfoPipe(Pipe,PointerIterator):
 
-    def __init__(self,info_key:str,parse_key:str,callback:Callable=None,split:str='.' ):
+    def __init__(self,info_key:str,parse_key:str,callback:Callable=None,split:str='.',chunk_size:int=500):
         super().__init__(True)
         self.info_key= info_key
         self.callback = callback
+        self.chunk_size = chunk_size
         PointerIterator.__init__(self,parse_key,split=split)
     
     async def get_info_key(self,val,filter_error):
         contact:ContactSummary = await ContactSummaryORMCache.Cache(val,val)
+        return self._parse_info_key(val,contact,filter_error)
+
+    async def get_info_keys(self,contact_ids:list[str],filter_error)->tuple[list[str],list[str]]:
+        """
+        Resolve the info key of many contacts with one MGET on the summary cache and one query for the misses.
+        Returns the info keys found and the contact ids that could not be resolved.
+        """
+        contacts:dict[str,ContactSummary] = await ContactSummaryORMCache.CacheBulk(contact_ids)
+        infos = []
+        errors = []
+        for contact_id in contact_ids:
+            info = self._parse_info_key(contact_id,contacts.get(contact_id,None),filter_error)
+            if info == None:
+                errors.append(contact_id)
+                continue
+            infos.append(info)
+        return infos,errors
+
+    def _parse_info_key(self,contact_id:str,contact:ContactSummary|None,filter_error):
         if contact == None:
             if not filter_error:
-                raise ContactNotExistsError(val)
+                raise ContactNotExistsError(contact_id)
             else:
                 return None
         piped_info_key = contact.get(self.info_key,None)
@@ -528,6 +548,32 @@ class ContactToInfoPipe(Pipe,PointerIterator):
                 return None
         else:
             return piped_info_key
+
+    async def iter_subscribers(self,content_id:str):
+        """
+        Yield the contact ids subscribed to a content by chunks of `chunk_size`, paginating on the primary key
+        so the subscriptions are never loaded all at once.
+        """
+        last_subs_id = None
+        while True:
+            query = SubscriptionORM.filter(content_id=content_id)
+            if last_subs_id != None:
+                query = query.filter(subs_id__gt=last_subs_id)
+            rows = await query.order_by('subs_id').limit(self.chunk_size).values_list('subs_id','contact_id')
+            if not rows:
+                return
+
+            last_subs_id = rows[-1][0]
+            yield [str(contact_id) for _,contact_id in rows]
+            if len(rows) < self.chunk_size:
+                return
+
+    def _set_error(self,scheduler:SchedulerModel,index,contact_id):
+        scheduler._errors[index] = {
+            'message':'Could not get info for the contact, might not exists or might not have set the needed info',
+            'index':index,
+            'key':contact_id
+        }
     
     async def pipe(self,scheduler:SchedulerModel):
         
@@ -548,52 +594,41 @@ class ContactToInfoPipe(Pipe,PointerIterator):
             index = getattr(ptr,'index')  
             
             if getattr(ptr, 'sender_type', 'raw') == 'subs':
-                subscriptions = await SubscriptionORM.filter(content_id=val).select_related('contact')
-                contact_ids = [subscription.contact.contact_id for subscription in subscriptions if subscription.contact]
-                if not contact_ids:
+                content_id = val
+                contact_id = []
+                val = []
+                errors = []
+                async for contact_ids in self.iter_subscribers(content_id):
+                    infos,missing = await self.get_info_keys(contact_ids,scheduler.filter_error)
+                    contact_id.extend(contact_ids)
+                    val.extend(infos)
+                    errors.extend(missing)
+
+                if not contact_id:
                     scheduler._errors[index] = {
                         'message':'No contact associated with this content subscriptions',
                         'index':index,
-                        'key':val
+                        'key':content_id
                     }
                     continue
-                val = contact_ids
                 setattr(ptr, 'sender_type', 'raw')
-            
-            if val== None:
-                ...
 
-            if isinstance(val,str):
+                if errors:
+                    self._set_error(scheduler,index,contact_id)
+            
+            elif isinstance(val,str):
                 contact_id = val
                 val = await self.get_info_key(val,scheduler.filter_error)
                 if val == None:
                     if scheduler.filter_error:
-                        scheduler._errors[index] = {
-                            'message':'Could not get info for the contact, might not exists or might not have set the needed info',
-                            'index':index,
-                            'key':contact_id
-                        }
+                        self._set_error(scheduler,index,contact_id)
                     continue
             
             elif isinstance(val,list):
                 contact_id = val
-                temp = []
-                errors= []
-                for v in val:
-                    t = await self.get_info_key(v,scheduler.filter_error)
-                    if t ==None:
-                        if scheduler.filter_error:
-                            errors.append(v)
-                        continue
-                    temp.append(t)
-                val = temp
-
+                val,errors = await self.get_info_keys(val,scheduler.filter_error)
                 if errors:
-                    scheduler._errors[index] ={
-                        'message':'Could not get info for the contact, might not exists or might not have set the needed info',
-                        'index':index,
-                        'key':contact_id
-                    }
+                    self._set_error(scheduler,index,contact_id)
 
             else:
                 contact_id = None
@@ -1,11 +1,10 @@
-import functools
+import re
 from typing import Callable, Literal
 from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, DispatchFunction
-from starlette.datastructures import MutableHeaders,Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
 from enum import Enum
 import asyncio
-from fnmatch import fnmatch
+from fnmatch import translate
 
 
 METHODS = Literal['GET','POST','PATCH','PUT','DELETE','HEAD','OPTION']
@@ -20,31 +19,14 @@ class MiddlewarePriority(Enum):
     LIMITER = 6
     USER_APP = 7
     CHALLENGE = 8
-    
 
-class MiddleWare(BaseHTTPMiddleware):
 
-    def __init_subclass__(cls: type) -> None:
-        MIDDLEWARE[cls.__name__] = cls
-        #setattr(cls,'priority',None)
-
-    async def dispatch(self, request:Request, call_next:Callable[[Request],Response]):
-        return await call_next(request)
-
-def path_matcher(paths: list[str], url: str) -> bool:
-    if not paths:
-        return True
-    return any(fnmatch(url, pattern) for pattern in paths)
+RULES_ATTR = '__middleware_rules__'
+BYPASS_ATTR = '__middleware_bypass__'
+OPTIONS_ATTR = '__middleware_options__'
 
-def exclude_path_matcher(paths: list[str], url: str) -> bool:
-    if not paths:
-        return True
-    return not any(fnmatch(url, pattern) for pattern in paths)
+Rule = tuple[Literal['apply','exclude'],list[str],list[str]]
 
-def get_url(request:Request):
-    base_url = str(request.base_url)
-    url = str(request.url).replace(base_url,"")
-    return "/" + url
 
 def parse_urls(paths:list[str]):
     temp = []
@@ -56,88 +38,124 @@ def parse_urls(paths:list[str]):
             path = path[0:-2] + "*"
         temp.append(path)
     return temp
-            
 
-def ApplyOn(paths:list[str]=['/*'],methods:list[METHODS]=[],bypass:bool = False):
-    paths = parse_urls(paths)
+def compile_paths(paths:list[str])->re.Pattern|None:
+    if not paths:
+        return None
+    return re.compile('|'.join(f'(?:{translate(path)})' for path in paths))
+
+
+class PathMatcher:
+    """
+    The rules of every `ApplyOn`, `ExcludeOn` and `BypassOn` stacked on a middleware are compiled once when the class is
+    created. The `ExcludeOn` rules without methods are merged into a single regex, so most requests are decided by one match.
+    """
+
+    def __init__(self,rules:list[Rule],bypass:bool):
+        self.bypass = bypass
+
+        excluded = [path for kind,paths,methods in rules if kind == 'exclude' and not methods for path in paths]
+        self.exclude = compile_paths(excluded)
+        self.rules = [(kind,compile_paths(paths),frozenset(methods)) for kind,paths,methods in rules if kind == 'apply' or methods]
+
+    def __call__(self,path:str,method:str)->bool:
+        if self.bypass:
+            return False
+
+        if self.exclude != None and self.exclude.match(path):
+            return False
+
+        for kind,regex,methods in self.rules:
+            matched = regex == None or regex.match(path) != None
+            if kind == 'apply' and not matched:
+                return False
+            if kind == 'exclude' and regex != None and matched:
+                return False
+            if methods and method not in methods:
+                return False
+        return True
 
-    def decorator(func:Callable):
 
-        @functools.wraps(func)
-        async def wrapper(self:MiddleWare,request:Request,call_next:Callable[..., Response]):
+class MiddleWare:
+    """
+    Raw ASGI middleware. A subclass either implements `dispatch`, which returns a `Response` to answer the request
+    or `None` to hand it to the next application, or overrides `handle` when it needs to wrap the whole exchange.
+    Only the http requests accepted by the path rules of the decorated method reach them.
+    """
+    priority:MiddlewarePriority
+
+    def __init_subclass__(cls: type) -> None:
+        MIDDLEWARE[cls.__name__] = cls
+
+        rules:list[Rule] = []
+        options:list[Callable[[Request],bool]] = []
+        bypass = False
+        for func in (cls.handle,cls.dispatch):
+            rules.extend(getattr(func,RULES_ATTR,[]))
+            options.extend(getattr(func,OPTIONS_ATTR,[]))
+            bypass = bypass or getattr(func,BYPASS_ATTR,False)
 
-            if bypass:
-                return await call_next(request)
-            
-            url = get_url(request)
+        cls.matcher = PathMatcher(rules,bypass)
+        cls.options = options
 
-            if not path_matcher(paths,url):
-                return await call_next(request)
+    def __init__(self, app:ASGIApp) -> None:
+        self.app = app
 
-            if methods and request.method not in methods:
-                return await call_next(request)
-                  
-            return await func(self,request,call_next)
-        return wrapper
+    async def __call__(self, scope:Scope, receive:Receive, send:Send):
+        if scope['type'] != 'http' or not self.matcher(scope['path'],scope['method']):
+            return await self.app(scope,receive,send)
+
+        if self.options and not await self._check_options(Request(scope,receive)):
+            return await self.app(scope,receive,send)
+
+        await self.handle(scope,receive,send)
+
+    async def _check_options(self,request:Request)->bool:
+        for option in self.options:
+            if asyncio.iscoroutinefunction(option):
+                if not await option(request):
+                    return False
+            elif not option(request):
+                return False
+        return True
+
+    async def handle(self, scope:Scope, receive:Receive, send:Send):
+        response = await self.dispatch(Request(scope,receive))
+        if response == None:
+            return await self.app(scope,receive,send)
+        await response(scope,receive,send)
+
+    async def dispatch(self, request:Request)->Response|None:
+        return None
+
+
+def _add_rule(func:Callable,kind:Literal['apply','exclude'],paths:list[str],methods:list[METHODS],bypass:bool):
+    setattr(func,RULES_ATTR,[*getattr(func,RULES_ATTR,[]),(kind,parse_urls(paths),list(methods))])
+    if bypass:
+        setattr(func,BYPASS_ATTR,True)
+    return func
+
+def ApplyOn(paths:list[str]=['/*'],methods:list[METHODS]=[],bypass:bool = False):
+    def decorator(func:Callable):
+        return _add_rule(func,'apply',paths,methods,bypass)
     return decorator
 
 def ExcludeOn(paths:list[str]=['/*'],methods:list[METHODS]=[],bypass:bool = False):
-    paths = parse_urls(paths)
-
     def decorator(func:Callable):
-        @functools.wraps(func)
-        async def wrapper(self:MiddleWare,request:Request,call_next:Callable[..., Response]):
-
-            if bypass:
-                return await call_next(request)
-
-            url = get_url(request)
-
-            if not exclude_path_matcher(paths,url):
-                return await call_next(request)
-            
-            if methods and request.method not in methods:
-                return await call_next(request)
-            
-            return await func(self,request,call_next)       
-        
-        return wrapper
+        return _add_rule(func,'exclude',paths,methods,bypass)
     return decorator
 
 def OptionsRulesOn(options:list[Callable[[Request],bool]]=[],bypass:bool = False):
     def decorator(func:Callable):
-        
-        @functools.wraps(func)
-        async def wrapper(self:MiddleWare,request:Request,call_next:Callable[..., Response]):
-
-            if bypass:
-                return await call_next(request)
-
-
-            for option in options:
-                if asyncio.iscoroutinefunction(option):
-                    if not await option(request):
-                        return await call_next(request)            
-                else:
-                    if not option(request):
-                        return await call_next(request)
-            
-            return await func(self,request,call_next)
-            
-        return wrapper
-    
+        setattr(func,OPTIONS_ATTR,[*getattr(func,OPTIONS_ATTR,[]),*options])
+        if bypass:
+            setattr(func,BYPASS_ATTR,True)
+        return func
     return decorator
 
 def BypassOn(bypass=True):
     def decorator(func:Callable):
-
-        @functools.wraps(func)
-        async def wrapper(self:MiddleWare,request:Request,call_next:Callable[..., Response]):
-            if bypass:
-                return await call_next(request)
-            return await func(self,request,call_next)
-        return wrapper
-    
+        if bypass:
+            setattr(func,BYPASS_ATTR,True)
+        return func
     return decorator
-
-
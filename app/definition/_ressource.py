@@ -165,9 +165,22 @@ class Helper:
 
         return temp_pipe_func
 
+    @staticmethod
+    def compile_stage(deco:DecoratorObj|Callable,deco_type:Type[DecoratorObj])->tuple[Callable,Callable[[dict,dict],dict]]:
+        return compile_stage(deco,deco_type)
+
+    @staticmethod
+    async def call_stage(stage:tuple[Callable,Callable[[dict,dict],dict]],args:tuple,kwargs:dict,extra:dict=None):
+        return await call_stage(stage,args,kwargs,extra)
+
     @staticmethod
     def stack_decorator(decorated_function, deco_type: Type[DecoratorObj], empty_decorator: bool, default_error: dict, error_type: Type[DecoratorException],inject_func_meta=False):
         def wrapper(function: Callable):
+            if empty_decorator and not inject_func_meta:
+                return function
+
+            # NOTE the chain only depends on the route, it is built once when the ressource stacks its callbacks
+            deco_prime = chain_decorators(function,decorated_function,deco_type)
 
             @functools.wraps(function)
             async def callback(*args, **kwargs):  # Function that will be called
@@ -178,22 +191,6 @@ class Helper:
                                         'message': 'special key used'})
                     kwargs[SpecialKeyParameterConstant.META_SPECIAL_KEY_PARAMETER] = function.meta
 
-                if empty_decorator:
-                    return await function(*args, **kwargs)
-
-                def proxy(deco, f: Callable):
-                    @functools.wraps(deco)
-                    async def delegator(*a, **k):
-                        if isinstance(deco, deco_type):
-                            return await deco.do(f, *a, **k)
-                        else:
-                            return await deco(f, *a, **k)
-                    return delegator
-
-                deco_prime = function
-                for d in reversed(decorated_function):
-                    deco_prime = proxy(d, deco_prime)
-
                 try:
                     return await deco_prime(*args, **kwargs)
                 except error_type as e:
@@ -563,16 +560,18 @@ def UsePermission(*permission_function: Callable[..., bool] | Permission | Type[
         Helper.add_protected_route_metadata(class_name, func.meta['operation_id'])
 
         def wrapper(function: Callable):
+            if not configService.SECURITY_FLAG or empty_decorator:
+                return function
+
+            special_kwargs = {
+                SpecialKeyParameterConstant.CLASS_NAME_SPECIAL_KEY_PARAMETER:class_name,
+                SpecialKeyParameterConstant.META_SPECIAL_KEY_PARAMETER:func.meta
+            }
+            stages = [Helper.compile_stage(permission,Permission) for permission in permission_function]
 
             @functools.wraps(function)
             async def callback(*args, **kwargs):
 
-                if not configService.SECURITY_FLAG:
-                    return await function(*args, **kwargs)
-
-                if empty_decorator:
-                    return await function(*args, **kwargs)
-
                 if len(kwargs) < 1:
                     raise HTTPException(
                         status_code=status.HTTP_501_NOT_IMPLEMENTED)
@@ -581,16 +580,9 @@ def UsePermission(*permission_function: Callable[..., bool] | Permission | Type[
                     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail={
                                         'message': 'special key used'})
 
-                kwargs_prime = kwargs.copy()
-                kwargs_prime[SpecialKeyParameterConstant.CLASS_NAME_SPECIAL_KEY_PARAMETER] = class_name
-                kwargs_prime[SpecialKeyParameterConstant.META_SPECIAL_KEY_PARAMETER] = func.meta
-
-                for permission in permission_function:
+                for stage in stages:
                     try:
-                        if isinstance(permission, Permission):
-                            flag = await permission.do(*args, **kwargs_prime)
-                        else:
-                            flag = await APIFilterInject(permission)(*args, **kwargs_prime)
+                        flag = await Helper.call_stage(stage,args,kwargs,special_kwargs)
 
                         if flag:
                             continue
@@ -663,18 +655,16 @@ def UseGuard(*guard_function: Callable[..., tuple[bool, str]] | Type[Guard] | Gu
             return cls
 
         def wrapper(target_function: Callable):
+            if empty_decorator:
+                return target_function
+
+            stages = [Helper.compile_stage(guard,Guard) for guard in guard_function]
 
             @functools.wraps(target_function)
             async def callback(*args, **kwargs):
-                if empty_decorator:
-                    return await target_function(*args, **kwargs)
-
                 try:
-                    for guard in guard_function:
-                        if isinstance(guard, Guard):
-                            flag, message = await guard.do(*args, **kwargs)
-                        else:
-                            flag, message = await APIFilterInject(guard)(*args, **kwargs)
+                    for stage in stages:
+                        flag, message = await Helper.call_stage(stage,args,kwargs)
 
                         if not isinstance(flag, bool) or not isinstance(message, str):
                             raise HTTPException(
@@ -727,17 +717,15 @@ def UsePipe(*pipe_function: Callable[..., tuple[Iterable[Any], Mapping[str, Any]
             return cls
 
         def wrapper(function: Callable):
+            stages = [Helper.compile_stage(pipe,Pipe) for pipe in pipe_function]
 
             @functools.wraps(function)
             async def callback(*args, **kwargs):
                 try:
                     if before:
-                        kwargs_prime = kwargs.copy()
-                        for pipe in pipe_function:  # verify annotation
-                            if isinstance(pipe, Pipe):
-                                result = await pipe.do(*args, **kwargs_prime)
-                            else:
-                                result = await APIFilterInject(pipe)(*args, **kwargs_prime)
+                        # NOTE kwargs belongs to this call, the pipes results are merged into it directly
+                        for stage in stages:  # verify annotation
+                            result = await Helper.call_stage(stage,args,kwargs)
 
                             if result == None:
                                 continue
@@ -745,19 +733,13 @@ def UsePipe(*pipe_function: Callable[..., tuple[Iterable[Any], Mapping[str, Any]
                             if not isinstance(result, dict):
                                 raise PipeDefaultException
 
-                            kwargs_prime.update(result)
+                            kwargs.update(result)
 
-                        kwargs.update(kwargs_prime)
                         return await function(*args, **kwargs)
                     else:
                         result = await function(*args, **kwargs)
-                        for pipe in pipe_function:
-                            if type(pipe) == type:
-                                result = await pipe(before=False).do(result, **kwargs)
-                            elif isinstance(pipe, Pipe):
-                                result = await pipe.do(result, **kwargs)
-                            else:
-                                result = await APIFilterInject(pipe)(result, **kwargs)
+                        for stage in stages:
+                            result = await Helper.call_stage(stage,(result,),kwargs)
 
                         return result
 
@@ -990,7 +972,7 @@ def UseLimiter(limit_value:str,scope:str=None,exempt=False,override_defaults=Tru
                     response:Response = kwargs.get('response',None)
                     request:Request = kwargs.get('request')
                     if response != None:
-                        response = costService.GlobalLimiter._inject_headers(response,request.state.view_rate_limit)
+                        response = await asyncio.to_thread(costService.GlobalLimiter._inject_headers,response,request.state.view_rate_limit)
 
                     raise HTTPException(e.status_code,e.detail,Helper.merge_headers(e.headers,response))
             
@@ -1,9 +1,10 @@
 import asyncio
-from typing import Any, Callable
+import functools
+from typing import Any, Callable, Type
 
 from fastapi import HTTPException, Response
 from app.utils.constant import SpecialKeyParameterConstant
-from app.utils.helper import APIFilterInject,AsyncAPIFilterInject, SkipCode
+from app.utils.helper import APIFilterInject, SkipCode, filter_kwargs, injection_spec
 from asgiref.sync import sync_to_async
 from enum import Enum
 
@@ -42,15 +43,17 @@ class DecoratorObj:
         self.ref = ref_callback
         self.filter = filter
         self.is_async = asyncio.iscoroutinefunction(self.ref)
+        self.spec = injection_spec(self.ref) if self.filter else None
+
+    def inject(self,kwargs:dict[str,Any],extra:dict[str,Any]=None)->dict[str,Any]:
+        if self.spec == None:
+            return {**kwargs,**extra} if extra else kwargs
+        return filter_kwargs(self.spec,kwargs,extra)
 
     async def do(self, *args, **kwargs):
-        if self.filter:
-            if self.is_async:
-                return await AsyncAPIFilterInject(self.ref)(*args, **kwargs)
-            return APIFilterInject(self.ref)(*args, **kwargs)
         if self.is_async:
-            return await self.ref(*args, **kwargs)
-        return self.ref(*args, **kwargs)
+            return await self.ref(*args, **self.inject(kwargs))
+        return self.ref(*args, **self.inject(kwargs))
 
 
 class Guard(DecoratorObj):
@@ -111,6 +114,8 @@ class Interceptor(DecoratorObj):
         super().__init__(self.intercept, True)
         self.filter_before_params = filter_before_params
         self.filter_after_params = filter_after_params
+        self._intercept_before = APIFilterInject(self.intercept_before) if filter_before_params else self.intercept_before
+        self._intercept_after = APIFilterInject(self.intercept_after) if filter_after_params else self.intercept_after
 
 
     def intercept_before(self):
@@ -121,8 +126,7 @@ class Interceptor(DecoratorObj):
     
     async def intercept(self,function:Callable,*args,**kwargs):
         try:
-            if self.filter_before_params:r = APIFilterInject(self.intercept_before)(*args,**kwargs) 
-            else:r=self.intercept_before(*args,**kwargs)
+            r = self._intercept_before(*args,**kwargs)
 
             if asyncio.iscoroutine(r): await r
         except SkipCode as e:
@@ -138,8 +142,7 @@ class Interceptor(DecoratorObj):
         result = await function(*args,**k_star)
 
         try:
-            if self.filter_after_params: r = APIFilterInject(self.intercept_after)(result,*args,**kwargs) 
-            else: r=self.intercept_after(result,*args,**kwargs)
+            r = self._intercept_after(result,*args,**kwargs)
 
             if asyncio.iscoroutine(r): await  r
         except SkipCode as e:
@@ -153,3 +156,29 @@ class Interceptor(DecoratorObj):
 
 class InterceptorDefaultException(DecoratorException):
     ...
+
+
+def compile_stage(deco:DecoratorObj|Callable,deco_type:Type[DecoratorObj])->tuple[Callable,Callable[[dict,dict],dict]]:
+    """
+    Resolve once how a permission, guard or pipe is called: the `DecoratorObj` injects its own arguments,
+    a plain function gets its kwargs filtered by its annotations.
+    """
+    if isinstance(deco,deco_type):
+        return deco.ref,deco.inject
+    return deco,functools.partial(filter_kwargs,injection_spec(deco))
+
+async def call_stage(stage:tuple[Callable,Callable[[dict,dict],dict]],args:tuple,kwargs:dict,extra:dict=None):
+    call,inject = stage
+    result = call(*args,**inject(kwargs,extra))
+    if asyncio.iscoroutine(result):
+        return await result
+    return result
+
+def chain_decorators(function:Callable,decorated_function:list,deco_type:Type[DecoratorObj])->Callable:
+    """
+    Bind the handlers or interceptors around `function`, the first one of the list being the outermost
+    """
+    deco_prime = function
+    for d in reversed(decorated_function):
+        deco_prime = functools.partial(d.do if isinstance(d, deco_type) else d, deco_prime)
+    return deco_prime
@@ -1,5 +1,6 @@
 from datetime import timedelta
 import functools
+import os
 from random import randint
 import time
 from uuid import UUID
@@ -14,8 +15,10 @@ from app.services.contacts_service import ContactsService
 from app.services.config_service import ConfigService
 from app.container import Get
 from app.services.database.redis_service import RedisService
-from app.utils.constant import RedisConstant
-from app.utils.helper import KeyBuilder
+from app.services.monitoring_service import MonitoringService
+from app.services.security_service import JWTAuthService
+from app.utils.constant import MonitorConstant, RedisConstant, SubConstant
+from app.utils.helper import KeyBuilder, generateId
 from app.utils.tools import Time
 from app.models.security_model import ClientORM,ChallengeORM, PolicyORM
 import typing
@@ -24,18 +27,36 @@ from tortoise.models import Model,ModelMeta
 from app.utils.helper import isprimitive_type
 from app.utils.transformer import parse_time
 import asyncio
-from cachetools import LRUCache
+from copy import deepcopy
+from cachetools import TLRUCache
 
 REDIS_CACHE_KEY = RedisConstant.CACHE_DB
 
 WILDCARD='*'
 
+_cache_origin:tuple[int,str] = None
+
+def cache_origin()->str:
+    """
+    Id of the process in the invalidation messages, generated on first use and again after a fork: the app is preloaded
+    by gunicorn so an id generated at import would be shared by every worker
+    """
+    global _cache_origin
+    pid = os.getpid()
+    if _cache_origin == None or _cache_origin[0] != pid:
+        _cache_origin = (pid,generateId(16))
+    return _cache_origin[1]
+
 T = TypeVar('T',bool,str,int,Model,dict,TypedDict,AuthPermission) # type: ignore
 
 redisService:RedisService = Get(RedisService)
 configService:ConfigService = Get(ConfigService)
 adminService:AdminService = Get(AdminService)
 contactService:ContactsService = Get(ContactsService)
+monitoringService:MonitoringService = Get(MonitoringService)
+jwtAuthService:JWTAuthService = Get(JWTAuthService)
+
+ORM_CACHE_REGISTRY:dict[str,Type['CacheInterface']] = {}
 
 
 class CacheInterface(Generic[T]):
@@ -91,6 +112,17 @@ class CacheInterface(Generic[T]):
             """
         ...
 
+    @staticmethod
+    def CacheBulk(keys:list[str],expiry:int|None|Callable[[Any],int]=None)->dict[str,T|None]:
+        """
+        Resolves many keys at once: the in-memory tier and a single MGET first, then one call of `db_get_many` with every key
+        still missing, whose results are stored back in one pipeline. Without a `db_get_many` each key goes through `Cache`,
+        the key being given to `db_get`.
+        Returns:
+            dict[str, T | None]: The object of each key, None when the database has no object for it.
+        """
+        ...
+
     @staticmethod
     def Key_Separator(key:str|list[str])->str:
         """
@@ -130,11 +162,35 @@ class CacheInterface(Generic[T]):
         """
         ...
 
+    @staticmethod
+    def Load(key:str|list[str],*args,expiry:int|None|Callable[[Any],int]=None,**kwargs)->T:
+        """
+        Retrieves the object from the database and stores it in the cache, without looking up the cache first.
+        Concurrent calls on the same key share a single database retrieval.
+        """
+        ...
+
+    @staticmethod
+    def Lookup(key:str|list[str])->tuple[str,T|None]:
+        """
+        Builds the key and looks it up in the in-memory cache only.
+        Returns:
+            tuple[str, T | None]: The built key and the object, or None if it is not in memory.
+        """
+        ...
+
+    @staticmethod
+    def Fill(key:str,obj:Any)->T|None:
+        """
+        Accepts a raw value read from Redis for a key built by `Lookup`, keeps it in memory and returns the object.
+        """
+        ...
+
     @staticmethod
     def When(cond:Any)->bool:
         ...
 
-def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,prefix:str|list[str]='orm-cache',sep:str|list[str]='/',expiry:int|str|Callable[[T],int|float] = 0,nx:bool=False, when:Callable[[Any],bool]|None=None,use_to_json:bool=True,max_size_memory_cache=1000)->Type[CacheInterface[T]]:
+def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,prefix:str|list[str]='orm-cache',sep:str|list[str]='/',expiry:int|str|Callable[[T],int|float] = 0,nx:bool=False, when:Callable[[Any],bool]|None=None,use_to_json:bool=True,max_size_memory_cache=1000,on_invalid:Callable[[list[str]|None],None]|None=None,db_get_many:Callable[[list[Any]],dict[Any,Any]]|None=None)->Type[CacheInterface[T]]:
     """
         Generates a cache interface class for managing cached objects with a consistent key-building mechanism.
             type_ (Type[T]): The type of the object to be cached. If it is a model, it should support initialization with keyword arguments.
@@ -145,6 +201,8 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
             expiry (int | str, optional): Expiry time for cached objects. Can be an integer (seconds) or a string (e.g., '1h', '30m'). Defaults to 0 (no expiry).
             nx (bool, optional): If True, ensures that the cache key is only set if it does not already exist. Defaults to False.
             when (Callable[[Any], bool] | None, optional): A callable function to determine whether caching should occur based on a condition. Defaults to None.
+            on_invalid (Callable[[list[str] | None], None] | None, optional): Called with the built keys, or None for every key, when keys are invalidated in this process or by another worker. Defaults to None.
+            db_get_many (Callable[[list[Any]], dict[Any, Any]] | None, optional): Retrieves many objects from the database in one call, keyed like the cache keys. Used by `CacheBulk`, which falls back to one `db_get` per key without it. Defaults to None.
             Type[CacheInterface]: A dynamically generated cache interface class with methods for storing, retrieving, and invalidating cached objects.
 
         The generated cache interface includes the following methods:
@@ -153,12 +211,15 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
             - Invalid: Invalidates a specific cache key.
             - InvalidAll: Invalidates all cache keys with a specific prefix or mask.
             - Cache: Retrieves an object from the cache or database, storing it in the cache if it is not already cached.
+            - CacheBulk: Same as Cache for many keys, with one MGET and one database call for the misses.
             - Key_Separator: Builds a cache key using the specified separator.
             - When: Evaluates the provided condition to determine whether caching should occur.
     """
-    IN_MEMORY_CACHE = LRUCache(max_size_memory_cache)
+    IN_MEMORY_CACHE = TLRUCache(max_size_memory_cache,lambda key,value,now: now + value[1])
+    IN_FLIGHT:dict[str,asyncio.Task] = {}
  
     key_builder,key_separator = KeyBuilder(prefix,sep)
+    cache_name = prefix if isinstance(prefix,str) else '/'.join(prefix)
 
     async def DB_Get(*args, **kwargs):
         result = await db_get(*args, **kwargs) if asyncio.iscoroutinefunction(db_get) else db_get(*args, **kwargs)
@@ -181,6 +242,88 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
             _expiry = 0
         return _expiry
 
+    def Jitter(_expiry):
+        # NOTE spread the expiry of the keys stored together so they do not all hit the database at the same time
+        if _expiry <= 0:
+            return _expiry
+        return _expiry + randint(1,max(5,int(_expiry*0.1)))
+
+    def Serialize(obj):
+        if type(type_) == ModelMeta:
+            obj:Model = obj
+            temp = {}
+            if hasattr(obj,'to_json') and use_to_json:
+                temp = obj.to_json
+            else:
+                for field in obj._meta.fields_map:
+                    attr = getattr(obj, field)
+                    if isinstance(attr,UUID):
+                        attr = str(attr)
+                    if isprimitive_type(attr):
+                        temp[field] =attr
+            return temp
+        
+        if type(type_) == typing._TypedDictMeta:
+            return type_(**obj)
+        
+        return obj
+
+    def Deserialize(obj):
+        if type(type_) == ModelMeta:
+            return type_(**obj) 
+        if isinstance(obj,(dict,list)):
+            # NOTE the in-memory value is shared between the requests
+            return deepcopy(obj)
+        return obj
+
+    def Local_Store(key:str,value,exp):
+        ttl = configService.ORM_CACHE_L1_TTL
+        if exp > 0:
+            ttl = min(ttl,exp)
+        IN_MEMORY_CACHE[key] = (value,ttl)
+
+    def Local_Invalid(keys:list[str]|None):
+        if on_invalid != None:
+            on_invalid(keys)
+        Local_Drop(keys)
+
+    def Local_Drop(keys:list[str]|None):
+        if keys == None:
+            IN_MEMORY_CACHE.clear()
+            return
+        for key in keys:
+            IN_MEMORY_CACHE.pop(key,None)
+
+    async def Broadcast_Invalid(keys:list[str]|None):
+        # NOTE the other workers drop their in-memory copy, the message is ignored by this process
+        await redisService.publish_data(SubConstant.ORM_CACHE_INVALIDATION,{'cache':cache_name,'keys':keys,'origin':cache_origin()})
+
+    async def Put(key:str,obj:T,exp,**kwargs):
+        exp = Set_Expiry(exp)
+        if obj == None:
+            obj = await DB_Get(**kwargs)
+
+        temp = Serialize(obj)
+        result = await redisService.store(REDIS_CACHE_KEY,key,temp,exp,nx)
+        if nx and result != None:
+            # NOTE the key already existed, the stored value was not replaced
+            Local_Drop([key])
+        else:
+            Local_Store(key,temp,exp)
+        return result
+
+    def Record(tier:str,amount:int=1):
+        monitoringService.counter_inc(MonitorConstant.ORM_CACHE_LOOKUP,amount,cache=cache_name,tier=tier)
+
+    def Build_Key(key):
+        if not isinstance(key,(str,tuple,list)):
+            key = str(key)
+        
+        if isinstance(key,(tuple,list)):
+            key = [str(k)for k in key]                
+
+        return key_builder(key)
+
     class ORMCache(CacheInterface):
 
         @staticmethod
@@ -194,13 +337,7 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
             """
             @functools.wraps(func)
             async def wrapper(key,*args,**kwargs):
-                if not isinstance(key,(str,tuple,list)):
-                    key = str(key)
-                
-                if isinstance(key,(tuple,list)):
-                    key = [str(k)for k in key]                
-
-                key = key_builder(key)
+                key = Build_Key(key)
                 return await func(key,*args,**kwargs)
         
             return wrapper
@@ -208,50 +345,54 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
         @kb
         @staticmethod
         async def Store(key:str|list[str],obj:T=None,exp=expiry,**kwargs):
-
-            exp = Set_Expiry(exp)
-            if obj == None:
-                obj = await DB_Get(**kwargs)
-
-            if type(type_) == ModelMeta:
-                obj:Model = obj
-                temp = {}
-                if hasattr(obj,'to_json') and use_to_json:
-                    temp = obj.to_json
-                else:
-                    for field in obj._meta.fields_map:
-                        attr = getattr(obj, field)
-                        if isinstance(attr,UUID):
-                            attr = str(attr)
-                        if isprimitive_type(attr):
-                            temp[field] =attr
-            
-            elif type(type_) == typing._TypedDictMeta:
-                temp = type_(**obj)
-            
-            else:
-                temp = obj
-            
-            return await redisService.store(REDIS_CACHE_KEY,key,temp,exp,nx)
+            result = await Put(key,obj,exp,**kwargs)
+            # NOTE a write, the other workers drop the copy of the previous value
+            await Broadcast_Invalid([key])
+            return result
         
-        @kb
         @staticmethod
-        async def Get(key:str|list[str])->T|None:
+        def Lookup(key:str|list[str])->tuple[str,T|None]:
+            key = Build_Key(key)
+            cached = IN_MEMORY_CACHE.get(key,None)
+            if cached == None:
+                return key,None
             
-            obj = await redisService.retrieve(REDIS_CACHE_KEY,key)   
+            Record('l1')
+            return key,Deserialize(cached[0])
+
+        @staticmethod
+        def Fill(key:str,obj:Any,ttl:float=0)->T|None:
             if obj == None:
                 print(f'Cache MISS key: {key} | prefix: {prefix}')
                 return None
 
             print(f'Cache HIT key: {key} | prefix: {prefix}')
-            if type(type_) == ModelMeta:
-                return type_(**obj) 
-            return obj
+            Record('l2')
+            # NOTE the in-memory copy does not outlive the redis key
+            Local_Store(key,obj,ttl)
+            return Deserialize(obj)
+
+        @staticmethod
+        async def Get(key:str|list[str])->T|None:
+
+            key,obj = ORMCache.Lookup(key)
+            if obj != None:
+                return obj
+            
+            obj,ttl = (await redisService.retrieve_many_with_ttl(REDIS_CACHE_KEY,[key]))[0]
+            return ORMCache.Fill(key,obj,ttl)
         
         @kb
         @staticmethod
         async def Invalid(key:str|list[str]):
-            return await redisService.delete(REDIS_CACHE_KEY,key)
+            Local_Invalid([key])
+            result = await redisService.delete(REDIS_CACHE_KEY,key)
+            await Broadcast_Invalid([key])
+            return result
+
+        @staticmethod
+        def InvalidLocal(keys:list[str]|None):
+            Local_Invalid(keys)
         
         @staticmethod
         async def InvalidAll(mask:list[str]=None):
@@ -267,7 +408,10 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
                 
                 p=key_builder(mask)
 
-            return await redisService.delete_all(REDIS_CACHE_KEY,p,is_s_p)
+            Local_Invalid(None)
+            result = await redisService.delete_all(REDIS_CACHE_KEY,p,is_s_p)
+            await Broadcast_Invalid(None)
+            return result
 
         @Time
         @staticmethod
@@ -277,21 +421,75 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
                 return await DB_Get(*args,**kwargs)
 
             obj:T|None =  await ORMCache.Get(key)
-            if obj == None:
+            if obj != None:
+                return obj
+            return await ORMCache.Load(key,*args,expiry=expiry,**kwargs)
+
+        @staticmethod
+        async def Load(key,*args,expiry:int|None|Callable[[Any],int]=expiry,**kwargs)->T:
+
+            flight_key = Build_Key(key)
+            if flight_key in IN_FLIGHT:
+                # NOTE a concurrent miss on the same key is already loading it from the database
+                return await asyncio.shield(IN_FLIGHT[flight_key])
+
+            async def DB_Load():
                 obj = await DB_Get(*args,**kwargs)
-                
                 if obj == None:
                     return None
-                    
-                if callable(expiry):
-                    expiry = expiry(obj)
-                    if expiry <= 0:
-                        return 
-                    else:
-                        expiry + randint(1,5)
-                await ORMCache.Store(key,obj,expiry)
-            
-            return obj
+
+                exp = expiry(obj) if callable(expiry) else Set_Expiry(expiry)
+                if callable(expiry) and exp <= 0:
+                    return None
+                # NOTE a miss-fill, the other workers have no copy to drop
+                await Put(Build_Key(key),obj,Jitter(exp))
+                return obj
+
+            Record('miss')
+            task = asyncio.create_task(DB_Load())
+            IN_FLIGHT[flight_key] = task
+            task.add_done_callback(lambda _: IN_FLIGHT.pop(flight_key,None))
+            return await asyncio.shield(task)
+
+        @staticmethod
+        async def CacheBulk(keys:list,expiry:int|None|Callable[[Any],int]=expiry)->dict[Any,T|None]:
+            keys = list(dict.fromkeys(keys))
+            if db_get_many == None:
+                # NOTE the key is the argument of db_get, like ORMCache.Cache(contact_id,contact_id)
+                objs = await asyncio.gather(*(ORMCache.Cache(key,key,expiry=expiry) for key in keys))
+                return dict(zip(keys,objs))
+
+            results = dict(zip(keys,await CacheMany(*[(ORMCache,key) for key in keys])))
+            missing = [key for key,obj in results.items() if obj == None]
+            if not missing:
+                return results
+
+            Record('miss',len(missing))
+            objs = await db_get_many(missing) if asyncio.iscoroutinefunction(db_get_many) else db_get_many(missing)
+
+            items = []
+            for key in missing:
+                obj = objs.get(key,None)
+                results[key] = obj
+                if obj == None:
+                    continue
+
+                exp = expiry(obj) if callable(expiry) else Set_Expiry(expiry)
+                if callable(expiry) and exp <= 0:
+                    continue
+                items.append((Build_Key(key),Serialize(obj),Jitter(exp)))
+
+            if not items:
+                return results
+
+            await redisService.store_many(REDIS_CACHE_KEY,items,nx)
+            built_keys = [built_key for built_key,_,_ in items]
+            if nx:
+                Local_Drop(built_keys)
+            else:
+                for built_key,temp,exp in items:
+                    Local_Store(built_key,temp,exp)
+            return results
 
         @staticmethod
         def Key_Separator(key:str|list[str]):
@@ -312,14 +510,40 @@ def generate_cache_type(type_:Type[T],db_get:Callable[[Any],Any],index:int = 0,p
         async def Exists(key:str|list[str]):
             return await redisService.exists(REDIS_CACHE_KEY,key)
 
+    ORM_CACHE_REGISTRY[cache_name] = ORMCache
     return ORMCache
 
-ClientORMCache = generate_cache_type(ClientORM,GetClient(True,True),prefix=['orm-group','client'])
-BlacklistORMCache = generate_cache_type(bool,adminService.is_blacklisted,prefix=['orm-blacklist','client'],expiry=lambda o:o[1])
-ChallengeORMCache = generate_cache_type(ChallengeORM,get_challenge,prefix='orm-challenge',expiry=lambda o:o.expired_at_auth.timestamp()-time.time())
+async def CacheMany(*lookups:tuple[Type[CacheInterface],str|list[str]])->list[Any|None]:
+    """
+    Reads several keys, possibly from different cache types, in a single round trip: the in-memory tier is checked first
+    and the remaining keys are fetched with one MGET. A key missing from both tiers is returned as None so the caller
+    can retrieve it with the `Load` method of its cache type.
+    """
+    results = []
+    pending = []
+    for i,(cache,key) in enumerate(lookups):
+        built_key,obj = cache.Lookup(key)
+        results.append(obj)
+        if obj == None:
+            pending.append((i,cache,built_key))
+
+    if pending:
+        values = await redisService.retrieve_many_with_ttl(REDIS_CACHE_KEY,[built_key for _,_,built_key in pending])
+        for (i,cache,built_key),(value,ttl) in zip(pending,values):
+            results[i] = cache.Fill(built_key,value,ttl)
+
+    return results
+
+def Evict_Client_Tokens(keys:list[str]|None):
+    # NOTE the client id is the last part of the client, blacklist and challenge keys
+    jwtAuthService.evict_client_tokens(None if keys == None else [key.rsplit('/',1)[-1] for key in keys])
+
+ClientORMCache = generate_cache_type(ClientORM,GetClient(True,True),prefix=['orm-group','client'],on_invalid=Evict_Client_Tokens)
+BlacklistORMCache = generate_cache_type(bool,adminService.is_blacklisted,prefix=['orm-blacklist','client'],expiry=lambda o:o[1],on_invalid=Evict_Client_Tokens)
+ChallengeORMCache = generate_cache_type(ChallengeORM,get_challenge,prefix='orm-challenge',expiry=lambda o:o.expired_at_auth.timestamp()-time.time(),on_invalid=Evict_Client_Tokens)
 LinkORMCache = generate_cache_type(LinkORM,GetLink(True,False),prefix='orm-link')
 ContactORMCache = generate_cache_type(ContactORM,Get_Contact(True,True,),prefix='orm-contact',use_to_json=True)
-ContactSummaryORMCache = generate_cache_type(ContactSummary,contactService.read_contact,prefix='orm-contact-summary',use_to_json=False)
+ContactSummaryORMCache = generate_cache_type(ContactSummary,contactService.read_contact,prefix='orm-contact-summary',use_to_json=False,db_get_many=contactService.read_contacts)
 PolicyORMCache = generate_cache_type(PolicyORM,GetPolicy(True),prefix='orm-policy',)
 AuthPermissionCache = generate_cache_type(AuthPermission,get_combined_policies,prefix=['auth-group','client'],use_to_json=False)
 #ContentSubORMCache = generate_cache_type(ContentSubscriptionORM,)
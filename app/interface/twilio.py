@@ -24,7 +24,9 @@ class TwilioInterface(Interface):
 
     def _parse_phone_and_query(self, phone_number, carrier, caller_name):
         phone_number = self.parse_to_phone_format(phone_number)
+        return phone_number,self._parse_query(carrier, caller_name)
 
+    def _parse_query(self, carrier, caller_name):
         query = []
         if carrier:
             query.append('carrier')
@@ -35,7 +37,7 @@ class TwilioInterface(Interface):
         # if adds_ons:
         #     query.append('add_ons')
 
-        return phone_number,query
+        return query
 
     def phone_lookup(self, phone_number: str, carrier=True, caller_name=False) -> tuple[int, dict]:
         pass
@@ -7,8 +7,9 @@ from app.definition._service import BaseMiniServiceManager, MiniStateProtocol, S
 from app.services.config_service import ConfigService, UvicornWorkerService
 from app.services.cost_service import CostService
 from app.services.database.redis_service import RedisService
+from app.services.monitoring_service import MonitoringService
 from app.services.reactive_service import ReactiveService
-from app.utils.constant import SubConstant
+from app.utils.constant import MonitorConstant, SubConstant
 from app.utils.helper import issubclass_of
 from app.utils.tools import Mock
 from app.classes.broker import MessageBroker, SubjectType,exception_to_json
@@ -23,10 +24,25 @@ class Broker:
         self.configService:ConfigService = Get(ConfigService)
         self.costService:CostService = Get(CostService)
         self.uvicornWorkerService:UvicornWorkerService = Get(UvicornWorkerService)
+        self.monitoringService:MonitoringService = Get(MonitoringService)
         
         self.backgroundTasks = backgroundTasks
         self.request = request
         self.response = response
+        self.redis_ops = 0
+
+    def _count_op(self):
+        if self.redis_ops == 0:
+            self.backgroundTasks.add_task(self._report_ops)
+        self.redis_ops+=1
+
+    def _report_ops(self):
+        self.monitoringService.histogram_observe(MonitorConstant.BROKER_REQUEST_OPS,self.redis_ops)
+
+    def _fallback(self,function,*args):
+        # NOTE the worker buffer is full or not running, the command is sent after the response like before
+        self.monitoringService.counter_inc(MonitorConstant.BROKER_BUFFER_OPS,outcome='fallback')
+        self.backgroundTasks.add_task(function,*args)
 
     @Mock()
     def publish(self,channel:str,sid_type:SubjectType,subject_id:str, value:Any,state:Literal['next','complete']='next'):
@@ -47,7 +63,9 @@ class Broker:
             else:
                 message_broker = MessageBroker(error=None,sid_type=sid_type,subject_id=subject_id,state=state,value=value)
 
-            self.backgroundTasks.add_task(self.redisService.publish_data,channel,message_broker)
+            self._count_op()
+            if not self.redisService.buffer_publish(channel,message_broker):
+                self._fallback(self.redisService.publish_data,channel,message_broker)
 
     @Mock()
     def stream(self,channel,value,handler=None,args=None,kwargs=None):
@@ -58,11 +76,15 @@ class Broker:
             else:
                 handler(*args,kwargs) 
 
-        self.backgroundTasks.add_task(self.redisService.stream_data,channel,value)
+        self._count_op()
+        if not self.redisService.buffer_stream(channel,value):
+            self._fallback(self.redisService.stream_data,channel,value)
     
     @Mock()
     def push(self,db:int,name,*values):
-        self.backgroundTasks.add_task(self.redisService.push,db,name,*values)
+        self._count_op()
+        if not self.redisService.buffer_push(db,name,*values):
+            self._fallback(self.redisService.push,db,name,*values)
 
     #@Mock()
     def add(self,function,*args,**kwargs):
@@ -89,7 +111,9 @@ class Broker:
         except:
             raise StateProtocolMalFormattedError
 
-        self.backgroundTasks.add_task(self.redisService.publish_data,sub_queue,protocol)
+        self._count_op()
+        if not self.redisService.buffer_publish(sub_queue,protocol):
+            self._fallback(self.redisService.publish_data,sub_queue,protocol)
     
     def wait(self,seconds:float):
 
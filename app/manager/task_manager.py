@@ -1,10 +1,10 @@
 import asyncio
-from dataclasses import asdict
+import time
 from typing import Any, Coroutine, Literal, ParamSpec, TypedDict
 from fastapi import Depends
 from humanize import naturaldelta
-from app.classes.celery import FALLBACK_ENV_TASK, AlgorithmType, Compute_Weight, RunType, SchedulerModel, TaskExecutionResult, TaskRetryError, TaskType, add_messages, s
-from app.classes.env_selector import DEFAULT_MASK, EnvSelection, StrategyType, compute_p_values, get_selector
+from app.classes.celery import FALLBACK_ENV_TASK, CeleryBatchItem, AlgorithmType, Compute_Weight, RunType, SchedulerModel, TaskExecutionResult, TaskRetryError, TaskType, add_messages, s
+from app.classes.env_selector import DEFAULT_MASK, EnvSelection, StrategyType, TaskEnvFeedback, compute_p_values, get_selector
 from app.definition._service import ServiceStatus
 from app.depends.dependencies import get_request_id
 from starlette.background import BackgroundTask,BackgroundTasks
@@ -25,6 +25,7 @@ P = ParamSpec("P")
 class TaskConfig(TypedDict):
     task: BackgroundTask | Coroutine
     delay: float
+    added_at: float
 
 class TaskMeta(TypedDict):
     request_id:str
@@ -74,6 +75,8 @@ class TaskManager:
         self.weight = 0.0
         self.scheduler: SchedulerModel = None
         self.task_result:list[TaskExecutionResult] = []
+        self.worker_batch:list[CeleryBatchItem] = []
+        self.worker_batch_flush_added = False
         self.meta: TaskMeta = TaskMeta(request_id=request_id,background=background,runtype=runtype,save_result=save_results,ttl=ttl,tt=0,ttd=0,retry=retry,split=split,algorithm=algorithm,strategy=strategy,fallback=fallback)
 
         self.celeryService = Get(CeleryService)
@@ -111,6 +114,7 @@ class TaskManager:
         self.taskConfig.append(TaskConfig(
             task=task,
             delay=delay,
+            added_at=time.perf_counter(),
         ))
 
         return new_delay
@@ -119,7 +123,7 @@ class TaskManager:
         scheduler = self.scheduler if _s is None else _s
         weight = Compute_Weight(weight, scheduler._heaviness)
         values:TaskExecutionResult = await self._offload_task(weight,delay,index, callback, *args, **kwargs)
-        self.task_result.append(asdict(values))
+        self.task_result.append(values)
         self.weight +=weight
 
     async def add_task(self, delay:float|None,index,callback: Callable[P, Any], *args: P.args, **kwargs: P.kwargs):
@@ -132,7 +136,60 @@ class TaskManager:
     async def select_task_env(self,task_weight:float,needed_envs:list[Literal[0,1]]=DEFAULT_MASK)->EnvSelection:
         current_workers_count = len(self.celeryService._workers)
         p1,p2,p3 = compute_p_values(current_workers_count,self.configService.CELERY_WORKERS_EXPECTED,task_weight)
-        return get_selector(self.meta['strategy'],celery_broker=self.configService.BROKER_PROVIDER).select(p1, p2, p3,needed_envs)
+        kwargs = {'celery_broker':self.configService.BROKER_PROVIDER}
+        if self.meta['strategy'] == 'feedback':
+            kwargs.update(queue_max=self.configService.TASK_ENV_QUEUE_MAX,background_max=self.configService.TASK_ENV_BACKGROUND_MAX)
+        return get_selector(self.meta['strategy'],**kwargs).select(p1, p2, p3,needed_envs)
+
+    async def _timed_offload(self,env:EnvSelection,offload:Coroutine)->TaskExecutionResult:
+        start = time.perf_counter()
+        try:
+            result:TaskExecutionResult = await offload
+        except Exception:
+            TaskEnvFeedback.record(env,time.perf_counter()-start,False)
+            raise
+        TaskEnvFeedback.record(env,time.perf_counter()-start,not result.error)
+        return result
+
+    async def _worker_offload(self,weight:float,index:int|None,*args,**kwargs)->TaskExecutionResult:
+        if self.configService.CELERY_BATCH_SIZE <= 1:
+            return await self._timed_offload('worker',self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight,*args,**kwargs))
+
+        # NOTE the result is filled with the task id when the batch is published
+        result = TaskExecutionResult(expected_tbd=None,date=str(dt.datetime.now()),offloaded=True,handler='Celery',index=index,result=None,message=f'Task [{self.scheduler.task_name}] received successfully',heaviness=str(self.scheduler._heaviness))
+        if not self.worker_batch_flush_added:
+            # NOTE the interceptors flush the batch before the response, a route without them publishes it once the response is sent
+            self.worker_batch_flush_added = True
+            self.backgroundTasks.add_task(self.flush_worker_batch)
+        self.worker_batch.append(CeleryBatchItem(index=index,weight=weight,args=args,kwargs=kwargs,result=result))
+        if len(self.worker_batch) >= self.configService.CELERY_BATCH_SIZE:
+            await self.flush_worker_batch()
+        return result
+
+    async def flush_worker_batch(self)->int:
+        """
+        Publish the batched worker tasks and return how many of them could not be published
+        """
+        if not self.worker_batch:
+            return 0
+        items, self.worker_batch = self.worker_batch, []
+
+        start = time.perf_counter()
+        try:
+            await self.celeryService.trigger_tasks_from_scheduler(self.scheduler,items)
+        except Exception as e:
+            TaskEnvFeedback.record('worker',(time.perf_counter()-start)/len(items),False)
+            failed = 0
+            for item in items:
+                if item['result'].task_id != None:
+                    continue
+                item['result'].offloaded = False
+                item['result'].error = True
+                item['result'].message = f'Task [{self.scheduler.task_name}] could not be published: {e}'
+                failed+=1
+            return failed
+        TaskEnvFeedback.record('worker',(time.perf_counter()-start)/len(items))
+        return 0
 
     def register_backgroundTask(self):
         callbacks = []
@@ -173,19 +230,20 @@ class TaskManager:
         return self.meta['ttd'] - self.taskConfig[0]['delay']
         
     def _create_background_tasks(self):
-        delay = t['delay']
         to_retry = self.meta['retry']
 
         for i, t in enumerate(self.taskConfig):  # TODO add the index i to the results
-            task:BackgroundTask = t['task']
             
-            async def callback():
+            async def callback(i=i,task:BackgroundTask=t['task'],delay=t['delay'],added_at=t['added_at']):
                 if delay and delay>0:
                     await asyncio.sleep(delay)
                 self.monitoringService.gauge_inc(MonitorConstant.BACKGROUND_TASK_COUNT)
+                TaskEnvFeedback.background_started()
+                success = True
                 try:
                     result= await task() if not asyncio.iscoroutine(task) else await task                    
                 except TaskRetryError as e:
+                    success = False
                     error = e.error
                     bypass =True
                     if to_retry and isinstance(self.scheduler,s) and isinstance(task,BackgroundTask):
@@ -193,11 +251,14 @@ class TaskManager:
                         bypass = False
                     result= self.parse_error(error,bypass,retry_result if not bypass else None)
                 except Exception as e:
+                    success = False
                     result = self.parse_error(e)
                 finally:
                     if self.meta['save_result']:
                         await self.store_bkg_result(result, self.meta['request_id'],self.meta['ttl'],f"{i}")
                     self.monitoringService.gauge_dec(MonitorConstant.BACKGROUND_TASK_COUNT)
+                    TaskEnvFeedback.background_done()
+                    TaskEnvFeedback.record('routebkg',time.perf_counter() - added_at - (delay or 0),success)
 
             yield callback
         
@@ -218,7 +279,7 @@ class TaskManager:
                 
                 case 'worker':
                     if self.configService.CELERY_WORKERS_EXPECTED >= 1:
-                        return await self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight,*args, **kwargs)
+                        return await self._worker_offload(weight,index,*args,**kwargs)
                     elif self.taskService.service_status == ServiceStatus.AVAILABLE:
                         algorithm = 'aps'
                         add_messages(FALLBACK_ENV_TASK, self.scheduler, index=index,obj='aps')
@@ -243,7 +304,7 @@ class TaskManager:
                 
                 case 'aps':
                     if self.configService.APS_ACTIVATED:
-                        return await self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs)
+                        return await self._timed_offload('aps',self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs))
                     elif self.configService.CELERY_WORKERS_EXPECTED >=1:
                         algorithm = 'worker'
                         add_messages(FALLBACK_ENV_TASK, self.scheduler, index=index,obj='celery worker')
@@ -263,9 +324,9 @@ class TaskManager:
         if self.scheduler.task_type == TaskType.NOW:
             return await self._route_offload(None,weight,delay,index,callback,*args,**kwargs)
         elif self.configService.CELERY_WORKERS_EXPECTED >= 1:
-            return  await self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight, *args, **kwargs)
+            return await self._worker_offload(weight,index,*args,**kwargs)
         else:
-            return await self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs)
+            return await self._timed_offload('aps',self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs))
 
     async def _route_offload(self,from_env:EnvSelection|None,weight:float,delay: float,index,callback: Callable, *args, **kwargs)->TaskExecutionResult:
         background =  self.meta.get('background',True)
@@ -273,6 +334,7 @@ class TaskManager:
             return await self.add_task(delay, index,callback, *args, **kwargs)
         else:
             now = dt.datetime.now().isoformat()
+            start = time.perf_counter()
             try:
                 if asyncio.iscoroutine(callback):
                     result = await callback
@@ -281,8 +343,10 @@ class TaskManager:
                 else:    
                     result = callback(*args, **kwargs)
 
+                TaskEnvFeedback.record('route',time.perf_counter()-start)
                 return TaskExecutionResult(handler='Route Handler',offloaded=False,date=now,expected_tbd='now',index=index,result=result,heaviness=str(self.scheduler._heaviness))
             except TaskRetryError as e:
+                TaskEnvFeedback.record('route',time.perf_counter()-start,False)
                 if self.meta['is_retry']:
                     if not isinstance(self.scheduler,s):
                         await self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight,*args, **kwargs)
@@ -296,16 +360,16 @@ class TaskManager:
                 if env.startswith('route'):
                     return await self._route_offload(env,weight,delay,index,callback,*args,**kwargs)
                 elif env == 'worker':
-                    return await self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight, *args, **kwargs)
+                    return await self._worker_offload(weight,index,*args,**kwargs)
                 else:
-                    return await self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs)
+                    return await self._timed_offload('aps',self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs))
             case (TaskType.DATETIME,TaskType.TIMEDELTA,TaskType.INTERVAL,TaskType.CRONTAB):
                 if (await self.select_task_env(weight,self._mask_schedule)) == 'worker':
-                    return await self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight, *args, **kwargs)
+                    return await self._worker_offload(weight,index,*args,**kwargs)
                 else:
-                    return await self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs)
+                    return await self._timed_offload('aps',self._schedule_aps_task(weight,delay,index,callback,*args,**kwargs))
             case (TaskType.SOLAR,TaskType.RRULE):
-                return await self.celeryService.trigger_task_from_scheduler(self.scheduler,index,weight, *args, **kwargs)
+                return await self._worker_offload(weight,index,*args,**kwargs)
             case _:
                 now = dt.datetime.now().isoformat()
                 return TaskExecutionResult(False,now,'RouteHandler',None,index,None,error=True,task_id=self.meta['request_id'],type=None,message=f'TaskType not supported by the server: {self.scheduler.task_type}')
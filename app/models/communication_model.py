@@ -165,6 +165,8 @@ class TwilioProfileModel(CommunicationProfileModel):
     twilio_chat_number: Optional[PhoneModel | str] = None
     twilio_automated_response_number: Optional[PhoneModel |str] = None
     main:bool = False
+    max_concurrency: Optional[int] = Field(None,ge=1,le=100)
+    messages_per_second: Optional[float] = Field(None,gt=0)
 
     _secrets_keys: ClassVar[list[str]] = ["auth_token"]
     _queue:ClassVar[str] = 'twilio'
@@ -380,6 +380,12 @@ async def get_contact_summary(contact_id: str):
     result = await client.execute_query(query, [contact_id])
     return dict(result[1][0]) if result else None
 
+async def get_contact_summaries(contact_ids: list[str]):
+    query = "SELECT * FROM contacts.contactsummary WHERE contact_id = ANY($1::UUID[])"
+    client = Tortoise.get_connection('default')
+    result = await client.execute_query(query, [contact_ids])
+    return [dict(row) for row in result[1]]
+
 async def get_all_contact_summary():
     query = "SELECT * FROM contacts.contactsummary"
     client = Tortoise.get_connection('default')
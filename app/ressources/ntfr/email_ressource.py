@@ -37,8 +37,8 @@ from app.services.assets_service import AssetService
 
 EMAIL_PREFIX = "email"
 
-TRACKING_META_CALLBACK = 0
-TRACKING_META_URL = 1
+TRACKING_META_URL = 0
+TRACKING_META_LINK_PARAMS = 1
 
 DEFAULT_RESPONSE = {
     status.HTTP_202_ACCEPTED: {
@@ -134,12 +134,16 @@ class EmailRessource(BaseHTTPRessource):
                 To = mail_content.meta.To
                 
                 if tracker.will_track:
+                    prepared = template.prepare(mail_content.data,self.settingService.ASSET_LANG,signature=signature)
+                    redirect_urls = [self.linkService.redirect_url(url) for url in prepared.links]
+
                     for j,tracking_event_data in enumerate(tracker.pipe_email_data(email,mail_content)):
                         tracking_meta=self._generate_tracking_metadata(broker,To,tracking_event_data,index,j,scheduler)
                         if tracking_meta == None:
                             continue
 
-                        _,data = template.build(mail_content.data,self.settingService.ASSET_LANG,tracking_meta[TRACKING_META_CALLBACK],tracking_url=tracking_meta[TRACKING_META_URL], signature=signature)
+                        links = self.linkService.create_tracking_links(redirect_urls,**tracking_meta[TRACKING_META_LINK_PARAMS])
+                        _,data = prepared.build(tracking_meta[TRACKING_META_URL],links)
                         data = parse_mime_content(data,mail_content.mimeType)
                         datas.append(data)
                 else:
@@ -180,9 +184,6 @@ class EmailRessource(BaseHTTPRessource):
                         tracking_meta = self._generate_tracking_metadata(broker,To,tracking_event_data,index,j,scheduler)
                         if tracking_meta == None:
                             continue
-                        tracking_link_callback,tracking_url = tracking_meta[TRACKING_META_CALLBACK], tracking_meta[TRACKING_META_URL]
-
-                        email_content = tracking_link_callback(content[CONTENT_HTML]),tracking_link_callback(content[CONTENT_TEXT])
                         email_content = content[CONTENT_HTML],content[CONTENT_TEXT]
 
                         if signature!=None:
@@ -226,7 +227,7 @@ class EmailRessource(BaseHTTPRessource):
         else:
             return {}
 
-    def _generate_tracking_metadata(self,broker:Broker,To:list[str],tracking_event_data:dict,index:int,j:int,scheduler:CustomEmailSchedulerModel|EmailTemplateSchedulerModel)->Tuple[Callable,str|None]:
+    def _generate_tracking_metadata(self,broker:Broker,To:list[str],tracking_event_data:dict,index:int,j:int,scheduler:CustomEmailSchedulerModel|EmailTemplateSchedulerModel)->Tuple[str|None,dict]:
         if tracking_event_data == None:
             scheduler._errors[index] = {
                 'message':'Cant track more than one email when it is set as individual at the moment',
@@ -242,9 +243,9 @@ class EmailRessource(BaseHTTPRessource):
         broker.stream(StreamConstant.EMAIL_TRACKING,email_tracking)
         broker.stream(StreamConstant.EMAIL_EVENT_STREAM,event_tracking)
         tracking_url = self.linkService.create_tracking_pixel('raw_url',eid,contact_id,)
-        tracking_link_callback = self.linkService.create_link_re(eid,add_params=add_params,contact_id=contact_id) # FIXME if its a list change it 
-        
-        return tracking_link_callback,tracking_url
+        link_params = {'message_tracking_id':eid,'contact_id':contact_id,'add_params':add_params}
+
+        return tracking_url,link_params
         
 
     
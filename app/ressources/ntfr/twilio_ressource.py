@@ -58,7 +58,7 @@ class TwilioRessource(BaseHTTPRessource):
         if not carrier and not callee:
             raise HTTPException(status_code=400,detail="At least one of carrier or callee must be true")
         
-        status_code, body = await self.twilioService.phone_lookup(phone_number,True,True)
+        status_code, body = await self.twilioService.phone_lookup(phone_number,carrier,callee)
         if status_code != 200:
             raise HTTPException(status_code=status_code, detail=body)
         
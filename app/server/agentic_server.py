@@ -7,6 +7,7 @@ from app.utils.tools import RunInThreadPool
 from app.container import Get,Register
 from app.callback import Callbacks_Stream,Callbacks_Sub
 from app.services import RedisService
+from app.services import MonitoringService
 from app.services import VaultService
 from app.services import AgentService
 from app.services import MongooseService
@@ -62,7 +63,7 @@ def bootstrap_agent_app()->FastAPI:
 
     async def on_startup():
         mongooseService.start()
-        redisService.register_consumer(callbacks_stream=Callbacks_Stream,callbacks_sub=Callbacks_Sub)
+        redisService.register_consumer(callbacks_stream=Callbacks_Stream,callbacks_sub=Callbacks_Sub,monitoringService=Get(MonitoringService))
         grpcTask.set_task(asyncio.create_task(agentService.serve()))
         agentService.subscribe_token(
             on_next=lambda t: asyncio.create_task(on_purchase_token_next(t)),
@@ -15,6 +15,7 @@ from app.services.database.mongoose_service import MongooseService
 from app.services.database.rabbitmq_service import RabbitMQService
 from app.services.database.redis_service import RedisService
 from app.services.database.tortoise_service import TortoiseConnectionService
+from app.services.monitoring_service import MonitoringService
 from app.services.vault_service import VaultService
 from app.services.worker.task_service import TaskService
 from app.services.config_service import ConfigService, UvicornWorkerService
@@ -185,7 +186,7 @@ class AppServer(EventInterface):
         
         if redisService.service_status == ServiceStatus.AVAILABLE:
             await redisService.create_group()
-            redisService.register_consumer(callbacks_stream=Callbacks_Stream,callbacks_sub=Callbacks_Sub)
+            redisService.register_consumer(callbacks_stream=Callbacks_Stream,callbacks_sub=Callbacks_Sub,monitoringService=Get(MonitoringService))
 
         FastAPICache.init(RedisBackend(redisService.redis_cache), prefix="fastapi-cache")
         # FastAPICache.init(MemcachedBackend(memcachedService.client),prefix="fastapi-cache")
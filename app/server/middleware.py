@@ -2,7 +2,7 @@ from uuid import uuid4
 from fastapi.responses import JSONResponse
 from app.classes.auth_permission import AuthPermission, ClientType, filter_asset_permission, parse_authPermission_enum
 from app.definition._middleware import  ApplyOn, BypassOn, ExcludeOn, MiddleWare, MiddlewarePriority,MIDDLEWARE
-from app.depends.orm_cache import AuthPermissionCache, BlacklistORMCache, ChallengeORMCache, ClientORMCache
+from app.depends.orm_cache import AuthPermissionCache, BlacklistORMCache, CacheMany, ChallengeORMCache, ClientORMCache
 from app.models.security_model import BlacklistORM, ChallengeORM, ClientORM
 from app.services.admin_service import AdminService
 from app.services.monitoring_service import MonitoringService
@@ -10,8 +10,10 @@ from app.services.config_service import ConfigService, UvicornWorkerService
 from app.services.security_service import SecurityService, JWTAuthService
 from app.container import Get, InjectInMethod
 from fastapi import HTTPException, Request, Response,status
-from slowapi.middleware import SlowAPIMiddleware
-from typing import Callable
+from slowapi.middleware import SlowAPIASGIMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import Message, Receive, Scope, Send
+import asyncio
 import time
 from app.utils.constant import HTTPHeaderConstant, MonitorConstant
 from app.depends.dependencies import get_auth_permission, get_client_from_request, get_client_ip,get_bearer_token_from_request, get_response_id
@@ -20,55 +22,62 @@ configService = Get(ConfigService)
 
 class MetaDataMiddleWare(MiddleWare):
     priority = MiddlewarePriority.METADATA
-    def __init__(self, app, dispatch=None) -> None:
-        super().__init__(app, dispatch)
+    def __init__(self, app) -> None:
+        super().__init__(app)
         self.configService:ConfigService = Get(ConfigService)
         self.monitoringService = Get(MonitoringService)
         self.uvicornWorkerService= Get(UvicornWorkerService)
 
     @ExcludeOn(['/docs/*','/openapi.json'])
-    async def dispatch(self, request: Request, call_next: Callable[..., Response]):
+    async def handle(self, scope:Scope, receive:Receive, send:Send):
         start_time = time.time()
         self.monitoringService.gauge_inc(MonitorConstant.CONNECTION_COUNT)
         self.monitoringService.counter_inc(MonitorConstant.CONNECTION_TOTAL)
         request_id = str(uuid4())
-        request.state.request_id =request_id
+        scope.setdefault('state',{})['request_id'] = request_id
+        response_started = False
 
-        try:
-            response: Response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            response.headers[HTTPHeaderConstant.X_PROCESS_TIME] = f"{process_time * 1000:.1f} (ms)"
-            response.headers[HTTPHeaderConstant.X_INSTANCE_ID]= self.uvicornWorkerService.INSTANCE_ID
-            response.headers[HTTPHeaderConstant.X_REQUEST_ID] = request_id
+        async def send_with_metadata(message:Message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+                process_time = time.time() - start_time
+
+                headers = MutableHeaders(scope=message)
+                headers[HTTPHeaderConstant.X_PROCESS_TIME] = f"{process_time * 1000:.1f} (ms)"
+                headers[HTTPHeaderConstant.X_INSTANCE_ID]= self.uvicornWorkerService.INSTANCE_ID
+                headers[HTTPHeaderConstant.X_REQUEST_ID] = request_id
+            await send(message)
 
-            self.monitoringService.histogram_observe(MonitorConstant.REQUEST_LATENCY,process_time)
-            return response
+        try:
+            await self.app(scope,receive,send_with_metadata)
         except HTTPException as e:
+            if response_started:
+                raise
             process_time = time.time() - start_time
-            self.monitoringService.histogram_observe(MonitorConstant.REQUEST_LATENCY,process_time)
-            return JSONResponse (e.detail,e.status_code,{"X-Error-Time":str(process_time) + ' (s)',HTTPHeaderConstant.X_INSTANCE_ID:self.uvicornWorkerService.INSTANCE_ID})
+            response = JSONResponse (e.detail,e.status_code,{"X-Error-Time":str(process_time) + ' (s)',HTTPHeaderConstant.X_INSTANCE_ID:self.uvicornWorkerService.INSTANCE_ID})
+            await response(scope,receive,send)
         finally:
+            self.monitoringService.histogram_observe(MonitorConstant.REQUEST_LATENCY,time.time() - start_time)
             self.monitoringService.gauge_dec(MonitorConstant.CONNECTION_COUNT)
 
 class LoadBalancerMiddleWare(MiddleWare):
     priority = MiddlewarePriority.LOAD_BALANCER
 
-    def __init__(self, app, dispatch = None):
-        super().__init__(app, dispatch)
+    def __init__(self, app):
+        super().__init__(app)
         self.configService: ConfigService = Get(ConfigService)
         self.securityService: SecurityService = Get(SecurityService)
     
     @ExcludeOn(['/docs/*','/openapi.json'])
-    async def dispatch(self, request:Request, call_next:Callable[...,Response]):
-        response = await call_next(request)
+    async def dispatch(self, request:Request):
         # TODO add headers like application id, notifyr-service id, Signature-Service, myb generation id 
-        return response
+        return None
 
 class JWTAuthMiddleware(MiddleWare):
     priority = MiddlewarePriority.AUTH
-    def __init__(self, app, dispatch=None) -> None:
-        super().__init__(app, dispatch)
+    def __init__(self, app) -> None:
+        super().__init__(app)
         self.jwtService:JWTAuthService = Get(JWTAuthService)
         self.configService: ConfigService = Get(ConfigService)
         self.adminService: AdminService = Get(AdminService)
@@ -80,12 +89,17 @@ class JWTAuthMiddleware(MiddleWare):
         permission['auth_type'] = client.auth_type
         permission['client_username'] = client.client_username
 
+    async def _resolve(self,cached,skip:bool,cache,key,*args):
+        if cached != None or skip:
+            return cached
+        return await cache.Load(key,*args)
+
     @BypassOn(not configService.SECURITY_FLAG)
     @ExcludeOn(['/auth/generate/*','/contacts/manage/*'])
     @ExcludeOn(['/link/visits/*','/link/email-track/*'])
     @ExcludeOn(['/docs/*','/openapi.json'])
     @ExcludeOn(['/'])
-    async def dispatch(self,  request: Request, call_next: Callable[..., Response]):
+    async def dispatch(self,  request: Request):
         try:  
             token = get_bearer_token_from_request(request)
             client_ip = get_client_ip(request) #TODO : check wether we must use the scope to verify the client
@@ -96,7 +110,16 @@ class JWTAuthMiddleware(MiddleWare):
             client_id = authPermission['client_id']
             group_id = authPermission['group_id']
 
-            client:ClientORM = await ClientORMCache.Cache([group_id,client_id],client_id=client_id,cid="id",authPermission=authPermission)
+            client_key = [group_id,client_id]
+            client,blacklisted,policies,challenge = await CacheMany(
+                (ClientORMCache,client_key),
+                (BlacklistORMCache,client_key),
+                (AuthPermissionCache,client_key),
+                (ChallengeORMCache,client_id),
+            )
+
+            if client == None:
+                client:ClientORM = await ClientORMCache.Load(client_key,client_id=client_id,cid="id",authPermission=authPermission)
 
             self._copy_client_into_auth(client,authPermission)
             self.jwtService.verify_client_origin(authPermission,client_ip,origin)
@@ -105,14 +128,18 @@ class JWTAuthMiddleware(MiddleWare):
             if not client.authenticated:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Client is not authenticated")
 
-            if client.client_type != ClientType.Admin: 
+            is_admin = client.client_type == ClientType.Admin
+            blacklisted,policies = await asyncio.gather(
+                self._resolve(blacklisted,is_admin,BlacklistORMCache,client_key,client),
+                self._resolve(policies,False,AuthPermissionCache,client_key,client),
+            )
 
-                if await BlacklistORMCache.Cache([group_id,client_id],client):
-                    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="Client is blacklisted")
+            if not is_admin and blacklisted:
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="Client is blacklisted")
 
             request.state.client = client
+            request.state.challenge = challenge
 
-            policies = await AuthPermissionCache.Cache([group_id,client_id],client)
             authPermission= AuthPermission(**{**authPermission,**policies})
 
             filter_asset_permission(authPermission)
@@ -122,10 +149,8 @@ class JWTAuthMiddleware(MiddleWare):
 
         except HTTPException as e:
             return JSONResponse(e.detail,e.status_code,e.headers)
-
-        return await call_next(request)
          
-class CustomSlowApiMiddleware(SlowAPIMiddleware):
+class CustomSlowApiMiddleware(SlowAPIASGIMiddleware):
     priority = MiddlewarePriority.LIMITER
 
 class ChallengeMatchMiddleware(MiddleWare):
@@ -136,17 +161,18 @@ class ChallengeMatchMiddleware(MiddleWare):
     @ExcludeOn(['/auth/generate/*','/auth/refresh/*'])
     @ExcludeOn(['/link/visits/*','/link/email-track/*'])
     @ExcludeOn(['/'])
-    async def dispatch(self, request:Request, call_next:Callable[[Request],Response]):
+    async def dispatch(self, request:Request):
         authPermission: AuthPermission = await get_auth_permission(request)
         client:ClientORM = await get_client_from_request(request)
         challenge = authPermission['challenge']
 
-        db_challenge:ChallengeORM = await ChallengeORMCache.Cache(client.client_id,client) 
+        # NOTE the challenge was read along with the client by the auth middleware, only a miss reaches the database
+        db_challenge:ChallengeORM = getattr(request.state,'challenge',None)
+        if db_challenge == None:
+            db_challenge = await ChallengeORMCache.Load(client.client_id,client) 
 
         if challenge != db_challenge.challenge_auth:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="Challenge does not match") 
-        
-        return await call_next(request)
 
 
 MIDDLEWARE[CustomSlowApiMiddleware.__name__] = CustomSlowApiMiddleware
@@ -1,25 +1,28 @@
 import json
-from random import randint
+import asyncio
 from minio.datatypes import Object
 from fastapi import HTTPException,status
+from app.classes.asset_artifact import AssetArtifactStore
 from app.classes.auth_permission import AssetsPermission, AuthPermission
 from app.definition._error import BaseError
-from app.interface.timers import IntervalParams, SchedulerInterface
+from app.interface.timers import SchedulerInterface
 from app.services.database.object_service import ObjectS3Service
 import app.services.database.object_service as object_service
 from app.services.database.redis_service import RedisService
 from app.services.vault_service import VaultService
 from app.services.setting_service import SettingService
-from app.utils.constant import MinioConstant, RedisConstant
+from app.utils.constant import MinioConstant
 from app.utils.prettyprint import printJSON
 from app.utils.tools import RunInThreadPool
 from .config_service import AssetMode, ApplicationMode, ConfigService, UvicornWorkerService
 from app.utils.fileIO import FDFlag, JSONFile
-from app.classes.template import Asset, Extension, HTMLTemplate, MLTemplate, PDFTemplate, SMSTemplate, PhoneTemplate, SkipTemplateCreationError, Template
+from app.classes.template import Asset, Extension, HTMLTemplate, MLTemplate, PDFTemplate, SMSTemplate, PhoneTemplate, SkipTemplateCreationError, Template, TemplateCache
 from .file.file_service import FileService
 from app.definition import _service
 from enum import Enum
+import functools
 import os
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from threading import Thread
 from typing import Any, Callable, Literal, Dict, get_args
 from app.utils.helper import IntegrityCache, PointerIterator, flatten_dict, issubclass_of
@@ -180,13 +183,95 @@ class ThreadedReader(DiskReader):
         self.thread.join()
         return self.values
 
+def is_encrypted(obj:Object)->bool:
+    return obj.metadata.get(MinioConstant.ENCRYPTED_KEY,False) if obj.metadata else False
+
+
+class S3ObjectLoader:
+    """
+    Fetch the objects of the bucket while the listing pages are still being read, with at most `concurrency` requests in flight.
+    The encrypted objects are decrypted by `batch_size` in a single transit call.
+
+    An object that fails to be fetched or decrypted is left out, the `S3ObjectReader` reads it again on its own.
+    """
+    extensions = tuple(extension(ext) for ext in (Extension.JPEG,Extension.CSS,Extension.HTML,Extension.PDF,Extension.XML))
+
+    def __init__(self,awsService:ObjectS3Service,vaultService:VaultService,asset_cache:IntegrityCache,concurrency:int=10,batch_size:int=64,artifacts:AssetArtifactStore=None):
+        self.awsService = awsService
+        self.vaultService = vaultService
+        self.asset_cache = asset_cache
+        self.artifacts = artifacts
+        self.batch_size = max(batch_size,1)
+        self.executor = ThreadPoolExecutor(max(concurrency,1),thread_name_prefix='s3-loader')
+        self.futures:list[Future] = []
+
+    def submit(self,obj:Object):
+        if obj.is_delete_marker or obj.is_latest != 'true':
+            return
+        if not obj.object_name.endswith(self.extensions) or self.asset_cache.hit(obj.object_name,obj.etag):
+            return
+        if self.artifacts != None and not is_encrypted(obj) and self.artifacts.exists(obj.object_name,obj.etag):
+            return
+        self.futures.append(self.executor.submit(self._fetch,obj))
+
+    def _fetch(self,obj:Object)->tuple[Object,bytes|None]:
+        try:
+            response = self.awsService.read_object(object_name=obj.object_name)
+            try:
+                return obj,response.read()
+            finally:
+                response.close()
+                response.release_conn()
+        except Exception as e:
+            print(obj.object_name,e.__class__,e)
+            return obj,None
+
+    def _decrypt(self,batch:list[tuple[str,bytes]])->dict[str,bytes]:
+        try:
+            plaintexts = self.vaultService.transit_engine.decrypt_batch([content.decode() for _,content in batch],'s3-rest-key')
+        except Exception as e:
+            print('s3-rest-key',e.__class__,e)
+            return {}
+        return {object_name:plaintext.encode() for (object_name,_),plaintext in zip(batch,plaintexts)}
+
+    def join(self)->dict[str,bytes]:
+        contents:dict[str,bytes] = {}
+        decrypting:list[Future] = []
+        batch:list[tuple[str,bytes]] = []
+        try:
+            for future in as_completed(self.futures):
+                obj,content = future.result()
+                if content == None:
+                    continue
+
+                if not is_encrypted(obj):
+                    contents[obj.object_name] = content
+                    continue
+
+                batch.append((obj.object_name,content))
+                if len(batch) >= self.batch_size:
+                    decrypting.append(self.executor.submit(self._decrypt,batch))
+                    batch = []
+
+            if batch:
+                decrypting.append(self.executor.submit(self._decrypt,batch))
+            for future in decrypting:
+                contents.update(future.result())
+        finally:
+            self.executor.shutdown(wait=False,cancel_futures=True)
+        return contents
+
+
 class S3ObjectReader(Reader):   
 
-    def __init__(self, configService: ConfigService, awsService: ObjectS3Service,vaultService:VaultService,objects:list[Object],asset_cache:IntegrityCache,fileService:FileService, asset: type[Asset] = Asset, additionalCode: Callable = None) -> None:
+    def __init__(self, configService: ConfigService, awsService: ObjectS3Service,vaultService:VaultService,objects:list[Object],asset_cache:IntegrityCache,fileService:FileService, asset: type[Asset] = Asset, additionalCode: Callable = None,contents:dict[str,bytes]=None,artifacts:AssetArtifactStore=None,etags:dict[str,str]=None) -> None:
         super().__init__(configService,fileService,asset_cache, asset, additionalCode)
         self.awsService = awsService
         self.vaultService = vaultService
         self.objects:list[Object] =objects
+        self.contents = contents if contents != None else {}
+        self.artifacts = artifacts if asset is Asset or issubclass_of(MLTemplate,asset) else None
+        self.etags = etags if etags != None else {}
     
     def read(self, ext: Extension, flag: FDFlag, rootParam: str = None, encoding="utf-8"):
         ext= f".{ext.value}"
@@ -198,21 +283,64 @@ class S3ObjectReader(Reader):
             if not self.fileService.soft_is_file(obj.object_name):
                 continue
 
-            encrypted = obj.metadata.get(MinioConstant.ENCRYPTED_KEY,False) if obj.metadata else False
-
             if self.fileService.simple_file_matching(obj.object_name,rootParam,ext) and not self.asset_cache.cache(obj.object_name,obj.etag):
 
-                obj_content = self.awsService.read_object(object_name=obj.object_name)
-                obj_content = obj_content.read()
-                if encrypted:
-                    obj_content = self.vaultService.transit_engine.decrypt(obj_content.decode(),'s3-rest-key')
-                    if flag == FDFlag.READ_BYTES:
-                        obj_content = obj_content.encode()
+                if self.restore_artifact(obj):
+                    continue
+
+                obj_content = self.contents.pop(obj.object_name,None)
+                if obj_content == None:
+                    obj_content = self.read_object(obj)
                 
                 if flag != FDFlag.READ_BYTES:
                     obj_content = obj_content.decode(encoding)
                 obj_dir = self.fileService.get_file_dir(obj.object_name,'pure')
                 self.create_assets(obj.object_name,obj_content,obj_dir,self.configService.normalize_assets_path(obj.object_name,'add'),obj.size)
+                self.store_artifact(obj)
+
+    def restore_artifact(self,obj:Object)->bool:
+        if self.artifacts == None or is_encrypted(obj):
+            return False
+
+        artifact = self.artifacts.load(obj.object_name,obj.etag)
+        if artifact == None:
+            return False
+        # NOTE an html template embeds the css and the images of its directory, a new version of one of them invalidates it
+        if any(self.etags.get(name,None) != etag for name,etag in artifact['deps'].items()):
+            return False
+
+        if issubclass_of(MLTemplate,self.asset):
+            asset = self.asset.from_artifact(artifact)
+        else:
+            asset = Asset.__new__(Asset)
+            asset.__dict__.update(artifact['state'])
+        self.values[obj.object_name] = asset
+        return True
+
+    def store_artifact(self,obj:Object):
+        asset = self.values.get(obj.object_name,None)
+        if self.artifacts == None or asset == None or is_encrypted(obj):
+            return
+
+        try:
+            artifact = asset.to_artifact() if isinstance(asset,MLTemplate) else {'state':dict(asset.__dict__)}
+        except Exception as e:
+            print('Artifact:',obj.object_name,e.__class__,e)
+            return
+        artifact['deps'] = {name:self.etags.get(name,None) for name in getattr(asset,'embedded',[])}
+        self.artifacts.store(obj.object_name,obj.etag,artifact)
+
+    def read_object(self,obj:Object)->bytes:
+        response = self.awsService.read_object(object_name=obj.object_name)
+        try:
+            obj_content = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+        if is_encrypted(obj):
+            obj_content = self.vaultService.transit_engine.decrypt(obj_content.decode(),'s3-rest-key').encode()
+        return obj_content
     
 
 #############################################                ##################################################
@@ -251,11 +379,14 @@ class AssetService(_service.BaseService,SchedulerInterface):
         self.phone:dict[str,Asset] = {}
         self.sms:dict[str,Asset] = {}
 
-        self.interval_schedule(IntervalParams(hours=1,minutes=randint(0,60)),self.clear_object_events,tuple(),{})
+        self.reload_lock = asyncio.Lock()
 
-    async def clear_object_events(self,):
-        await self.redisService.delete(RedisConstant.EVENT_DB,MinioConstant.MINIO_EVENT)
-        return
+        self.artifacts:AssetArtifactStore = None
+        if self.configService.ASSET_ARTIFACT_CACHE:
+            try:
+                self.artifacts = AssetArtifactStore(self.configService.ASSET_ARTIFACT_DIR)
+            except OSError as e:
+                print('Artifact:',e.__class__,e)
 
     def _read_globals_disk(self):
 
@@ -274,7 +405,12 @@ class AssetService(_service.BaseService,SchedulerInterface):
         MLTemplate._globals.update(flatten_dict(self.globals.data))
      
     def build(self,build_state=_service.DEFAULT_BUILD_STATE):
-        self.read_bucket_metadata()
+        TemplateCache.resize(self.configService.TEMPLATE_CACHE_MAX_MEMORY)
+
+        loader = None
+        if build_state == _service.DEFAULT_BUILD_STATE and self.configService.ASSET_MODE == AssetMode.s3 and not self.configService.S3_TO_DISK:
+            loader = S3ObjectLoader(self.objectS3Service,self.hcVaultService,self.asset_cache,self.configService.S3_LOAD_CONCURRENCY,self.configService.S3_DECRYPT_BATCH_SIZE,self.artifacts)
+        self.read_bucket_metadata(loader)
 
         match build_state:
             case _service.GUNICORN_BUILD_STATE:
@@ -284,7 +420,7 @@ class AssetService(_service.BaseService,SchedulerInterface):
             case _service.DEFAULT_BUILD_STATE:
                 Template.LANG = self.settingService.ASSET_LANG
                 if self.configService.ASSET_MODE == AssetMode.s3 and not self.configService.S3_TO_DISK:
-                    self.read_asset_from_s3()
+                    self.read_asset_from_s3(loader.join())
                 else:
                     self.read_asset_from_disk()
             
@@ -298,30 +434,93 @@ class AssetService(_service.BaseService,SchedulerInterface):
             if not self.objectS3Service.service_status == _service.ServiceStatus.AVAILABLE:
                 raise _service.BuildFailureError('Amazon S3 Service not available')
 
-    def read_asset_from_s3(self):
+    def read_asset_from_s3(self,contents:dict[str,bytes]=None):
         self._read_globals_s3()
+        self._read_s3_objects(self.objects,contents)
+        self.prune_artifacts()
+
+    def prune_artifacts(self):
+        if self.artifacts == None:
+            return
+        etags = {obj.object_name:obj.etag for obj in self.objects if not obj.is_delete_marker and obj.is_latest == 'true'}
+        removed = self.artifacts.prune(etags)
+        if removed:
+            print('Artifact: pruned',removed,'artifacts of previous versions')
+
+    def _read_s3_objects(self,objects:list[Object],contents:dict[str,bytes]=None,removed:set[str]=frozenset()):
+        etags = {obj.object_name:obj.etag for obj in self.objects if not obj.is_delete_marker and obj.is_latest == 'true'}
+        reader = functools.partial(S3ObjectReader,self.configService,self.objectS3Service,self.hcVaultService,objects,self.asset_cache,self.fileService,contents=contents,artifacts=self.artifacts,etags=etags)
+
+        self.replace_assets('images',reader()(Extension.JPEG,FDFlag.READ_BYTES,AssetType.IMAGES.value),removed)
+        self.replace_assets('css',reader()(Extension.CSS,...,AssetType.EMAIL.value),removed)
+
+        self.replace_assets('email',reader(HTMLTemplate,self.loadHTMLData('s3'))(Extension.HTML,...,AssetType.EMAIL.value),removed)
+        self.replace_assets('pdf',reader(PDFTemplate)(Extension.PDF,FDFlag.READ_BYTES,AssetType.PDF.value),removed)
+        self.replace_assets('sms',reader(SMSTemplate)(Extension.XML,...,AssetType.SMS.value),removed)
+        self.replace_assets('phone',reader(PhoneTemplate)(Extension.XML,...,AssetType.PHONE.value),removed)
+
+    async def reload_objects(self,object_names:list[str]):
+        """
+        Reload the objects changed in the bucket, and the html templates embedding a changed css or image, without touching
+        the others. Each store is replaced in a single assignment: a request sees either the previous or the new version of a
+        template and a render already started keeps the version it holds.
 
-        self.images.update(S3ObjectReader(self.configService,self.objectS3Service,self.hcVaultService,self.objects,self.asset_cache,self.fileService)(
-            Extension.JPEG,FDFlag.READ_BYTES,AssetType.IMAGES.value))
-        self.css.update(S3ObjectReader(self.configService,self.objectS3Service,self.hcVaultService,self.objects,self.asset_cache,self.fileService)(
-            Extension.CSS,...,AssetType.EMAIL.value))
-
-        self.email.update(S3ObjectReader(self.configService,self.objectS3Service,self.hcVaultService,self.objects,self.asset_cache,self.fileService,HTMLTemplate,self.loadHTMLData('s3'))(
-            Extension.HTML,...,AssetType.EMAIL.value))
-        self.pdf.update(S3ObjectReader(self.configService,self.objectS3Service,self.hcVaultService,self.objects,self.asset_cache,self.fileService,PDFTemplate)(
-            Extension.PDF,FDFlag.READ_BYTES,AssetType.PDF.value))
-        self.sms.update(S3ObjectReader(self.configService,self.objectS3Service,self.hcVaultService,self.objects,self.asset_cache,self.fileService,SMSTemplate)(
-            Extension.XML,...,AssetType.SMS.value))
-        self.phone.update(S3ObjectReader(self.configService,self.objectS3Service,self.hcVaultService,self.objects,self.asset_cache,self.fileService,PhoneTemplate)(
-            Extension.XML,...,AssetType.PHONE.value))
-
-    def read_bucket_metadata(self):
+        Only the server processes subscribe to the reload, the celery workers receive the content already rendered by the
+        route. A task scheduled before a reload thus sends the version rendered when it was scheduled.
+        """
+        if self.configService.ASSET_MODE != AssetMode.s3 or self.configService.S3_TO_DISK:
+            return
+        if self.service_status != _service.ServiceStatus.AVAILABLE or not object_names:
+            return
+
+        async with self.reload_lock:
+            await self._reload_objects(object_names)
+
+    @RunInThreadPool
+    def _reload_objects(self,object_names:list[str]):
+        names = set(object_names)
+        if 'globals.json' in names:
+            self._read_globals_s3()
+        names -= self.non_obj_template
+
+        listed = [obj for name in names for obj in self.objectS3Service.iter_objects(name) if obj.object_name == name]
+        self.objects = [obj for obj in self.objects if obj.object_name not in names] + listed
+
+        removed = names - {obj.object_name for obj in listed if not obj.is_delete_marker and obj.is_latest == 'true'}
+        for name in removed:
+            self.asset_cache.invalid(name)
+
+        embedded = {ext:[name for name in names if name.endswith(extension(ext))] for ext in (Extension.CSS,Extension.JPEG)}
+        if any(embedded.values()):
+            for obj in self.objects:
+                if obj.is_delete_marker or obj.object_name in names or not obj.object_name.endswith(extension(Extension.HTML)):
+                    continue
+                dir_name = self.fileService.get_file_dir(obj.object_name,'pure')
+                if any(self.fileService.root_to_path_matching(paths,dir_name,ext.value,sep=ASSET_SEPARATOR) for ext,paths in embedded.items() if paths):
+                    # NOTE the etag did not change, drop it so the reader compiles the template again
+                    self.asset_cache.invalid(obj.object_name)
+                    names.add(obj.object_name)
+
+        objects = [obj for obj in self.objects if obj.object_name in names]
+        loader = S3ObjectLoader(self.objectS3Service,self.hcVaultService,self.asset_cache,self.configService.S3_LOAD_CONCURRENCY,self.configService.S3_DECRYPT_BATCH_SIZE,self.artifacts)
+        for obj in objects:
+            loader.submit(obj)
+        self._read_s3_objects(objects,loader.join(),removed)
+        self.prune_artifacts()
+
+    def read_bucket_metadata(self,loader:S3ObjectLoader=None):
+        """
+        The listing is paginated, with a `loader` the objects start being fetched as soon as their page is received
+        """
         self.buckets_size = 0
-        for obj in self.objectS3Service.list_objects(recursive=True):
+        self.objects = []
+        for obj in self.objectS3Service.iter_objects(recursive=True):
             if obj.size:
                 self.buckets_size += obj.size
             if obj.object_name not in self.non_obj_template:
                 self.objects.append(obj)
+                if loader != None:
+                    loader.submit(obj)
         
     def read_asset_from_disk(self):
         self._read_globals_disk()
@@ -332,11 +531,31 @@ class AssetService(_service.BaseService,SchedulerInterface):
         self.images.update(self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache)(Extension.JPEG, FDFlag.READ_BYTES, AssetType.IMAGES.value)))
         self.css.update(self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache)(Extension.CSS, FDFlag.READ, AssetType.EMAIL.value)))
 
-        self.email.update(self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,HTMLTemplate, self.loadHTMLData('disk'))(Extension.HTML, FDFlag.READ, AssetType.EMAIL.value)))
+        self.replace_assets('email',self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,HTMLTemplate, self.loadHTMLData('disk'))(Extension.HTML, FDFlag.READ, AssetType.EMAIL.value)))
         self.pdf.update(self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,PDFTemplate)(Extension.PDF, FDFlag.READ_BYTES, AssetType.PDF.value)))
-        self.sms.update(self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,SMSTemplate)(Extension.XML, FDFlag.READ, AssetType.SMS.value)))
-        self.phone.update(self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,PhoneTemplate)(Extension.XML, FDFlag.READ, AssetType.PHONE.value)))
+        self.replace_assets('sms',self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,SMSTemplate)(Extension.XML, FDFlag.READ, AssetType.SMS.value)))
+        self.replace_assets('phone',self.sanitize_paths(DiskReader(self.configService,self.fileService,self.asset_cache,PhoneTemplate)(Extension.XML, FDFlag.READ, AssetType.PHONE.value)))
     
+    def replace_assets(self,store_name:str,assets:dict[str,Asset],removed:set[str]=frozenset()):
+        """
+        Swap the store for a copy holding the reloaded assets without the removed ones, and drop the compiled template
+        of the versions they replace
+        """
+        store:dict[str,Asset] = getattr(self,store_name)
+        for key,old in store.items():
+            if not isinstance(old,MLTemplate):
+                continue
+            if key in removed or (key in assets and old.content_hash != getattr(assets[key],'content_hash',None)):
+                TemplateCache.invalidate(old.content_hash)
+
+        new_store = {key:asset for key,asset in store.items() if key not in removed}
+        new_store.update(assets)
+        setattr(self,store_name,new_store)
+
+    @property
+    def template_cache_stats(self):
+        return TemplateCache.stats
+
     def sanitize_paths(self,assets:dict[str,Asset]):
         temp: dict[str,Asset]={}
         for key, asset in assets.items():
@@ -353,6 +572,7 @@ class AssetService(_service.BaseService,SchedulerInterface):
                 cssInPath = self.fileService.listExtensionPath(html.dirName, Extension.CSS.value)
             else:
                 cssInPath = self.fileService.root_to_path_matching(non_marker_obj,html.dirName,Extension.CSS.value,sep=ASSET_SEPARATOR,pointer=PointerIterator('object_name'))
+                html.embedded = list(cssInPath)
             
             css_content=""
 
@@ -371,6 +591,7 @@ class AssetService(_service.BaseService,SchedulerInterface):
                 imagesInPath = self.fileService.listExtensionPath(html.dirName, Extension.JPEG.value)
             else:
                 imagesInPath = self.fileService.root_to_path_matching(non_marker_obj,html.dirName,Extension.JPEG.value,sep=ASSET_SEPARATOR,pointer=PointerIterator('object_name'))
+                html.embedded.extend(imagesInPath)
                 
             for imagesPath in imagesInPath:
                 try:
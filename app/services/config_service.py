@@ -160,6 +160,8 @@ class ConfigService(_service.BaseService):
         self.SECURITY_FLAG: bool = ConfigService.parseToBool(self.getenv('SECURITY_FLAG'), False)
         self.COST_FLAG:bool = ConfigService.parseToBool(self.getenv('COST_FLAG','true'),True)
         self.ADMIN_KEY:str = self.getenv("ADMIN_KEY")
+        self.JWT_DECODE_CACHE_SIZE:int = ConfigService.parseToInt(self.getenv('JWT_DECODE_CACHE_SIZE'),10000)
+        self.JWT_DECODE_CACHE_TTL:int = ConfigService.parseToInt(self.getenv('JWT_DECODE_CACHE_TTL'),60*60*3)
         
         # SERVER CONFIG #
         self.HTTP_MODE:Literal['HTTP','HTTPS'] = self.getenv("HTTP_MODE",'HTTP')
@@ -177,9 +179,42 @@ class ConfigService(_service.BaseService):
         # ASSETS CONFIG #
         self.ASSET_MODE = AssetMode(self.getenv("ASSET_MODE",'local' if self.MODE == MODE.DEV_MODE else 's3').lower())
 
+        self.TEMPLATE_CACHE_MAX_MEMORY:int = ConfigService.parseToInt(self.getenv('TEMPLATE_CACHE_MAX_MEMORY'),64*1024*1024)
+        self.S3_LOAD_CONCURRENCY:int = ConfigService.parseToInt(self.getenv('S3_LOAD_CONCURRENCY'),10)
+        self.S3_DECRYPT_BATCH_SIZE:int = ConfigService.parseToInt(self.getenv('S3_DECRYPT_BATCH_SIZE'),64)
+        self.ASSET_ARTIFACT_CACHE:bool = ConfigService.parseToBool(self.getenv('ASSET_ARTIFACT_CACHE','true'),True)
+        self.ASSET_ARTIFACT_DIR:str = self.getenv('ASSET_ARTIFACT_DIR',f'.artifacts{DIRECTORY_SEPARATOR}')
+
         self.INSTALL_DOCLING:bool = ConfigService.parseToBool(self.getenv('INSTALL_DOCLING','false'),False)
         self.INSTALL_CRAWL4AI:bool = ConfigService.parseToBool(self.getenv('INSTALL_CRAWL4AI','false'),False)
 
+        # SMTP POOL CONFIG #
+        self.SMTP_POOL_MIN_SIZE:int = ConfigService.parseToInt(self.getenv('SMTP_POOL_MIN_SIZE'),1)
+        self.SMTP_POOL_MAX_SIZE:int = ConfigService.parseToInt(self.getenv('SMTP_POOL_MAX_SIZE'),4)
+        self.SMTP_POOL_IDLE_TTL:int = ConfigService.parseToInt(self.getenv('SMTP_POOL_IDLE_TTL'),60)
+        self.SMTP_POOL_MAX_MESSAGES:int = ConfigService.parseToInt(self.getenv('SMTP_POOL_MAX_MESSAGES'),100)
+        self.SMTP_POOL_TIMEOUT:int = ConfigService.parseToInt(self.getenv('SMTP_POOL_TIMEOUT'),30)
+
+        # TWILIO FANOUT CONFIG #
+        self.TWILIO_FANOUT_CONCURRENCY:int = ConfigService.parseToInt(self.getenv('TWILIO_FANOUT_CONCURRENCY'),10)
+        self.TWILIO_FANOUT_RATE:int = ConfigService.parseToInt(self.getenv('TWILIO_FANOUT_RATE'),10)
+        self.TWILIO_FANOUT_MAX_RETRIES:int = ConfigService.parseToInt(self.getenv('TWILIO_FANOUT_MAX_RETRIES'),3)
+
+        # PHONE LOOKUP CONFIG #
+        self.PHONE_LOOKUP_CACHE_SIZE:int = ConfigService.parseToInt(self.getenv('PHONE_LOOKUP_CACHE_SIZE'),10000)
+        self.PHONE_LOOKUP_LOCAL_TTL:int = ConfigService.parseToInt(self.getenv('PHONE_LOOKUP_LOCAL_TTL'),60*60)
+        self.PHONE_LOOKUP_TTL:int = ConfigService.parseToInt(self.getenv('PHONE_LOOKUP_TTL'),60*60*24*30)
+        self.PHONE_LOOKUP_NEGATIVE_TTL:int = ConfigService.parseToInt(self.getenv('PHONE_LOOKUP_NEGATIVE_TTL'),60*60*24)
+        self.PHONE_LOOKUP_CONCURRENCY:int = ConfigService.parseToInt(self.getenv('PHONE_LOOKUP_CONCURRENCY'),10)
+        self.CARRIER_GUARD_FLAG:bool = ConfigService.parseToBool(self.getenv('CARRIER_GUARD_FLAG'),False)
+
+        # GEOIP CONFIG #
+        self.GEOIP_PROVIDER:Literal['mmdb','ipinfo','none'] = self.getenv('GEOIP_PROVIDER','mmdb').lower()
+        self.GEOIP_DATABASE_PATH:str = self.getenv('GEOIP_DATABASE_PATH','/usr/share/GeoIP/GeoLite2-City.mmdb')
+        self.GEOIP_CACHE_SIZE:int = ConfigService.parseToInt(self.getenv('GEOIP_CACHE_SIZE'),10000)
+        self.GEOIP_CACHE_TTL:int = ConfigService.parseToInt(self.getenv('GEOIP_CACHE_TTL'),60*60*24)
+        self.GEOIP_DEFER:bool = ConfigService.parseToBool(self.getenv('GEOIP_DEFER','false'),False)
+
         # S3 STORAGE CONFIG #
         self.S3_CRED_TYPE:Literal['MINIO','AWS'] = self.getenv('S3_CRED_TYPE','MINIO').upper()
         self.S3_ENDPOINT:str= self.getenv('S3_ENDPOINT','127.0.0.1:9000' if self.MODE == MODE.DEV_MODE else 'minio:9000')
@@ -196,6 +231,10 @@ class ConfigService(_service.BaseService):
 
         # QDRANT CONFIG #
         self.QDRANT_HOST:str = self.getenv('QDRANT_HOST','localhost' if self.MODE == MODE.DEV_MODE else 'qdrant')
+        self.EMBEDDING_CONCURRENCY:int = ConfigService.parseToInt(self.getenv('EMBEDDING_CONCURRENCY'),4)
+        self.EMBEDDING_CACHE:bool = ConfigService.parseToBool(self.getenv('EMBEDDING_CACHE','true'),True)
+        self.EMBEDDING_CACHE_PATH:str = self.getenv('EMBEDDING_CACHE_PATH',f'{self.DATA_INGESTION_DIR}embeddings.sqlite3')
+        self.EMBEDDING_STUB:bool = ConfigService.parseToBool(self.getenv('EMBEDDING_STUB','false'),False)
 
         # HASHI CORP VAULT CONFIG #
         self.VAULT_ADDR:str = 'http://127.0.0.1:8200' if self.MODE == MODE.DEV_MODE else 'http://vault:8200'
@@ -205,6 +244,19 @@ class ConfigService(_service.BaseService):
 
         # REDIS CONFIG #
         self.REDIS_HOST:str = self.getenv("REDIS_HOST","localhost" if self.MODE == MODE.DEV_MODE else "redis")
+        self.REDIS_STREAM_MIN_COUNT:int = ConfigService.parseToInt(self.getenv('REDIS_STREAM_MIN_COUNT'),10)
+        self.REDIS_STREAM_MAX_BLOCK:int = ConfigService.parseToInt(self.getenv('REDIS_STREAM_MAX_BLOCK'),30*1000)
+        self.REDIS_STREAM_CLAIM_IDLE:int = ConfigService.parseToInt(self.getenv('REDIS_STREAM_CLAIM_IDLE'),60*1000)
+        self.REDIS_STREAM_MAX_DELIVERIES:int = ConfigService.parseToInt(self.getenv('REDIS_STREAM_MAX_DELIVERIES'),5)
+        self.REDIS_PUBSUB_QUEUE_SIZE:int = ConfigService.parseToInt(self.getenv('REDIS_PUBSUB_QUEUE_SIZE'),1000)
+        self.REDIS_BUFFER_FLUSH_SIZE:int = ConfigService.parseToInt(self.getenv('REDIS_BUFFER_FLUSH_SIZE'),500)
+        self.REDIS_BUFFER_FLUSH_INTERVAL:int = ConfigService.parseToInt(self.getenv('REDIS_BUFFER_FLUSH_INTERVAL'),50)
+        self.REDIS_BUFFER_MAX_SIZE:int = ConfigService.parseToInt(self.getenv('REDIS_BUFFER_MAX_SIZE'),20000)
+        self.LIMITER_STRATEGY:str = self.getenv('LIMITER_STRATEGY','sliding-window-counter')
+        self.LIMITER_LEASE_SIZE:int = ConfigService.parseToInt(self.getenv('LIMITER_LEASE_SIZE'),0)
+        self.LIMITER_LEASE_TTL:int = ConfigService.parseToInt(self.getenv('LIMITER_LEASE_TTL'),1000)
+        self.LIMITER_MEMORY_FALLBACK:bool = ConfigService.parseToBool(self.getenv('LIMITER_MEMORY_FALLBACK'),True)
+        self.ORM_CACHE_L1_TTL:int = ConfigService.parseToInt(self.getenv('ORM_CACHE_L1_TTL'),30)
 
         # RABBITMQ CONFIG #
         self.RABBITMQ_HOST:Callable[...,str] = self.getenv("RABBITMQ_HOST", "localhost" if self.MODE == MODE.DEV_MODE else "rabbitmq")
@@ -229,6 +281,11 @@ class ConfigService(_service.BaseService):
         self.CELERY_VISIBILITY_TIMEOUT = ConfigService.parseToInt(self.getenv('CELERY_VISIBILITY_TIMEOUT'),60*60*2)
         
         self.CELERY_WORKERS_EXPECTED = SCALING.get('worker',0)
+        self.CELERY_BATCH_SIZE:int = ConfigService.parseToInt(self.getenv('CELERY_BATCH_SIZE'),200)
+
+        # TASK ENV CONFIG #
+        self.TASK_ENV_QUEUE_MAX:int = ConfigService.parseToInt(self.getenv('TASK_ENV_QUEUE_MAX'),100)
+        self.TASK_ENV_BACKGROUND_MAX:int = ConfigService.parseToInt(self.getenv('TASK_ENV_BACKGROUND_MAX'),50)
 
         # APS CONFIG #
         self.APS_ACTIVATED:bool = ConfigService.parseToBool(self.getenv('APS_ACTIVATED','true'),True)
@@ -201,32 +201,29 @@ class ContactsService(BaseService):
         return update
 
 
+    @staticmethod
+    def _parse_contact_summary(contact:dict):
+        for keys,item in contact.items():
+            if isinstance(item,UUID):
+                contact[keys] = str(item)
+                continue
+            
+            if isinstance(item,datetime):
+                contact[keys] = item.isoformat()
+        return contact
+
     async def read_contact(self, contact_id: str):
         contact = await get_contact_summary(contact_id)
         if contact != None:
-            for keys,item in contact.items():
-                if isinstance(item,UUID):
-                    contact[keys] = str(item)
-                    continue
-                
-                if isinstance(item,datetime):
-                    contact[keys] = item.isoformat()
-                
+            self._parse_contact_summary(contact)
         return contact
 
-        user = await ContactORM.filter(contact_id=contact_id).first()
-        subs = await SubscriptionContactStatusORM.filter(contact_id=contact_id).first()
-
-        return {'contact_id': contact_id,
-                'app_registered': user.app_registered,
-                'created-at': user.created_at,
-                'updated-at': user.updated_at,
-                'email-status': subs.email_status,
-                'phone-status': subs.sms_status,
-                'subs-updated-at': subs.updated_at,
-                'phone': user.phone,
-                'email': user.email,
-                'lang': user.lang}
+    async def read_contacts(self, contact_ids: list[str]) -> dict[str, dict]:
+        if not contact_ids:
+            return {}
+        contacts = await get_contact_summaries(contact_ids)
+        return {contact['contact_id']: contact for contact in map(self._parse_contact_summary, contacts)}
+
 
     async def filter_registered_contacts(self, by: Literal['email', 'id', 'phone'], app_registered: bool,):
 
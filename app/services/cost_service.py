@@ -2,28 +2,37 @@ import asyncio
 import functools
 from pathlib import Path
 import traceback
+import json
 from typing import Any, Callable, Self
 
-from redis import WatchError
 from app.classes.cost_definition import CostCredits, CostDefinitionNotFoundError, CostRules, CreditDeductionFailedError, EmailCostDefinition, FileCostDefinition, InsufficientCreditsError, InvalidPurchaseRequestError, PhoneCostDefinition, CostPlanNotFoundError, SMSCostDefinition, SimpleTaskCostDefinition,Bill
 from app.definition._service import BaseService, BuildAbortError, BuildWarningError, Service, ServiceStatus
 from app.errors.service_error import BuildFailureError
 from app.services.config_service import MODE, ConfigService
 from app.services.database.redis_service import RedisService
 from app.services.file.file_service import FileService
-from app.utils.constant import CostConstant, RedisConstant
+from app.services.monitoring_service import MonitoringService
+from app.utils.constant import CostConstant, MonitorConstant, RedisConstant
 from app.utils.fileIO import JSONFile
 from app.utils.helper import flatten_dict
 from datetime import datetime
 from app.utils.globals import  CAPABILITIES,APP_MODE,ApplicationMode
 
 if APP_MODE == ApplicationMode.server:
-    from slowapi import Limiter
     from slowapi.util import get_remote_address
+    from app.classes.limiter_storage import LEASED_REDIS_SCHEME,NotifyrLimiter
 
 
 REDIS_CREDIT_KEY_BUILDER= lambda credit_key: f"notifyr/credit:{credit_key}"
 
+# NOTE functions of the notifyr library loaded in redis from scripts/ncs-lib.lua
+CREDIT_DEDUCT_FUNCTION = 'credit_deduct'
+CREDIT_REFUND_FUNCTION = 'credit_refund'
+
+DEDUCTION_MISSING_CREDIT = 0
+DEDUCTION_INSUFFICIENT = -1
+DEDUCTION_SUCCESS = 1
+
 CREDIT_TO_CAPABILITIES:dict[CostConstant.Credit,str] = {
     'email':'email',
     'agent':'agentic',
@@ -48,11 +57,12 @@ class CostService(BaseService):
 
     OVERDRAFT_ALLOWED = 0.15
 
-    def __init__(self,configService:ConfigService,redisService:RedisService,fileService:FileService):
+    def __init__(self,configService:ConfigService,redisService:RedisService,fileService:FileService,monitoringService:MonitoringService):
         super().__init__()
         self.configService = configService
         self.redisService = redisService
         self.fileService = fileService
+        self.monitoringService = monitoringService
         self.costs_definition={}
 
     @staticmethod
@@ -87,6 +97,13 @@ class CostService(BaseService):
 
         return decorator
 
+    def limiter_fallback(self,storage_dead:bool):
+        if storage_dead:
+            print('[Limiter] Redis storage unreachable, the rate limits are now counted in memory by each worker')
+        else:
+            print('[Limiter] Redis storage recovered, the rate limits are counted in Redis again')
+        self.monitoringService.gauge_set(MonitorConstant.LIMITER_STORAGE_FALLBACK,int(storage_dead))
+
     def verify_dependency(self):
         if self.configService.MODE == MODE.PROD_MODE:
             if not self.COST_PATH_OBJ.exists():
@@ -96,10 +113,22 @@ class CostService(BaseService):
             raise BuildFailureError('Redis Service not available')
 
     def build(self,build_state=-1):
-        
+
         if APP_MODE == ApplicationMode.server:
-            storage_uri = None if self.configService.MODE == MODE.DEV_MODE else None # TODO redis url + f'/{RedisConstant.LIMITER_DB}'
-            self.GlobalLimiter = Limiter(get_remote_address, storage_uri=storage_uri, headers_enabled=True)
+            if self.configService.LIMITER_LEASE_SIZE > 0:
+                storage_uri = self.redisService.compute_limiter_url(LEASED_REDIS_SCHEME)
+                storage_options = {'lease_size':self.configService.LIMITER_LEASE_SIZE,'lease_ttl':self.configService.LIMITER_LEASE_TTL/1000}
+            else:
+                storage_uri = self.redisService.compute_limiter_url()
+                storage_options = {}
+
+            self.GlobalLimiter = NotifyrLimiter(get_remote_address,
+                                         storage_uri=storage_uri,
+                                         storage_options=storage_options,
+                                         strategy=self.configService.LIMITER_STRATEGY,
+                                         in_memory_fallback_enabled=self.configService.LIMITER_MEMORY_FALLBACK,
+                                         headers_enabled=True,
+                                         on_fallback=self.limiter_fallback)
 
         if self.configService.MODE == MODE.PROD_MODE:
             try:
@@ -136,57 +165,30 @@ class CostService(BaseService):
     @CreditSilentFail()
     @RedisCreditKeyBuilder
     async def refund_credits(self,credit_key:str,bill:Bill):
-        async with self.redisService.db['limiter'].pipeline(transaction=False) as pipe:
-            refund_cost = bill['total']
-            balance = await self.get_credit_balance(credit_key,__builder__=False,redis=pipe)
-            
-            pipe.multi()
-
-            await self.redisService.decrement(RedisConstant.LIMITER_DB,credit_key,refund_cost,pipe)
-            self.set_balance(bill, balance)
-            await self.push_bill(credit_key,bill,redis=pipe)
-
-            await pipe.execute()
-
+        balance = await self.redisService.redis_limiter.fcall(CREDIT_REFUND_FUNCTION,2,credit_key,self.bill_key(credit_key),bill['total'],self.dump_bill(bill))
+        self.set_balance(bill, balance)
 
     @CreditSilentFail(0)
     @RedisCreditKeyBuilder
     async def deduct_credits(self,credit_key:CostConstant.Credit,bill:Bill,retry_limit=5):
-        retry=0
-        while retry < retry_limit:
-            async with self.redisService.redis_limiter.pipeline(transaction=False) as pipe:
-                try:
-                    await pipe.watch(credit_key)
-                    current_balance = await pipe.get(credit_key)
-                    current_balance = int(current_balance)
-                    
-                    if current_balance is None:
-                        await pipe.unwatch()
-                        raise InvalidPurchaseRequestError
-
-                    bill_total = bill['total']
-
-                    if current_balance < bill_total and not self.rules.get('credit_overdraft_allowed',False):
-                        await pipe.unwatch()
-                        raise InsufficientCreditsError(current_balance,bill_total,credit_key)
-                    
-                    new_balance = current_balance - bill_total
-                    new_balance = int(new_balance)
-                    pipe.multi()
-                    pipe.set(credit_key, new_balance)
-
-                    self.set_balance(bill,current_balance)
-                    await self.push_bill(credit_key,bill,redis=pipe)
-
-                    await pipe.execute()
-                    return
-                except WatchError:
-                    retry+=1
-                    continue
-                finally:
-                    await pipe.reset()
+        """
+        Check the balance, deduct the bill and push it in a single atomic function call, so concurrent purchases on the same credit do not retry.
+        `retry_limit` is kept for the callers of the previous optimistic locking implementation.
+        """
+        bill_total = bill['total']
+        overdraft_allowed = 1 if self.rules.get('credit_overdraft_allowed',False) else 0
+
+        status,current_balance = await self.redisService.redis_limiter.fcall(CREDIT_DEDUCT_FUNCTION,2,credit_key,self.bill_key(credit_key),bill_total,overdraft_allowed,self.dump_bill(bill))
+        if status == DEDUCTION_MISSING_CREDIT:
+            raise InvalidPurchaseRequestError
+        
+        if status == DEDUCTION_INSUFFICIENT:
+            raise InsufficientCreditsError(current_balance,bill_total,credit_key)
         
-        raise CreditDeductionFailedError
+        if status != DEDUCTION_SUCCESS:
+            raise CreditDeductionFailedError
+
+        self.set_balance(bill,current_balance)
     
     @RedisCreditKeyBuilder
     async def get_credit_balance(self,credit_key:str,redis=None):
@@ -203,6 +205,10 @@ class CostService(BaseService):
         await self.redisService.push(RedisConstant.LIMITER_DB,bill_key,bill,redis=redis)
         return
     
+    @staticmethod
+    def dump_bill(bill:Bill)->str:
+        return json.dumps({k:v for k,v in bill.items() if k not in ('balance_before','balance_after')})
+
     @staticmethod
     def set_balance(bill:Bill, balance:int):
         bill['balance_before'] = balance
@@ -110,8 +110,15 @@ class ObjectS3Service(TempCredentialsDatabaseService):
         return _object
     
     def list_objects(self,prefix: str='',recursive: bool = True,match:str=None,include_version=True,include_delete_marker=True,buckets=MinioConstant.ASSETS_BUCKET):
-        objects = self.client.list_objects(buckets, prefix=prefix, recursive=recursive,include_version=include_version)
-        return [o for o in objects if (self.fileService.file_matching(o.object_name,match) and not o.is_dir and (include_delete_marker or not o.is_delete_marker))]
+        return list(self.iter_objects(prefix,recursive,match,include_version,include_delete_marker,buckets))
+
+    def iter_objects(self,prefix: str='',recursive: bool = True,match:str=None,include_version=True,include_delete_marker=True,buckets=MinioConstant.ASSETS_BUCKET):
+        """
+        Yield the objects as the listing pages are received, the next page is only requested once the current one is consumed
+        """
+        for o in self.client.list_objects(buckets, prefix=prefix, recursive=recursive,include_version=include_version):
+            if self.fileService.file_matching(o.object_name,match) and not o.is_dir and (include_delete_marker or not o.is_delete_marker):
+                yield o
     
     @RunInThreadPool
     async def copy_object(self,source_object_name: str,dest_object_name: str,version_id: str = None,move=False,buckets=MinioConstant.ASSETS_BUCKET):
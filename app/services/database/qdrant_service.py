@@ -1,6 +1,8 @@
 from typing import Any, List, Tuple
 from fastapi import HTTPException
+import sqlite3
 from app.classes.chunk import Chunk
+from app.classes.embedding_batch import BatchEmbedder, EmbeddingCache, StubEmbedding
 from app.classes.embeddings import EmbeddingUsage, EmbeddingWrapper
 from app.definition._service import BaseService, LinkDep, Service
 from app.errors.service_error import BuildFailureError
@@ -67,8 +69,17 @@ class QdrantService(BaseService):
         api_key = embedding_provider.depService.credentials.to_plain()
 
         self.embed_provider = embedding_provider.model.provider
+        model = vector_config.model
+        if self.configService.EMBEDDING_STUB:
+            self.embed_provider = 'stub'
+            model = 'stub'
 
         match self.embed_provider:
+            case 'stub':
+                from app.classes.embedding_batch import StubParseEmbedding
+                self.embedding_search = StubEmbedding(self.dimension)
+                self.embedding_parse = StubParseEmbedding(self.embedding_search)
+
             case 'gemini':
                 raise BuildFailureError('Gemini not supported')
                 embedding = GeminiEmbedding(
@@ -88,11 +99,28 @@ class QdrantService(BaseService):
                 self.embedding_search = OpenAIEmbedding(
                     api_key=api_key,
                     mode=OpenAIEmbeddingMode.SIMILARITY_MODE,
+                    embed_batch_size=vector_config.batch_size,
                     **vector_config.model_dump(include=LLAMA_EMBEDDING_KEYS ),
                 )
             case _:
                 raise BuildFailureError(f"Unsupported embedding provider: {embedding_provider.model.provider}")
 
+        cache = None
+        if self.configService.EMBEDDING_CACHE:
+            try:
+                cache = EmbeddingCache(self.configService.EMBEDDING_CACHE_PATH)
+            except (sqlite3.Error,OSError) as e:
+                print('Embedding Cache:',e.__class__,e)
+
+        self.embedder = BatchEmbedder(
+            self.embedding_search.aget_text_embedding_batch,
+            model,
+            self.dimension,
+            cache,
+            vector_config.batch_size,
+            self.configService.EMBEDDING_CONCURRENCY,
+        )
+
     def _create_llm_client(self):
         from openai import AsyncOpenAI
         from openai.types import CreateEmbeddingResponse
@@ -279,6 +307,12 @@ class QdrantService(BaseService):
                 
             return embedding,usage
     
+    async def embed_texts(self,texts:list[str])->list[list[float]]:
+        """
+        Embed the texts with batched requests, the texts already embedded by the model are served from the cache
+        """
+        return await self.embedder.embed(texts)
+
     @property
     def qdrant_url(self) -> str:
         return f"http://{self.configService.QDRANT_HOST}:6333"
@@ -1,10 +1,12 @@
 import asyncio
 import functools
 import json
-from random import randint
+import time
+from collections import deque
 from typing import Any, Callable, Dict, Self
 from typing_extensions import Literal
 from redis import Redis, ResponseError
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 from app.classes.broker import MessageBroker, json_to_exception
 from app.classes.callbacks import CALLBACKS_CONFIG
 from app.definition._service import DEFAULT_BUILD_STATE, Service
@@ -14,9 +16,10 @@ from app.errors.service_error import BuildFailureError
 from app.services.config_service import ConfigService, UvicornWorkerService
 from app.services.database.base_db_service import BrokerService, ResultBackendService, TempCredentialsDatabaseService
 from app.services.file.file_service import FileService
+from app.services.monitoring_service import MonitoringService
 from app.services.reactive_service import ReactiveService
 from app.services.vault_service import VaultService
-from app.utils.constant import RedisConstant, SubConstant, VaultConstant
+from app.utils.constant import MonitorConstant, RedisConstant, StreamConstant, SubConstant, VaultConstant
 from app.utils.globals import APP_MODE, ApplicationMode
 from app.utils.transformer import none_to_empty_str
 from redis.asyncio import Redis
@@ -42,6 +45,12 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
         self.uvicornWorkerService = uvicornWorkerService
         self.to_shutdown = False
         self.callbacks = CALLBACKS_CONFIG.copy()
+        self.monitoringService:MonitoringService = None
+        self.listener_task:asyncio.Task = None
+
+        self.buffer:deque[tuple[int|str,str,tuple]] = deque()
+        self.buffer_event = asyncio.Event()
+        self.flush_task:asyncio.Task = None
 
         self.consumer_name = f'notifyr-consumer={self.uvicornWorkerService.INSTANCE_ID}'
 
@@ -76,10 +85,98 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
         data = json.dumps(data)
         return self.redis_events.publish(channel,data)
         
-    async def _consume_channel(self,channels,handler:Callable[[Any],MessageBroker|Any|None]):
-        pubsub = self.redis_events.pubsub()
+    def buffer_stream(self,stream:str,data:dict)->bool:
+        if stream not in self.callbacks.keys():
+            raise RedisStreamDoesNotExistsError(stream)
+        
+        if not isinstance(data,dict) or not data:
+            return True
+        none_to_empty_str(data)
+        return self._buffer(RedisConstant.EVENT_DB,'xadd',stream,data)
 
-        if channels not in SubConstant._SUB_CALLBACK:
+    def buffer_publish(self,channel:str,data:Any)->bool:
+        if channel not in self.callbacks.keys():
+            return True
+        return self._buffer(RedisConstant.EVENT_DB,'publish',channel,json.dumps(data))
+
+    def buffer_push(self,database:int|str,name:str,*element:dict)->bool:
+        if database not in self.db:
+            raise RedisDatabaseDoesNotExistsError(database)
+        return self._buffer(database,'lpush',name,*[json.dumps(e) for e in element])
+
+    def _buffer(self,database:int|str,command:str,*args)->bool:
+        """
+        Queue a command for the next pipelined flush. Return `False` when the command must be sent by the caller, either
+        because the flusher is not running or because the buffer reached `REDIS_BUFFER_MAX_SIZE`
+        """
+        if self.flush_task == None or self.to_shutdown:
+            return False
+        if len(self.buffer) >= self.configService.REDIS_BUFFER_MAX_SIZE:
+            return False
+
+        self.buffer.append((database,command,args))
+        if len(self.buffer) == 1 or len(self.buffer) >= self.configService.REDIS_BUFFER_FLUSH_SIZE:
+            self.buffer_event.set()
+        return True
+
+    async def _flush_loop(self):
+        """
+        Flush the buffer when it fills up or `REDIS_BUFFER_FLUSH_INTERVAL` after its first command. Once `to_shutdown` is set
+        the loop ends after a last flush, it is never cancelled in the middle of a pipeline
+        """
+        interval = self.configService.REDIS_BUFFER_FLUSH_INTERVAL/MS_1000
+        while not self.to_shutdown:
+            await self.buffer_event.wait()
+            self.buffer_event.clear()
+            if len(self.buffer) < self.configService.REDIS_BUFFER_FLUSH_SIZE and not self.to_shutdown:
+                try:
+                    await asyncio.wait_for(self.buffer_event.wait(),interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.buffer_event.clear()
+            try:
+                await self.flush_buffer()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print('Broker Flush:',e.__class__.__name__,e)
+
+    async def flush_buffer(self):
+        if not self.buffer:
+            return
+        buffer,self.buffer = self.buffer,deque()
+        start = time.perf_counter()
+
+        pipelines:dict[Redis,list] = {}
+        for database,command,args in buffer:
+            redis = self.db[database]
+            if redis not in pipelines:
+                pipelines[redis] = [redis.pipeline(transaction=False),0]
+            getattr(pipelines[redis][0],command)(*args)
+            pipelines[redis][1]+=1
+
+        failed = 0
+        for pipe,size in pipelines.values():
+            try:
+                results = await pipe.execute(raise_on_error=False)
+            except (RedisConnectionError,RedisTimeoutError) as e:
+                print('Broker Flush:',f'{size} commands lost',e)
+                failed+=size
+                continue
+            for result in results:
+                if isinstance(result,Exception):
+                    print('Broker Flush:',result)
+                    failed+=1
+
+        if self.monitoringService != None:
+            self.monitoringService.histogram_observe(MonitorConstant.BROKER_FLUSH_LATENCY,time.perf_counter()-start)
+            self.monitoringService.counter_inc(MonitorConstant.BROKER_BUFFER_OPS,len(buffer)-failed,outcome='flushed')
+            if failed:
+                self.monitoringService.counter_inc(MonitorConstant.BROKER_BUFFER_OPS,failed,outcome='failed')
+
+    def _channel_handler(self,channel:str,handler:Callable[[Any],MessageBroker|Any|None]):
+
+        if channel not in SubConstant._SUB_CALLBACK:
             def handler_wrapper(message):
                 if message is None:
                     print('No message')
@@ -122,15 +219,66 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
                 except Exception as e:
                     print(e)
                     print(e.__class__)
-                    
 
-        await pubsub.subscribe(**{channels:handler_wrapper}) # TODO Maybe add the function as await
+        return handler_wrapper
+
+    async def _listen_channels(self,queues:dict[str,asyncio.Queue]):
+        """
+        Subscribe every channel on a single connection and wait on `pubsub.listen()` so an idle worker does not wake up.
+        A message is pushed to the bounded queue of its channel: when a handler falls behind, the messages of its channel
+        are dropped until the queue drains while the other channels keep being dispatched. On an error the channels are
+        subscribed again on a new connection.
+        """
+        retry = 0
+        while not self.to_shutdown:
+            pubsub = self.redis_events.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*queues.keys())
+                retry = 0
+                async for message in pubsub.listen():
+                    if message is None or message['type'] != 'message':
+                        continue
+                    queue = queues.get(message['channel'],None)
+                    if queue is None:
+                        continue
+                    try:
+                        queue.put_nowait((time.perf_counter(),message))
+                    except asyncio.QueueFull:
+                        print(f'PubSub: queue of {message["channel"]} is full, message dropped')
+                    if self.to_shutdown:
+                        return
+            except (RedisConnectionError,RedisTimeoutError) as e:
+                print(e)
+                retry+=1
+                await asyncio.sleep(min(2**retry,30))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print('PubSub:',e.__class__,e)
+                retry+=1
+                await asyncio.sleep(min(2**retry,30))
+            finally:
+                await pubsub.close()
 
+    async def _dispatch_channel(self,channel:str,queue:asyncio.Queue,handler_wrapper:Callable):
         while True:
-            await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
-            await asyncio.sleep(0.01)
-            if self.to_shutdown:
-                return
+            received_at,message = await queue.get()
+            waited = time.perf_counter()-received_at
+            try:
+                result = handler_wrapper(message)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(e)
+                print(e.__class__)
+            finally:
+                queue.task_done()
+
+            if self.monitoringService != None:
+                try:
+                    self.monitoringService.histogram_observe(MonitorConstant.PUBSUB_DISPATCH_LATENCY,waited,channel=channel)
+                except Exception as e:
+                    print('PubSub:',e.__class__,e)
 
     async def create_group(self):
 
@@ -143,14 +291,15 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
                 else:
                     ...
 
-    def register_consumer(self,callbacks_sub:dict[str,Callable]={},callbacks_stream:dict[str,Callable]={}):
+    def register_consumer(self,callbacks_sub:dict[str,Callable]={},callbacks_stream:dict[str,Callable]={},monitoringService:MonitoringService=None):
+        self.monitoringService = monitoringService
+        queues:dict[str,asyncio.Queue] = {}
         for stream_name,config in self.callbacks.items():
             is_stream = config['stream']
             is_sub = config['sub']
             if is_stream:
                 count = config.get('count',MS_1000)
                 block = config.get('block',MS_1000)
-                wait = config.get('wait',60)
             config.update ({
                 'channel_tasks':None,
                 'stream_tasks':None
@@ -158,27 +307,131 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
 
             if is_sub:
                 channel_callback = callbacks_sub.get(stream_name,lambda v:print(v))# Print later
-                config['channel_tasks']= asyncio.create_task(self._consume_channel(stream_name,channel_callback))
+                queues[stream_name] = asyncio.Queue(self.configService.REDIS_PUBSUB_QUEUE_SIZE)
+                config['channel_tasks']= asyncio.create_task(self._dispatch_channel(stream_name,queues[stream_name],self._channel_handler(stream_name,channel_callback)))
             
             if is_stream:
                 stream_callback = callbacks_stream.get(stream_name,None)
-                config['stream_tasks'] =asyncio.create_task(self._consume_stream(stream_name,count,block,wait,stream_callback))           
-
-    async def _consume_stream(self,stream_name,count,block,wait,handler:Callable[[dict[str,Any]],list]):
-        while True:
-            await asyncio.sleep(wait+(randint(10,50)))
+                if stream_callback is None:
+                    continue
+                config['stream_tasks'] =asyncio.create_task(self._consume_stream(stream_name,count,block,stream_callback))           
+
+        if queues:
+            self.listener_task = asyncio.create_task(self._listen_channels(queues))
+
+        self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _consume_stream(self,stream_name,count,block,handler:Callable[[list[tuple[str,dict[str,Any]]]],list]):
+        """
+        Consume the stream with a blocking XREADGROUP so an event is handled as soon as it is published.
+
+        The batch size doubles up to `count` while the backlog is larger than the batch and halves back to `REDIS_STREAM_MIN_COUNT`
+        when the reads come back partially filled. An empty read doubles the block timeout up to `REDIS_STREAM_MAX_BLOCK`.
+        Entries pending for more than `REDIS_STREAM_CLAIM_IDLE` ms, left by a dead consumer or a failed handler, are reclaimed with XAUTOCLAIM.
+        An entry delivered more than `REDIS_STREAM_MAX_DELIVERIES` times is moved to the dead-letter stream instead of being handled again.
+        """
+        min_count = min(self.configService.REDIS_STREAM_MIN_COUNT,count)
+        max_block = max(block,self.configService.REDIS_STREAM_MAX_BLOCK)
+        batch = min_count
+        current_block = block
+        claim_cursor = '0-0'
+
+        while not self.to_shutdown:
             try:
-                response = await self.redis_events.xreadgroup(self.GROUP,self.consumer_name, {stream_name: '>'}, count=count, block=block)
-                if response:
-                    for stream, entries in response:
-                        entry_ids = await handler(entries)
-                        await self.redis_events.xack(stream_name, self.GROUP, *entry_ids)
-                        await self.redis_events.xdel(stream_name,*entry_ids )
-            except:
-                ...
-            finally:
-                if self.to_shutdown:
-                    return
+                backlog,pending = await self._stream_backlog(stream_name)
+                if pending > 0:
+                    claim_cursor = await self._claim_stream(stream_name,claim_cursor,batch,handler)
+
+                response = await self.redis_events.xreadgroup(self.GROUP,self.consumer_name, {stream_name: '>'}, count=batch, block=current_block)
+                entries = [entry for _,stream_entries in response for entry in stream_entries] if response else []
+                if not entries:
+                    batch = max(min_count,batch//2)
+                    current_block = min(max_block,current_block*2)
+                    continue
+
+                current_block = block
+                await self._process_entries(stream_name,entries,handler)
+
+                if len(entries) >= batch and backlog > batch:
+                    batch = min(count,batch*2)
+                elif len(entries) < batch//2:
+                    batch = max(min_count,batch//2)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(e)
+                await asyncio.sleep(1)
+
+    async def _stream_backlog(self,stream_name:str)->tuple[int,int]:
+        async with self.redis_events.pipeline(transaction=False) as pipe:
+            pipe.xlen(stream_name)
+            pipe.xpending(stream_name,self.GROUP)
+            backlog,pending = await pipe.execute()
+        
+        pending = pending['pending'] if pending else 0
+        if self.monitoringService != None:
+            # NOTE acknowledged entries are deleted, so the length of the stream is the backlog of the group
+            self.monitoringService.gauge_set(MonitorConstant.STREAM_BACKLOG,backlog,stream=stream_name)
+            self.monitoringService.gauge_set(MonitorConstant.STREAM_PENDING,pending,stream=stream_name)
+        return backlog,pending
+
+    async def _claim_stream(self,stream_name:str,start_id:str,count:int,handler:Callable)->str:
+        next_id,entries,*_ = await self.redis_events.xautoclaim(stream_name,self.GROUP,self.consumer_name,self.configService.REDIS_STREAM_CLAIM_IDLE,start_id=start_id,count=count)
+        # NOTE redis 6.2 returns the entries deleted since their delivery as nil
+        entries = [(entry_id,fields) for entry_id,fields in entries if fields is not None]
+        if entries:
+            entries = await self._dead_letter(stream_name,entries)
+        if entries:
+            await self._process_entries(stream_name,entries,handler)
+        return next_id
+
+    async def _dead_letter(self,stream_name:str,entries:list[tuple[str,dict]])->list[tuple[str,dict]]:
+        """
+        Move the claimed entries delivered more than `REDIS_STREAM_MAX_DELIVERIES` times to `StreamConstant.DEAD_LETTER_STREAM`
+        with their id and delivery count, and return the other ones
+        """
+        async with self.redis_events.pipeline(transaction=False) as pipe:
+            for entry_id,_ in entries:
+                pipe.xpending_range(stream_name,self.GROUP,min=entry_id,max=entry_id,count=1)
+            pendings = await pipe.execute()
+
+        max_deliveries = self.configService.REDIS_STREAM_MAX_DELIVERIES
+        kept,poisoned = [],[]
+        for (entry_id,fields),pending in zip(entries,pendings):
+            deliveries = pending[0]['times_delivered'] if pending else 0
+            if deliveries > max_deliveries:
+                poisoned.append((entry_id,fields,deliveries))
+            else:
+                kept.append((entry_id,fields))
+
+        if poisoned:
+            dead_letter_stream = StreamConstant.DEAD_LETTER_STREAM(stream_name)
+            async with self.redis_events.pipeline(transaction=True) as pipe:
+                for entry_id,fields,deliveries in poisoned:
+                    pipe.xadd(dead_letter_stream,{**fields,'dead_letter_id':entry_id,'dead_letter_deliveries':deliveries})
+                entry_ids = [entry_id for entry_id,*_ in poisoned]
+                pipe.xack(stream_name,self.GROUP,*entry_ids)
+                pipe.xdel(stream_name,*entry_ids)
+                await pipe.execute()
+
+            print('Stream',stream_name,':',len(poisoned),'entries moved to',dead_letter_stream)
+            if self.monitoringService != None:
+                self.monitoringService.counter_inc(MonitorConstant.STREAM_DEAD_LETTER,len(poisoned),stream=stream_name)
+        return kept
+
+    async def _process_entries(self,stream_name:str,entries:list[tuple[str,dict]],handler:Callable):
+        entry_ids = await handler(entries)
+        if entry_ids:
+            async with self.redis_events.pipeline(transaction=False) as pipe:
+                pipe.xack(stream_name, self.GROUP, *entry_ids)
+                pipe.xdel(stream_name,*entry_ids)
+                await pipe.execute()
+
+        if self.monitoringService != None:
+            now = time.time()
+            latencies = [now - int(entry_id.split('-',1)[0])/MS_1000 for entry_id,_ in entries]
+            self.monitoringService.histogram_observe_many(MonitorConstant.STREAM_EVENT_LATENCY,latencies,stream=stream_name)
 
     @staticmethod
     def check_db(func:Callable):
@@ -203,6 +456,10 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
         if self.configService.BROKER_PROVIDER == 'redis':
             self.broker_creds = self.vaultService.database_engine.generate_credentials(VaultConstant.CELERY_BACKEND_ROLE)
 
+        if APP_MODE == ApplicationMode.server:
+            # NOTE the limiter storage runs its sliding window scripts, the app role is not allowed to
+            self.limiter_creds = self.vaultService.database_engine.generate_credentials(VaultConstant.REDIS_LIMITER_ROLE)
+
         self.redis_celery = Redis(host=self.configService.REDIS_HOST,db=RedisConstant.CELERY_DB,username=self.backend_creds['data']['username'],password=self.backend_creds['data']['password'])
         self.redis_limiter = Redis(host=NOTIFYR_HOST,db=RedisConstant.LIMITER_DB,username=self.db_user,password=self.db_password)
         self.redis_cache = Redis(host=NOTIFYR_HOST,db=RedisConstant.CACHE_DB,decode_responses=True,username=self.db_user,password=self.db_password)
@@ -246,6 +503,8 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
             self.vaultService.revoke_lease(self.broker_creds['lease_id'])
 
         self.vaultService.revoke_lease(self.backend_creds['lease_id'])
+        if APP_MODE == ApplicationMode.server:
+            self.vaultService.revoke_lease(self.limiter_creds['lease_id'])
         return super().revoke_lease()
 
     @check_db
@@ -256,6 +515,15 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
             expiry = None
         return await redis.set(key,value,ex=expiry,get=True,nx=nx,xx=xx)
     
+    @check_db
+    async def store_many(self,database:int|str,items:list[tuple[str,Any,int]],nx:bool=False,redis:Redis=None):
+        async with redis.pipeline(transaction=False) as pipe:
+            for key,value,expiry in items:
+                if isinstance(value,(dict,list)):
+                    value = json.dumps(value)
+                pipe.set(key,value,ex=expiry if expiry > 0 else None,nx=nx)
+            return await pipe.execute()
+
     @check_db
     async def retrieve(self,database:int|str,key:str,redis:Redis=None):
         value = await redis.get(key)
@@ -264,6 +532,23 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
         value = json.loads(value)
         return value
     
+    @check_db
+    async def retrieve_many(self,database:int|str,keys:list[str],redis:Redis=None)->list[Any]:
+        values = await redis.mget(keys)
+        return [json.loads(value) if isinstance(value,str) else value for value in values]
+
+    @check_db
+    async def retrieve_many_with_ttl(self,database:int|str,keys:list[str],redis:Redis=None)->list[tuple[Any,float]]:
+        """
+        The values of `keys` with their remaining time to live in seconds, 0 when the key does not expire
+        """
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.mget(keys)
+            for key in keys:
+                pipe.pttl(key)
+            values,*ttls = await pipe.execute()
+        return [(json.loads(value) if isinstance(value,str) else value,ttl/1000 if ttl > 0 else 0) for value,ttl in zip(values,ttls)]
+
     @check_db
     async def delete(self,database:int|str,key:str,redis:Redis=None):
         return await redis.delete(key)
@@ -308,6 +593,18 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
         return await redis.append(key,data)
         
     async def close_connections(self,):
+        if self.listener_task:
+            self.listener_task.cancel()
+        if self.flush_task:
+            # NOTE wake the flusher so it ends after the pipeline in flight, the commands it had not taken are flushed here
+            self.to_shutdown = True
+            self.buffer_event.set()
+            try:
+                await self.flush_task
+            except Exception as e:
+                print('Broker Flush:',e.__class__.__name__,e)
+            self.flush_task = None
+            await self.flush_buffer()
         for config in self.callbacks.values():
             if 'channel_tasks' in config and  config['channel_tasks']:
                 config['channel_tasks'].cancel()
@@ -352,6 +649,13 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
     async def range(self,database:int|str,name:str,start:int,stop:int,redis:Redis=None):
         return await redis.lrange(name,start,stop)
 
+    @check_db
+    async def length(self,database:int|str,*names:str,redis:Redis=None)->int:
+        async with redis.pipeline(transaction=False) as pipe:
+            for name in names:
+                pipe.llen(name)
+            return sum(await pipe.execute())
+
     @check_db
     async def rem(self,database:int|str,name:str,*keys:str,redis:Redis=None):
         return await redis.zrem(name,*keys)
@@ -359,6 +663,9 @@ class RedisService(TempCredentialsDatabaseService,ResultBackendService,BrokerSer
     def compute_backend_url(self,db=RedisConstant.CELERY_DB)->str:
         return f"redis://{self.backend_creds['data']['username']}:{self.backend_creds['data']['password']}@{self.configService.REDIS_HOST}:6379/{db}"
 
+    def compute_limiter_url(self,scheme:str='redis')->str:
+        return f"{scheme}://{self.limiter_creds['data']['username']}:{self.limiter_creds['data']['password']}@{NOTIFYR_HOST}:6379/{RedisConstant.LIMITER_DB}"
+
     def compute_broker_url(self)->str:
         if self.configService.BROKER_PROVIDER == 'redis':
             return f"redis://{self.broker_creds['data']['username']}:{self.broker_creds['data']['password']}@{self.configService.REDIS_HOST}:6379/{RedisConstant.CELERY_DB}"
@@ -1,7 +1,8 @@
+import functools
 from typing import Callable, Literal
 from urllib.parse import urlparse
 from fastapi import HTTPException, Request, Response, status
-from app.classes.template import HTMLTemplate
+from app.classes.template import URL_PATTERN, HTMLTemplate
 from app.definition._service import BaseService, BuildFailureError, Service, ServiceStatus
 from app.models.link_model import LinkORM, QRCodeModel
 from app.services.config_service import ConfigService
@@ -11,37 +12,18 @@ from app.services.reactive_service import ReactiveService
 import qrcode as qr
 import io
 from app.services.security_service import SecurityService
-from app.utils.constant import SECONDS_IN_AN_HOUR
+from app.utils.constant import RedisConstant
 from app.utils.helper import b64_encode, generateId
-import aiohttp
-import json
-from app.utils.tools import Cache, MyJSONCoder
+from app.classes.geo_resolver import MAXMIND_INSTALLED, CachedGeoResolver, GeoData, GeoResolver, IPInfoGeoResolver, MMDBGeoResolver
+from pathlib import Path
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
-import re
-from fastapi_cache.decorator import cache
-
-def ip_lookup_key_builder(
-    func: Callable,
-    namespace: str = "",
-    *,
-    request: Request = None,
-    response: Response = None,
-    **kwargs,
-):
-    args = kwargs.get('args', [])
-    return "-".join([
-        namespace,
-        func.__name__,
-        args[1]
-    ])
-
-
 
 @Service()
 class LinkService(BaseService):
 
-    def __init__(self, configService: ConfigService, securityService: SecurityService,tortoiseConnService:TortoiseConnectionService):
+    def __init__(self, configService: ConfigService, securityService: SecurityService,tortoiseConnService:TortoiseConnectionService,redisService:RedisService):
         super().__init__()
+        self.redisService = redisService
 
         self.tortoiseConnService = tortoiseConnService
         self.configService = configService
@@ -51,7 +33,27 @@ class LinkService(BaseService):
         self.IPINFO_API_KEY = self.configService['IPINFO_API_KEY']
 
     def build(self,build_state=-1):
-        ...
+        self.geoResolver = CachedGeoResolver(
+            self._create_geo_resolver(),
+            self.configService.GEOIP_CACHE_SIZE,
+            functools.partial(self.redisService.retrieve,RedisConstant.CACHE_DB),
+            functools.partial(self.redisService.store,RedisConstant.CACHE_DB),
+            self.configService.GEOIP_CACHE_TTL,
+            functools.partial(self.redisService.retrieve_many,RedisConstant.CACHE_DB),
+            functools.partial(self.redisService.store_many,RedisConstant.CACHE_DB),
+        )
+
+    def _create_geo_resolver(self)->GeoResolver:
+        provider = self.configService.GEOIP_PROVIDER
+        if provider == 'mmdb':
+            if MAXMIND_INSTALLED and Path(self.configService.GEOIP_DATABASE_PATH).exists():
+                return MMDBGeoResolver(self.configService.GEOIP_DATABASE_PATH)
+            provider = 'ipinfo'
+        
+        if provider == 'ipinfo' and self.IPINFO_API_KEY:
+            return IPInfoGeoResolver(self.IPINFO_API_KEY)
+        
+        return GeoResolver()
 
     def verify_dependency(self):
         if self.tortoiseConnService.service_status != ServiceStatus.AVAILABLE:
@@ -69,55 +71,32 @@ class LinkService(BaseService):
         contact_id = link_query.server_scoped.get("contact_id", None)
         referrer = request.headers.get('referrer', None)
 
-        ip_lookup: dict | None = await self.ip_lookup(client_ip)
-        if ip_lookup != None:
-            loc: str = ip_lookup.get('loc', None)
-            if loc == None:
-                lat, long = None, None
-            else:
-                lat, long = loc.split(',')
-            ip_data = {
-                'country': ip_lookup.get('country', None),
-                'geo_lat': float(lat) if lat != None else None,
-                'geo_long': float(long) if long != None else None,
-                'region': ip_lookup.get('region', None),
-                'city': ip_lookup.get('city', None),
-                'timezone': ip_lookup.get('timezone', None),
-                'referrer': referrer,
-            }
-        else:
-            ip_data = {}
-
-        return {
+        info = {
             'link_id': str(link_id),
             'user_agent': user_agent,
             'ip_address': client_ip,
             'link_path': path,
             'email_id': message_id,
             'contact_id': contact_id,
-            **ip_data
-        }
-
-    @Cache('fastapi-cache')(SECONDS_IN_AN_HOUR*2,coder=MyJSONCoder,key_builder=ip_lookup_key_builder, namespace="")
-    async def ip_lookup(self, ip_address):
-        headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.IPINFO_API_KEY}"
+            'referrer': referrer,
         }
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(f"https://ipinfo.io/{ip_address}", headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data
-                    else:
-                        {}
-            except aiohttp.ClientError as e:
-                return {}
-            except aiohttp.ConnectionTimeoutError as e:
-                return {}
-            except Exception:
-                return {}
+        if not self.configService.GEOIP_DEFER:
+            # NOTE when deferred the consumer of the link event stream resolves the location with `resolve_geo`
+            await self.resolve_geo(info)
+        return info
+
+    async def resolve_geo(self, info: dict):
+        geo_data: GeoData | None = await self.geoResolver.resolve(info.get('ip_address', None))
+        if geo_data != None:
+            info.update(geo_data)
+        return info
+
+    async def resolve_geo_many(self, infos: list[dict]):
+        geo_data: list[GeoData | None] = await self.geoResolver.resolve_many([info.get('ip_address', None) for info in infos])
+        for info, data in zip(infos, geo_data):
+            if data != None:
+                info.update(data)
+        return infos
 
     async def generate_qr_code(self, full_url: str, qr_config: QRCodeModel):
         """
@@ -176,43 +155,45 @@ class LinkService(BaseService):
         else:
             return url
 
+    def redirect_url(self, original_url: str) -> str:
+        parsed_url = urlparse(original_url)
+        if parsed_url.netloc == urlparse(self.BASE_URL("")).netloc:
+            # If the netloc matches the base URL, use only the path and query
+            return urlunparse(("", "", parsed_url.path, parsed_url.params, parsed_url.query, ""))
+        return original_url
+
+    def tracking_link(self, redirect_url: str, message_tracking_id, contact_id=None, add_params:dict={}) -> str:
+        # Construct the new tracking URL
+        query_params = {}
+        if contact_id:
+            query_params['contact_id'] = contact_id
+
+        if add_params:
+            query_params.update(add_params)
+
+        query_params.update({
+            "message_id": message_tracking_id,
+            "r": redirect_url
+        })
+        return self.BASE_URL(f"/link/t/?{urlencode(query_params,encoding='utf-8')}")
+
+    def create_tracking_links(self, redirect_urls: list[str], message_tracking_id, contact_id=None, add_params:dict={}) -> list[str]:
+        """
+        Build the tracking links of one recipient from the redirect urls resolved once with `redirect_url`
+        """
+        return [self.tracking_link(url,message_tracking_id,contact_id,add_params) for url in redirect_urls]
+
     def create_link_re(self, message_tracking_id, contact_id=None, add_params:dict={}) -> Callable[[str], str]:
 
         def callback(content: str) -> str:
-            esp = add_params.get('esp',None)
             if content == None:
                 return None
 
             def _replace_link(match):
-                original_url = match.group(0)
-                parsed_url = urlparse(original_url)
-                redirect_url = original_url
-
-                if parsed_url.netloc == urlparse(self.BASE_URL("")).netloc:
-                    # If the netloc matches the base URL, use only the path and query
-                    redirect_url = urlunparse(
-                        ("", "", parsed_url.path, parsed_url.params, parsed_url.query, ""))
-
-                # Construct the new tracking URL
-                query_params = {}
-                if contact_id:
-                    query_params['contact_id'] = contact_id
-
-                if add_params:
-                    query_params.update(add_params)
-
-                query_params.update({
-                    "message_id": message_tracking_id,
-                    "r": redirect_url
-                })
-                tracking_url = self.BASE_URL(
-                    f"/link/t/?{urlencode(query_params,encoding='utf-8')}")
-                # Debugging the tracking URL
-                return tracking_url
+                return self.tracking_link(self.redirect_url(match.group(0)),message_tracking_id,contact_id,add_params)
 
             # Regex to match URLs in the content
-            url_pattern = r'https?://[^\s"<>()]+'
-            new_content = re.sub(url_pattern, _replace_link, content)
+            new_content = URL_PATTERN.sub(_replace_link, content)
             return new_content
 
         return callback
@@ -25,6 +25,7 @@ from app.utils.tools import Time,Mock
 
 from app.utils.constant import EmailHostConstant
 from app.classes.email import EmailBuilder, EmailMetadata, EmailReader, NotSameDomainEmailError, extract_email_id_from_msgid
+from app.classes.smtp_pool import PooledSMTPConnection, SMTPConnectionPool, SMTPPoolClosedError, SMTPPoolTimeoutError, pipelined_sendmail
 
 from ...logger_service import LoggerService
 from app.definition import _service
@@ -62,7 +63,11 @@ class BaseEmailService(_service.BaseMiniService, ProfileEventInterface):
         self.type_: Literal['IMAP', 'SMTP'] = None
     
     @staticmethod
-    def Lifecycle(pref: Literal['async', 'sync'] = None,build:bool =False):
+    def Lifecycle(pref: Literal['async', 'sync'] = None,build:bool =False,pooled:bool=False):
+        """
+        Open, authenticate and close a connection around the call. When `pooled` is set, the decorated function
+        borrows its own connections from the service pool and no connector is injected.
+        """
 
         if APP_MODE != ApplicationMode.server:
             pref = 'sync'
@@ -77,6 +82,9 @@ class BaseEmailService(_service.BaseMiniService, ProfileEventInterface):
             @functools.wraps(func)
             def wrapper(*args,**kwargs):
                 self: Self = args[0]
+                if pooled:
+                    return func(*args,**kwargs)
+
                 connector = self.connect(build)
                 if connector == None:
                     return
@@ -176,6 +184,7 @@ class SMTPEmailMiniService(BaseEmailService,EmailSendInterface):
         EmailSendInterface.__init__(self,self.depService.model.email_address,self.depService.model.disposition_notification_to,self.depService.model.return_receipt_to)
         self.type_ = 'SMTP'
         self.log_level = self.SMTP_LOG_LEVEL
+        self.pool: SMTPConnectionPool = None
         
     def logout(self, connector: smtp.SMTP,build:bool):
         try:
@@ -263,87 +272,176 @@ class SMTPEmailMiniService(BaseEmailService,EmailSendInterface):
             self.oauth_connect()
 
         self.verify_connection()
+        self.build_pool()
+
+    def destroy(self, destroy_state=-1):
+        if self.pool != None:
+            self.pool.close()
+            self.pool = None
+        super().destroy(destroy_state)
+
+    def _open_pooled_connection(self)->smtp.SMTP|None:
+        connector = self.connect(False)
+        if connector == None:
+            return None
+
+        if not self.authenticate(connector,False):
+            self.logout(connector,False)
+            return None
+        return connector
+
+    def build_pool(self):
+        if self.pool != None:
+            self.pool.close()
+
+        self.pool = SMTPConnectionPool(
+            self._open_pooled_connection,
+            lambda connector:self.logout(connector,False),
+            min_size=self.configService.SMTP_POOL_MIN_SIZE,
+            max_size=self.configService.SMTP_POOL_MAX_SIZE,
+            idle_ttl=self.configService.SMTP_POOL_IDLE_TTL,
+            max_messages=self.configService.SMTP_POOL_MAX_MESSAGES,
+            timeout=self.configService.SMTP_POOL_TIMEOUT
+        )
 
     @Mock()
     @ProfileEventInterface.EventWrapper
-    @BaseEmailService.Lifecycle('async')
-    def sendTemplateEmail(self, data, meta, images,contact_id=None,profile:str=None, connector: smtp.SMTP = None,):
+    @BaseEmailService.Lifecycle('async',pooled=True)
+    def sendTemplateEmail(self, data, meta, images,contact_id=None,profile:str=None):
         meta = EmailMetadata(**meta)
         email = EmailBuilder(data, meta, images)
-        return self._send_message(email, contact_ids=contact_id, connector=connector)
+        return self._send_message(email, contact_ids=contact_id)
 
     @Mock()
     @ProfileEventInterface.EventWrapper
-    @BaseEmailService.Lifecycle('async')
-    def sendCustomEmail(self, content, meta, images, attachment,contact_id=None,profile:str=None, connector: smtp.SMTP = None):
+    @BaseEmailService.Lifecycle('async',pooled=True)
+    def sendCustomEmail(self, content, meta, images, attachment,contact_id=None,profile:str=None):
         meta = EmailMetadata(**meta)
         email = EmailBuilder(content, meta, images, attachment)
-        return self._send_message(email, contact_ids=contact_id, connector=connector)
+        return self._send_message(email, contact_ids=contact_id)
 
-    @BaseEmailService.Lifecycle('async')
-    def reply_to_an_email(self, content, meta, images, attachment, reply_to, references, connector: smtp.SMTP = None, contact_ids:list[str]=None):
+    @BaseEmailService.Lifecycle('async',pooled=True)
+    def reply_to_an_email(self, content, meta, images, attachment, reply_to, references, contact_ids:list[str]=None):
         meta = EmailMetadata(**meta)
         email = EmailBuilder(content, meta, images, attachment)
         # TODO add references and reply_to
 
         # if APP_MODE == CeleryMode.none:
         #     return await self._send_message(email, message_tracking_id, contact_id=contact_id)
-        return self._send_message(email,contact_ids=contact_ids, connector=connector)
+        return self._send_message(email,contact_ids=contact_ids)
+
+    def _connect_direct(self)->PooledSMTPConnection|None:
+        connector = self._open_pooled_connection()
+        if connector == None:
+            return None
+        return PooledSMTPConnection(connector,direct=True)
+
+    def _borrow(self,pooled:PooledSMTPConnection|None)->PooledSMTPConnection:
+        pool = self.pool
+        if pooled != None and (pooled.direct or pool == None):
+            if pooled.messages < self.configService.SMTP_POOL_MAX_MESSAGES:
+                return pooled
+            self._release(pooled)
+            pooled = None
+
+        if pool == None:
+            # NOTE the profile was built without a pool or is being destroyed
+            pooled = self._connect_direct()
+        else:
+            try:
+                pooled = pool.rotate(pooled)
+            except SMTPPoolTimeoutError:
+                pooled = None
+            except SMTPPoolClosedError:
+                pooled = self._connect_direct()
+
+        if pooled == None:
+            raise smtp.SMTPServerDisconnected('No SMTP connection available')
+        return pooled
+
+    def _release(self,pooled:PooledSMTPConnection|None,discard:bool=False):
+        if pooled == None:
+            return
 
-    def _send_message(self, email: EmailBuilder, connector: smtp.SMTP, contact_ids:list[ str] = []):
+        pool = self.pool
+        if pooled.direct or pool == None:
+            self.logout(pooled.connector,False)
+        else:
+            pool.release(pooled,discard)
+
+    def _sendmail(self,pooled:PooledSMTPConnection,from_addr:str,to_addrs:str|list[str],message:bytes):
+        pooled.messages+=1
+        return pipelined_sendmail(pooled.connector, from_addr, to_addrs, message, rcpt_options=['NOTIFY=SUCCESS,FAILURE,DELAY'])
+
+    def _send_message(self, email: EmailBuilder, contact_ids:list[ str] = []):
         replies = []
         events = []
-        for i,(emailID, message) in enumerate(email.create_for_recipient()):
-
-            try:
-                event_id = str(uuid_v1_mc())
-                now = datetime.now(timezone.utc).isoformat()
-                reply_ = None
-                reply_ = connector.sendmail(email.emailMetadata.From, email.To[i], message, rcpt_options=['NOTIFY=SUCCESS,FAILURE,DELAY'])
-                email_status = EmailStatus.SENT.value
-                description = "Email successfully sent."
-
-            except smtp.SMTPRecipientsRefused as e:
-                email_status = EmailStatus.BLOCKED.value
-                description = "Email blocked due to recipient refusal."
+        pooled: PooledSMTPConnection = None
+        try:
+            for i,(emailID, message) in enumerate(email.create_encoded_for_recipient()):
+
+                try:
+                    event_id = str(uuid_v1_mc())
+                    now = datetime.now(timezone.utc).isoformat()
+                    reply_ = None
+                    pooled = self._borrow(pooled)
+                    try:
+                        reply_ = self._sendmail(pooled,email.emailMetadata.From, email.To[i], message)
+                    except smtp.SMTPServerDisconnected:
+                        # The pooled connection was dropped by the server, reconnect once
+                        self._release(pooled,discard=True)
+                        pooled = None
+                        pooled = self._borrow(None)
+                        reply_ = self._sendmail(pooled,email.emailMetadata.From, email.To[i], message)
+                    email_status = EmailStatus.SENT.value
+                    description = "Email successfully sent."
+
+                except smtp.SMTPRecipientsRefused as e:
+                    email_status = EmailStatus.BLOCKED.value
+                    description = "Email blocked due to recipient refusal."
             
-            except smtp.SMTPDataError as e:
-                email_status = EmailStatus.FAILED.value
-                description = "Email failed due to error in the message"
-
-            except smtp.SMTPSenderRefused as e:
-                self.service_status = _service.ServiceStatus.WORKS_ALMOST_ATT
-                email_status = EmailStatus.FAILED.value
-                description = "Email failed due to sender refusal."
-
-            except smtp.SMTPNotSupportedError as e:
-                raise BuildFailureError
-                email_status = EmailStatus.FAILED.value
-                description = "Email failed due to unsupported SMTP operation."
-
-            except smtp.SMTPServerDisconnected as e:
-                email_status = EmailStatus.FAILED.value
-                description = "Email failed due to server disconnection."
-
-                print('Server disconnected')
-                print(e)
-                self._builded = False
-                self.service_status = _service.ServiceStatus.TEMPORARY_NOT_AVAILABLE
-
-            finally:
-                if get_value_in_list(email.emailMetadata._X_Email_ID,i):
-                    event = TrackingEmailEventORM.JSON(
-                        description=description,
-                        event_id=event_id,
-                        email_id=email.emailMetadata._X_Email_ID[i],
-                        #contact_id=contact_ids[i] if i in contact_ids else  None,
-                        current_event=email_status,
-                        date_event_received=now,
-                        # VERIFY if To is a list then put it in the for loop
-                        esp_provider=get_email_provider_name(email.emailMetadata.To[i]))
-                    events.append(event)
-
-                replies.append( {"emailID": emailID,"status": reply_})
+                except smtp.SMTPDataError as e:
+                    email_status = EmailStatus.FAILED.value
+                    description = "Email failed due to error in the message"
+
+                except smtp.SMTPSenderRefused as e:
+                    self.service_status = _service.ServiceStatus.WORKS_ALMOST_ATT
+                    email_status = EmailStatus.FAILED.value
+                    description = "Email failed due to sender refusal."
+
+                except smtp.SMTPNotSupportedError as e:
+                    raise BuildFailureError
+                    email_status = EmailStatus.FAILED.value
+                    description = "Email failed due to unsupported SMTP operation."
+
+                except smtp.SMTPServerDisconnected as e:
+                    email_status = EmailStatus.FAILED.value
+                    description = "Email failed due to server disconnection."
+
+                    print('Server disconnected')
+                    print(e)
+                    self._release(pooled,discard=True)
+                    pooled = None
+                    self._builded = False
+                    self.service_status = _service.ServiceStatus.TEMPORARY_NOT_AVAILABLE
+
+                finally:
+                    if get_value_in_list(email.emailMetadata._X_Email_ID,i):
+                        event = TrackingEmailEventORM.JSON(
+                            description=description,
+                            event_id=event_id,
+                            email_id=email.emailMetadata._X_Email_ID[i],
+                            #contact_id=contact_ids[i] if i in contact_ids else  None,
+                            current_event=email_status,
+                            date_event_received=now,
+                            # VERIFY if To is a list then put it in the for loop
+                            esp_provider=get_email_provider_name(email.emailMetadata.To[i]))
+                        events.append(event)
+
+                    replies.append( {"emailID": emailID,"status": reply_})
+
+        finally:
+            self._release(pooled)
 
         return replies, (StreamConstant.EMAIL_EVENT_STREAM, events), {}
 
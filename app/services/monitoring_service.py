@@ -27,6 +27,18 @@ class MonitoringService(BaseService):
             self.connection_total = Counter('total_http_connections','Total Request Received')
             self.background_task_count = Gauge('background_task','Active Background Working Task')
             self.route_task_count = Gauge('route_task','Active Task Handled by the Route Handler')
+            self.stream_event_latency = Histogram('redis_stream_event_latency_seconds','Delay between the publication of a stream event and its processing',['stream'],buckets=(.05,.1,.5,1,5,15,30,60,120,300,900))
+            self.stream_backlog = Gauge('redis_stream_backlog','Entries not yet acknowledged in the stream',['stream'])
+            self.stream_pending = Gauge('redis_stream_pending','Entries delivered to a consumer but not yet acknowledged',['stream'])
+            self.pubsub_dispatch_latency = Histogram('redis_pubsub_dispatch_latency_seconds','Delay between the reception of a pubsub message and the call of its handler',['channel'],buckets=(.0005,.001,.005,.01,.05,.1,.5,1,5))
+            self.orm_cache_lookup = Counter('orm_cache_lookup','ORM cache lookups by tier (l1, l2 or miss)',['cache','tier'])
+            self.broker_request_ops = Histogram('broker_request_redis_ops','Redis commands issued by the broker for a single request',buckets=(1,2,5,10,50,100,500,1000,5000,10000))
+            self.broker_flush_latency = Histogram('broker_flush_latency_seconds','Duration of a broker buffer flush',buckets=(.001,.005,.01,.05,.1,.5,1,5))
+            self.broker_buffer_ops = Counter('broker_buffer_ops','Broker Redis commands by outcome (flushed, failed or fallback)',['outcome'])
+            self.jwt_decode_cache = Counter('jwt_decode_cache','Decoded token cache lookups by result (hit or miss)',['result'])
+            self.user_agent_cache = Counter('user_agent_cache','Parsed user agent cache lookups by result (hit or miss)',['result'])
+            self.stream_dead_letter = Counter('redis_stream_dead_letter','Entries moved to the dead-letter stream after too many deliveries',['stream'])
+            self.limiter_storage_fallback = Gauge('limiter_storage_fallback','1 while the rate limiter counts in memory because its Redis storage is unreachable')
 
             self.monitors={
                 'connection_count': self.connection_count,
@@ -39,6 +51,18 @@ class MonitoringService(BaseService):
                 MonitorConstant.CONNECTION_TOTAL: self.connection_total,
                 MonitorConstant.BACKGROUND_TASK_COUNT: self.background_task_count,
                 MonitorConstant.CONNECTION_COUNT: self.connection_count,
+                MonitorConstant.STREAM_EVENT_LATENCY: self.stream_event_latency,
+                MonitorConstant.STREAM_BACKLOG: self.stream_backlog,
+                MonitorConstant.STREAM_PENDING: self.stream_pending,
+                MonitorConstant.PUBSUB_DISPATCH_LATENCY: self.pubsub_dispatch_latency,
+                MonitorConstant.ORM_CACHE_LOOKUP: self.orm_cache_lookup,
+                MonitorConstant.BROKER_REQUEST_OPS: self.broker_request_ops,
+                MonitorConstant.BROKER_FLUSH_LATENCY: self.broker_flush_latency,
+                MonitorConstant.BROKER_BUFFER_OPS: self.broker_buffer_ops,
+                MonitorConstant.JWT_DECODE_CACHE: self.jwt_decode_cache,
+                MonitorConstant.USER_AGENT_CACHE: self.user_agent_cache,
+                MonitorConstant.LIMITER_STORAGE_FALLBACK: self.limiter_storage_fallback,
+                MonitorConstant.STREAM_DEAD_LETTER: self.stream_dead_letter,
             }
         except:
             raise BuildWarningError  
@@ -55,7 +79,7 @@ class MonitoringService(BaseService):
                 raise KeyError
             monitor = self.monitors[key]
             try:
-                return func(monitor,*args,**kwargs)
+                return func(self,monitor,*args,**kwargs)
             except AttributeError:
                 return        
         return wrapper
@@ -69,9 +93,26 @@ class MonitoringService(BaseService):
         return gauge.dec(amount)
     
     @MonitorDecorator
-    def counter_inc(self,counter):
-        return counter.inc()
+    def counter_inc(self,counter,amount=1,**labels):
+        if labels:
+            counter = counter.labels(**labels)
+        return counter.inc(amount)
     
     @MonitorDecorator
-    def  histogram_observe(self,histogram,time):
-        histogram.observe(time)
\ No newline at end of file
+    def  histogram_observe(self,histogram,time,**labels):
+        if labels:
+            histogram = histogram.labels(**labels)
+        histogram.observe(time)
+
+    @MonitorDecorator
+    def gauge_set(self,gauge,value,**labels):
+        if labels:
+            gauge = gauge.labels(**labels)
+        return gauge.set(value)
+
+    @MonitorDecorator
+    def histogram_observe_many(self,histogram,times:list[float],**labels):
+        if labels:
+            histogram = histogram.labels(**labels)
+        for t in times:
+            histogram.observe(t)
\ No newline at end of file
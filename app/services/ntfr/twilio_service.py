@@ -8,6 +8,8 @@ from fastapi import HTTPException, Header, Request
 import requests
 from app.classes.profiles import ProfileModelException,ProfileState
 from app.classes.template import SMSTemplate
+from app.classes.phone_lookup import LookupResult, PhoneLookupCache
+from app.classes.twilio_fanout import FanOutResult, KeepAliveTwilioHttpClient, TwilioFanOut
 from app.definition import _service
 from app.interface.profile_event import ProfileEventInterface
 from app.interface.twilio import TwilioInterface
@@ -18,14 +20,13 @@ from app.services.database.mongoose_service import MongooseService
 from app.services.database.redis_service import RedisService
 from app.services.profile_service import ProfileMiniService, ProfileService
 from app.services.vault_service import VaultService
-from app.utils.constant import StreamConstant
+from app.utils.constant import RedisConstant, StreamConstant
 from app.utils.globals import APP_MODE, ApplicationMode
 from app.utils.tools import Mock, RunInThreadPool
 from ..config_service import ConfigService, APP_MODE
 from app.utils.helper import b64_encode, get_value_in_list, phone_parser, uuid_v1_mc
 from twilio.request_validator import RequestValidator
 from twilio.rest import Client
-from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.http.http_client import TwilioHttpClient
 from datetime import datetime, timedelta, timezone
 from twilio.rest.api.v2010.account.message import MessageInstance
@@ -77,7 +78,14 @@ class TwilioAccountMiniService(_service.BaseMiniService,TwilioInterface):
             self.mode = self.configService['TWILIO_MODE']
             self.testUrl = self.configService['TWILIO_TEST_URL']
             self.twilio_url = self.depService.model.twilio_url if self.mode == "prod" else self.testUrl
-            http_client = AsyncTwilioHttpClient() if APP_MODE == ApplicationMode.server else TwilioHttpClient()
+            if APP_MODE == ApplicationMode.server:
+                model = self.depService.model
+                concurrency = model.max_concurrency or self.configService.TWILIO_FANOUT_CONCURRENCY
+                rate = model.messages_per_second or self.configService.TWILIO_FANOUT_RATE
+                http_client = KeepAliveTwilioHttpClient(concurrency)
+                self.fanout = TwilioFanOut(concurrency,rate,self.configService.TWILIO_FANOUT_MAX_RETRIES)
+            else:
+                http_client = TwilioHttpClient()
             self.client =  Client(self.account_sid,self.auth_token,http_client= http_client)
         
         except TwilioRestException as e:
@@ -120,6 +128,9 @@ class TwilioAccountMiniService(_service.BaseMiniService,TwilioInterface):
 
     async def phone_lookup(self, phone_number: str, carrier=True, caller_name=False) -> tuple[int, dict]:
         phone_number, query = self._parse_phone_and_query(phone_number, carrier, caller_name)
+        return 200, await self.fetch_phone_number(phone_number,query)
+
+    async def fetch_phone_number(self, phone_number: str, query: list[str]) -> dict:
         phone_number_instance = await self.client.lookups.phone_numbers(phone_number).fetch_async(type=query)
         return {
             'phone_number': phone_number_instance.phone_number,
@@ -145,12 +156,24 @@ class TwilioAccountMiniService(_service.BaseMiniService,TwilioInterface):
 )
 class TwilioService(_service.BaseMiniServiceManager,TwilioInterface):
     
-    def __init__(self, configService: ConfigService,mongooseService:MongooseService,vaultService:VaultService,profileService:ProfileService) -> None:
+    def __init__(self, configService: ConfigService,mongooseService:MongooseService,vaultService:VaultService,profileService:ProfileService,redisService:RedisService) -> None:
         super().__init__()
         self.configService = configService
         self.mongooseService = mongooseService
         self.vaultService = vaultService
         self.profileService = profileService
+        self.redisService = redisService
+
+        self.phoneLookupCache = PhoneLookupCache(
+            self._fetch_phone_number,
+            functools.partial(self.redisService.retrieve_many,RedisConstant.CACHE_DB),
+            functools.partial(self.redisService.store_many,RedisConstant.CACHE_DB),
+            self.configService.PHONE_LOOKUP_CACHE_SIZE,
+            self.configService.PHONE_LOOKUP_LOCAL_TTL,
+            self.configService.PHONE_LOOKUP_TTL,
+            self.configService.PHONE_LOOKUP_NEGATIVE_TTL,
+            self.configService.PHONE_LOOKUP_CONCURRENCY,
+        )
 
         self.MiniServiceStore = _service.MiniServiceStore[TwilioAccountMiniService](self.__class__.__name__)
     
@@ -205,8 +228,21 @@ class TwilioService(_service.BaseMiniServiceManager,TwilioInterface):
     async def verify_twilio_token(self, request):
         return await self.main.verify_twilio_token(request)
         
-    async def phone_lookup(self, phone_number, carrier=True, caller_name=False):
-        return await self.main.phone_lookup(phone_number,carrier,caller_name)
+    async def _fetch_phone_number(self, phone_number:str, query:list[str]):
+        return await self.main.fetch_phone_number(phone_number,query)
+
+    async def phone_lookup(self, phone_number, carrier=True, caller_name=False)->LookupResult:
+        phone_number, query = self._parse_phone_and_query(phone_number, carrier, caller_name)
+        return await self.phoneLookupCache.get(phone_number,query)
+
+    async def phone_lookup_many(self, phone_numbers:list[str], carrier=True, caller_name=False)->dict[str,LookupResult]:
+        """
+        Look up every distinct number of the list through the cache, the result is keyed by the numbers as they were given
+        """
+        query = self._parse_query(carrier, caller_name)
+        formatted = {phone_number:self.parse_to_phone_format(phone_number) for phone_number in phone_numbers}
+        results = await self.phoneLookupCache.get_many(list(formatted.values()),query)
+        return {phone_number:results[e164] for phone_number,e164 in formatted.items()}
 
 @_service.AbstractServiceClass()
 class BaseTwilioCommunication(_service.BaseService,ProfileEventInterface):
@@ -238,6 +274,15 @@ class BaseTwilioCommunication(_service.BaseService,ProfileEventInterface):
     def response_extractor(cls, res) -> dict:
         ...
 
+    @classmethod
+    def parse_fanout_result(cls, sent:FanOutResult, sent_status:str, failed_status:str) -> tuple[dict|None,str,str]:
+        if sent.error == None:
+            return cls.response_extractor(sent.result),'Sent request to third-party API',sent_status
+
+        if isinstance(sent.error,TwilioRestException):
+            return None,f'Third Party Api could not process the request message: {sent.error.msg} code:{sent.error.code} ',failed_status
+        return None,'Failed to send the request',failed_status
+
     @staticmethod
     def TwilioDynamicContext(func:Callable):
 
@@ -318,7 +363,7 @@ class SMSService(BaseTwilioCommunication):
                         events.append(event)
                     results.append(result)
 
-                return (results,(StreamConstant.TWILIO_EVENT_STREAM_SMS,events),{})
+            return (results,(StreamConstant.TWILIO_EVENT_STREAM_SMS,events),{})
     else:
         
         async def __send_sms__(self, messageData: dict, subject_id=None, twilio_tracking: list[str] = [],twilioProfile:str=None) -> MessageInstance:
@@ -326,44 +371,32 @@ class SMSService(BaseTwilioCommunication):
             results = []
             events= []
             data = messageData.copy()
-            for i,to in enumerate(messageData['to']):
+            data.pop('to',None)
 
+            async def send(i:int,to:str):
                 url = self.set_url(twilioProfile.logs_url,subject_id, get_value_in_list(twilio_tracking,i))
-                now = datetime.now(timezone.utc).isoformat()
-                data['to'] = to
-
-                try:
-                    message = await twilioProfile.client.messages.create_async(
-                        provide_feedback=True, send_as_mms=True, 
-                        status_callback=url,
-                        **data)
-                    result = self.response_extractor(message)
-                    description = f'Sent request to third-party API'
-                    status = SMSStatusEnum.SENT.value
-                
-                except TwilioRestException as e:
-                    result = None
-                    description = f'Third Party Api could not process the request message: {e.msg} code:{e.code} '
-                    status = SMSStatusEnum.FAILED.value
-
-                except Exception as e:
-                    result = None
-                    description = f'Failed to send the request'
-                    status = SMSStatusEnum.FAILED.value
-                finally:
-                    if get_value_in_list(twilio_tracking,i) and isinstance(result, MessageInstance):
-                        event = SMSEventORM.JSON(
-                            event_id=uuid_v1_mc(),
-                            sms_sid=result.sid,
-                            direction='O',
-                            current_event=status,
-                            description=description,
-                            date_event_received=now
-                        )
-                        events.append(event)
-                    results.append(result)
+                return await twilioProfile.client.messages.create_async(
+                    provide_feedback=True, send_as_mms=True, 
+                    status_callback=url,
+                    to=to,
+                    **data)
+
+            for sent in await twilioProfile.fanout.run(messageData['to'],send):
+                result,description,status = self.parse_fanout_result(sent,SMSStatusEnum.SENT.value,SMSStatusEnum.FAILED.value)
+                sms_id = get_value_in_list(twilio_tracking,sent.index)
+                if sms_id:
+                    events.append(SMSEventORM.JSON(
+                        event_id=str(uuid_v1_mc()),
+                        sms_id=sms_id,
+                        sms_sid=sent.result.sid if sent.error == None else None,
+                        direction='O',
+                        current_event=status,
+                        description=description,
+                        date_event_received=sent.date
+                    ))
+                results.append(result)
 
-                return (results,(StreamConstant.TWILIO_EVENT_STREAM_SMS,events),{})
+            return (results,(StreamConstant.TWILIO_EVENT_STREAM_SMS,events),{})
         
     @Mock()
     async def send_otp(self, otpModel: OTPModel, body: str, background: bool = False,twilioProfile:str=None):
@@ -495,36 +528,21 @@ class CallService(BaseTwilioCommunication):
 
         events= []
         results = []
+        data = details.copy()
+        data.pop('to',None)
 
-        for i,to in enumerate(details['to']):
-            now = datetime.now(timezone.utc).isoformat()
+        async def send(i:int,to:str):
             url = self.set_url(twilioProfile.logs_url,subject_id,get_value_in_list(twilio_tracking,i))
-
-            try:
-                data = details.copy()
-                data['to'] = to
-                result = None
-                result = await twilioProfile.client.calls.create_async(**data, method='GET', status_callback_method='POST', status_callback=url, status_callback_event=CallService.status_callback_event)
-                result = self.response_extractor(result)
-                description = f'Sent request to third-party API'
-                status = CallStatusEnum.SENT.value
-            except TwilioRestException as e:
-                result = None
-                description = f'Third Party Api could not process the request message: {e.msg} code:{e.code} '
-                status = SMSStatusEnum.FAILED.value
-
-            except Exception as e:
-                result=None
-                description = f'Failed to send the request'
-                status =CallStatusEnum.FAILED.value
-            finally:
-            
-                if get_value_in_list(twilio_tracking,i) and isinstance(result,CallInstance):
-                    
-                    event = CallEventORM.JSON(event_id=str(uuid_v1_mc()),call_sid =result.sid ,call_id=twilio_tracking[i],direction='O',current_event=status,city=None,country=None,state=None,
-                                            date_event_received=now, description=description)
-                    events.append(event)
-                results.append(result)
+            return await twilioProfile.client.calls.create_async(**data, to=to, method='GET', status_callback_method='POST', status_callback=url, status_callback_event=CallService.status_callback_event)
+
+        recipients = details['to'] if isinstance(details['to'],list) else [details['to']]
+        for sent in await twilioProfile.fanout.run(recipients,send):
+            result,description,status = self.parse_fanout_result(sent,CallStatusEnum.SENT.value,CallStatusEnum.FAILED.value)
+            call_id = get_value_in_list(twilio_tracking,sent.index)
+            if call_id:
+                events.append(CallEventORM.JSON(event_id=str(uuid_v1_mc()),call_sid=sent.result.sid if sent.error == None else None,call_id=call_id,direction='O',current_event=status,city=None,country=None,state=None,
+                                        date_event_received=sent.date, description=description))
+            results.append(result)
         return (results,(StreamConstant.TWILIO_EVENT_STREAM_CALL,events),{})
                 
     def update_voice_call(self):
@@ -1,14 +1,15 @@
 
-from cachetools import cached,TTLCache
+from cachetools import TLRUCache
 from typing import Any, Dict, Literal
 from app.classes.secrets import ChaCha20SecretsWrapper
 from app.definition._interface import Interface, IsInterface
 from app.errors.service_error import BuildWarningError
 from app.services.setting_service import SettingService
-from app.utils.constant import VaultConstant
+from app.utils.constant import MonitorConstant, VaultConstant
 from app.utils.fileIO import FDFlag
 from app.utils.tools import Cache, RunInThreadPool, Time
 from .config_service import ConfigService
+from .monitoring_service import MonitoringService
 from .file.file_service import FileService
 from app.definition._service import AbstractServiceClass, BaseService, BuildFailureError, Service, ServiceStatus
 import jwt
@@ -64,13 +65,20 @@ class JWTAuthService(BaseService, EncryptDecryptInterface):
     gen_id_path='generation-id'
     NONCE="1234567891234578"
 
-    def __init__(self, configService: ConfigService, fileService: FileService,settingService:SettingService,vaultService:VaultService) -> None:
+    def __init__(self, configService: ConfigService, fileService: FileService,settingService:SettingService,vaultService:VaultService,monitoringService:MonitoringService) -> None:
         super().__init__()
         EncryptDecryptInterface.__init__(self,self.NONCE)
         self.configService = configService
         self.fileService = fileService
         self.settingService = settingService
         self.vaultService = vaultService
+        self.monitoringService = monitoringService
+
+        # NOTE an entry lives until the token expires, capped by JWT_DECODE_CACHE_TTL
+        self.token_cache:TLRUCache[tuple[str,str|None],tuple[dict,float]] = TLRUCache(self.configService.JWT_DECODE_CACHE_SIZE,lambda key,value,now:value[1],timer=time.time)
+        self.client_tokens:dict[str,set[tuple[str,str|None]]] = {}
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
 
     def encode_auth_token(self,authz_id, client_id:str, challenge: str, group_id: str | None) -> str:
         try:
@@ -145,8 +153,64 @@ class JWTAuthService(BaseService, EncryptDecryptInterface):
         token = self._encode_value(encoded, self.vaultService.ON_TOP_SECRET_KEY)
         return token
 
-    @cached(TTLCache(50,60*60*3))
     def _decode_token(self, token: str, secret_key: str = None) -> dict:
+        key = (token,secret_key)
+        cached = self.token_cache.get(key,None)
+        if cached != None:
+            self.token_cache_hits+=1
+            self.monitoringService.counter_inc(MonitorConstant.JWT_DECODE_CACHE,result='hit')
+            return cached[0]
+
+        self.token_cache_misses+=1
+        self.monitoringService.counter_inc(MonitorConstant.JWT_DECODE_CACHE,result='miss')
+        decoded = self._decode_token_uncached(token,secret_key)
+
+        now = time.time()
+        expired_at = decoded.get('exp',decoded.get('expired_at',None))
+        expires = now + self.configService.JWT_DECODE_CACHE_TTL
+        if isinstance(expired_at,(int,float)):
+            expires = min(expires,expired_at)
+        if expires > now:
+            self.token_cache[key] = (decoded,expires)
+            self._index_client_token(decoded.get('client_id',None),key)
+        return decoded
+
+    def _index_client_token(self,client_id:str|None,key:tuple[str,str|None]):
+        if client_id == None:
+            return
+        keys = self.client_tokens.get(client_id,None)
+        if keys == None:
+            self.client_tokens[client_id] = {key}
+            return
+        # NOTE drop the keys the cache already expired or evicted so the index stays bounded
+        keys = {k for k in keys if k in self.token_cache}
+        keys.add(key)
+        self.client_tokens[client_id] = keys
+
+    def evict_client_tokens(self,client_ids:list[str]|None):
+        """
+        Drop the decoded tokens of `client_ids`, or every decoded token when `client_ids` is None
+        """
+        if client_ids == None:
+            self.token_cache.clear()
+            self.client_tokens.clear()
+            return
+
+        for client_id in client_ids:
+            for key in self.client_tokens.pop(client_id,()):
+                self.token_cache.pop(key,None)
+
+    @property
+    def token_cache_stats(self):
+        total = self.token_cache_hits + self.token_cache_misses
+        return {
+            'hits':self.token_cache_hits,
+            'misses':self.token_cache_misses,
+            'hit_ratio':self.token_cache_hits/total if total else 0,
+            'size':len(self.token_cache),
+        }
+
+    def _decode_token_uncached(self, token: str, secret_key: str = None) -> dict:
         try:
             if secret_key == None:
                 secret_key = self.vaultService.JWT_SECRET_KEY
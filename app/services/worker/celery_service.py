@@ -1,10 +1,14 @@
+import json
 from fastapi import Response
 from kombu import Queue
 from typing import Any, Callable, Literal, Self
 from aiorwlock import RWLock
 from celery.result import AsyncResult
 from redbeat import RedBeatSchedulerEntry
-from app.classes.celery import CeleryNotAvailableError, CeleryTask, CeleryTaskNotFoundError, InspectMode, SchedulerModel, TaskExecutionResult, TaskType, add_warnings, due_entry_timedelta
+from redbeat.schedulers import get_redis
+from redbeat.decoder import RedBeatJSONEncoder
+from app.classes.env_selector import TaskEnvFeedback
+from app.classes.celery import CeleryBatchItem, CeleryNotAvailableError, CeleryTask, CeleryTaskNotFoundError, InspectMode, SchedulerModel, TaskExecutionResult, TaskType, add_warnings, due_entry_timedelta
 from app.definition._service import BaseMiniService, BaseMiniServiceManager, BaseService, LinkDep, MiniService, MiniServiceStore, Service, ServiceStatus
 from app.interface.timers import IntervalInterface
 from app.models.communication_model import BaseProfileModel
@@ -25,6 +29,30 @@ from app.classes.scheduler import schedule
 CHANNEL_BUILD_STATE=0
 
 
+def save_redbeat_entries(entries:list[RedBeatSchedulerEntry]):
+    """
+    Same writes as `RedBeatSchedulerEntry.save` for every entry, sent in a single pipeline
+    """
+    if not entries:
+        return
+
+    with get_redis(celery_app).pipeline() as pipe:
+        for entry in entries:
+            definition = {
+                'name': entry.name,
+                'task': entry.task,
+                'args': entry.args,
+                'kwargs': entry.kwargs,
+                'options': entry.options,
+                'schedule': entry.schedule,
+                'enabled': entry.enabled,
+            }
+            pipe.hset(entry.key, 'definition', json.dumps(definition, cls=RedBeatJSONEncoder))
+            pipe.hsetnx(entry.key, 'meta', json.dumps({'last_run_at': entry.last_run_at}, cls=RedBeatJSONEncoder))
+            pipe.zadd(celery_app.redbeat_conf.schedule_key, {entry.key: entry.score})
+        pipe.execute()
+
+
 @Service(
     is_manager=True,
     links=[LinkDep(ProfileService,to_build=True,build_state=CHANNEL_BUILD_STATE)]
@@ -75,6 +103,45 @@ class CeleryService(BaseMiniServiceManager, IntervalInterface):
         return result
 
 
+    @RunInThreadPool
+    def trigger_tasks_from_scheduler(self, scheduler: SchedulerModel, items:list[CeleryBatchItem]):
+        """
+        Publish the tasks of many items of the same scheduler at once and fill the `result` of each item with its own task id.
+        The Celery tasks share one producer, so one broker connection and channel, and the RedBeat entries are written in one pipeline.
+        """
+        t_name = scheduler.task_name
+        option = scheduler.task_option.model_dump()
+
+        if scheduler.task_type in self._non_redbeat_task_type:
+            if scheduler.task_type != TaskType.NOW:
+                option['eta'] = scheduler._schedule._beat_object
+                expected_tbd = naturaldelta(option['eta'])
+            else:
+                expected_tbd = naturaldelta(option.get('countdown', None))
+
+            task = TASK_REGISTRY[t_name]['task']
+            with celery_app.producer_or_acquire() as producer:
+                for item in items:
+                    task_result = task.apply_async(**option, args=item['args'], kwargs=item['kwargs'], producer=producer)
+                    task_id = str(task_result.id).split('@')[1]
+                    item['result'].update(task_id,'task',expected_tbd)
+        else:
+            entries = []
+            schedules = []
+            for item in items:
+                schedule_id = str(uuid4())
+                redbeat_id= CeleryConstant.REDIS_SCHEDULE_ID_RESOLVER(schedule_id,item['index'])
+                entry = RedBeatSchedulerEntry(redbeat_id, t_name, scheduler._schedule._beat_object, args=item['args'], kwargs=item['kwargs'], app=celery_app,options=option)
+                entries.append(entry)
+                schedules.append((schedule_id,due_entry_timedelta(entry)))
+
+            save_redbeat_entries(entries)
+            # NOTE the ids are only given once the pipeline is executed, a failed save leaves every item unpublished
+            for item,(schedule_id,time) in zip(items,schedules):
+                item['result'].update(schedule_id,'schedule',None if time == None else naturaldelta(time))
+
+        return [item['result'] for item in items]
+
     @RunInThreadPool
     def seek_result(self, task_id: str):
         task_id = CeleryConstant.REDIS_TASK_ID_RESOLVER(task_id)
@@ -183,6 +250,39 @@ class CeleryService(BaseMiniServiceManager, IntervalInterface):
         async with self.statusLock.writer:
             self._workers = response.copy()
 
+    async def _check_queue_length(self):
+        queues = [self.broker_queue(celery_app.conf.task_default_queue)]
+        queues.extend(channel.queue for _,channel in self.MiniServiceStore)
+        try:
+            TaskEnvFeedback.set_queue_length(await self.queue_length(queues))
+        except Exception as e:
+            print(f'Could not sample the celery queues: {e}')
+
+    def broker_queue(self,queue_name:str)->str:
+        if self.configService.BROKER_PROVIDER == 'redis':
+            return CeleryConstant.REDIS_QUEUE_NAME_RESOLVER(queue_name)
+        return queue_name
+
+    async def queue_length(self,queues:list[str])->int:
+        if self.configService.BROKER_PROVIDER == 'redis':
+            # NOTE the redis transport keeps a list per priority step
+            names = [f'{queue}{step}' for queue in queues for step in ('',':1',':2',':3')]
+            return await self.redisService.length(RedisConstant.CELERY_DB,*names)
+        return await self._rabbitmq_queue_length(queues)
+
+    @RunInThreadPool
+    def _rabbitmq_queue_length(self,queues:list[str])->int:
+        length = 0
+        with celery_app.connection_or_acquire() as conn:
+            for queue in queues:
+                # NOTE a passive declare of a missing queue closes the channel, so each queue gets its own
+                with conn.channel() as channel:
+                    try:
+                        length += channel.queue_declare(queue,passive=True).message_count
+                    except Exception:
+                        continue
+        return length
+
     @property
     async def workers(self):
         async with self.task_lock.reader:
@@ -207,6 +307,7 @@ class CeleryService(BaseMiniServiceManager, IntervalInterface):
     async def callback(self):
         if self.configService.CELERY_WORKERS_EXPECTED >= 1:
             await self._check_workers_status()
+            await self._check_queue_length()
 
     @RunInThreadPool
     def revoke(self,tasks:list[str],timeout=5):
@@ -343,6 +444,4 @@ class ChannelMiniService(BaseMiniService):
 
     @property
     def queue(self):
-        if self.configService.BROKER_PROVIDER == 'redis':
-            return CeleryConstant.REDIS_QUEUE_NAME_RESOLVER(self.depService.queue_name)
-        return self.depService.queue_name
+        return self.celeryService.broker_queue(self.depService.queue_name)
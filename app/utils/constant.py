@@ -116,13 +116,18 @@ class StreamConstant:
     S3_EVENT_STREAM='s3_object_events'
     DB_WEBHOOK_STREAM='db_webhook_stream'
 
+    @staticmethod
+    def DEAD_LETTER_STREAM(stream_name:str):return f"{stream_name}:dead-letter"
+
 class SubConstant:
     SERVICE_STATUS = 'service-status'
     SERVICE_VARIABLES = 'service-variables'
     PROCESS_TERMINATE = 'process-terminate' 
     MINI_SERVICE_STATUS = 'mini-service-status'
+    ORM_CACHE_INVALIDATION = 'orm-cache-invalidation'
+    ASSET_RELOAD = 'asset-reload'
 
-    _SUB_CALLBACK = {SERVICE_STATUS,MINI_SERVICE_STATUS,SERVICE_VARIABLES,PROCESS_TERMINATE}
+    _SUB_CALLBACK = {SERVICE_STATUS,MINI_SERVICE_STATUS,SERVICE_VARIABLES,PROCESS_TERMINATE,ORM_CACHE_INVALIDATION,ASSET_RELOAD}
 
 class ServerParamsConstant(Enum):
     SESSION_ID = 'session-id'
@@ -153,8 +158,9 @@ class RunModeConstant(Enum):
 class HTMLTemplateConstant:
     _tracking_url = '_tracking_url'
     _signature = '_signature'
+    _sub_url = '_sub_url'
 
-    values= {_tracking_url,_signature}
+    values= {_tracking_url,_signature,_sub_url}
 
 
 ########################                     ########################################
@@ -258,10 +264,11 @@ class VaultConstant:
     CHAT_KEY='chat-key'
     S3_REST_KEY='s3-rest-key'
 
-    NotifyrDynamicSecretsRole= Literal['postgres','mongo','redis','neo4j','redis-celery-broker','redis-celery-backend']
+    NotifyrDynamicSecretsRole= Literal['postgres','mongo','redis','neo4j','redis-celery-broker','redis-celery-backend','redis-limiter']
     MONGO_ROLE='mongo'
     POSTGRES_ROLE='postgres'
     REDIS_ROLE='redis'
+    REDIS_LIMITER_ROLE='redis-limiter'
     NEO4J_ROLE='neo4j'
     CELERY_BROKER_ROLE='redis-celery-broker'
     CELERY_BACKEND_ROLE='redis-celery-backend'
@@ -521,6 +528,18 @@ class MonitorConstant:
     BACKGROUND_TASK_COUNT = 2
     ROUTE_TASK_COUNT = 3
     REQUEST_LATENCY = 4
+    STREAM_EVENT_LATENCY = 5
+    STREAM_BACKLOG = 6
+    STREAM_PENDING = 7
+    PUBSUB_DISPATCH_LATENCY = 8
+    ORM_CACHE_LOOKUP = 9
+    BROKER_REQUEST_OPS = 10
+    BROKER_FLUSH_LATENCY = 11
+    BROKER_BUFFER_OPS = 12
+    JWT_DECODE_CACHE = 13
+    USER_AGENT_CACHE = 14
+    LIMITER_STORAGE_FALLBACK = 15
+    STREAM_DEAD_LETTER = 16
 
 class RabbitMQConstant:
     NOTIFYR_VIRTUAL_HOST='notifyr'
@@ -20,6 +20,7 @@ import urllib
 from uuid import UUID,uuid1
 import hashlib
 import socket
+from weakref import WeakKeyDictionary
 
 from app.utils.globals import DIRECTORY_SEPARATOR
 
@@ -29,47 +30,57 @@ alphanumeric = digits + ascii_letters
 ################################   ** REST API HELPER Helper **      #################################
 
 
-def APIFilterInject(func:Callable | Type):
+INJECTION_SPECS:WeakKeyDictionary[Callable,tuple[frozenset[str],frozenset[str]]] = WeakKeyDictionary()
 
-    if type(func) == type:
-        annotations = func.__init__.__annotations__.copy()
+def injection_spec(func:Callable | Type)->tuple[frozenset[str],frozenset[str]]:
+    """
+    Return the annotated parameters of `func` and the ones annotated with a bare `Literal`. The result is computed once per function,
+    bound methods share the spec of their function.
+    """
+    target = func.__init__ if type(func) == type else getattr(func,'__func__',func)
+    try:
+        return INJECTION_SPECS[target]
+    except (KeyError,TypeError):
+        ...
+
+    annotations = target.__annotations__
+    keys = frozenset(key for key in annotations if key != 'return')
+    literals = frozenset(key for key in keys if annotations[key] == Literal)
+    spec = keys,literals
+    try:
+        INJECTION_SPECS[target] = spec
+    except TypeError:
+        ...
+    return spec
+
+def filter_kwargs(spec:tuple[frozenset[str],frozenset[str]],kwargs:dict[str,Any],extra:dict[str,Any]=None)->dict[str,Any]:
+    keys,literals = spec
+    if extra:
+        filtered = {key:extra[key] if key in extra else kwargs[key] for key in keys if key in extra or key in kwargs}
     else:
-        annotations = func.__annotations__.copy()
-        annotations.pop('return',None)
+        filtered = {key:kwargs[key] for key in keys if key in kwargs}
+
+    for key in literals:
+        if key in filtered and isinstance(filtered[key], (str, int, float, bool, list, dict)):
+            filtered[key] = Literal(filtered[key])
+    return filtered
+
+def APIFilterInject(func:Callable | Type):
+    spec = injection_spec(func)
 
     def sync_wrapper(*args,**kwargs):
-        filtered_kwargs = {
-            key: (annotations[key](value) if isinstance(value, (str, int, float, bool, list, dict)) and annotations[key] == Literal  else value)
-            for key, value in kwargs.items()
-            if key in annotations
-        }
-        return func(*args, **filtered_kwargs)
+        return func(*args, **filter_kwargs(spec,kwargs))
     
     async def async_wrapper(*args,**kwargs):
-        filtered_kwargs = {
-            key: (annotations[key](value) if isinstance(value, (str, int, float, bool, list, dict)) and annotations[key] == Literal  else value)
-            for key, value in kwargs.items()
-            if key in annotations
-        }
-        return await func(*args, **filtered_kwargs)
+        return await func(*args, **filter_kwargs(spec,kwargs))
 
     return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
 
 def AsyncAPIFilterInject(func:Callable | Type):
-
-    if type(func) == type:
-        annotations = func.__init__.__annotations__.copy()
-    else:
-        annotations = func.__annotations__.copy()
-        annotations.pop('return',None)
+    spec = injection_spec(func)
 
     async def wrapper(*args,**kwargs):
-        filtered_kwargs = {
-            key: (annotations[key](value) if isinstance(value, (str, int, float, bool, list, dict)) and annotations[key] == Literal  else value)
-            for key, value in kwargs.items()
-            if key in annotations
-        }
-        return await func(*args, **filtered_kwargs)
+        return await func(*args, **filter_kwargs(spec,kwargs))
     return wrapper
 
 def GetDependency(kwargs:dict[str,Any],key:str|None = None,cls:type|None = None):
@@ -715,6 +726,14 @@ class IntegrityCache:
         self._cache[key] = value
         return False
 
+    def hit(self,key,value=None)->bool:
+        """
+        Same check as `cache` without recording the value
+        """
+        if key not in self._cache:
+            return False
+        return self.mode == 'presence-only' or self._cache[key] == value
+
     def clear(self):
         self.init()
     
@@ -112,3 +112,69 @@ redis.register_function('bill_squash', function(keys, args)
 
     return squashed
 end)
+
+
+-- The bill is sent as json without the balances, they are spliced at the end so the
+-- stored bill is the same as the one pushed by the app with a plain LPUSH
+local function push_bill(bill_key, bill, before, total)
+    if total ~= 0 then
+        redis.call("LPUSH", bill_key, string.sub(bill, 1, -2) .. ', "balance_before": ' .. before .. ', "balance_after": ' .. (before - total) .. '}')
+    end
+end
+
+local function set_balance(credit_key, before, total)
+    local after = before - total
+    if after >= 0 then after = math.floor(after) else after = math.ceil(after) end
+    redis.call("SET", credit_key, after)
+end
+
+
+redis.register_function('credit_deduct', function(keys, args)
+
+    local credit_key = keys[1]
+    local bill_key   = keys[2]
+
+    local total      = tonumber(args[1])
+    local overdraft  = args[2]
+    local bill       = args[3]
+
+    if not total then
+        return redis.error_reply("total must be numeric")
+    end
+
+    local before = redis.call("GET", credit_key)
+    if not before then
+        return {0, 0}
+    end
+    before = tonumber(before)
+
+    if before < total and overdraft == "0" then
+        return {-1, before}
+    end
+
+    set_balance(credit_key, before, total)
+    push_bill(bill_key, bill, before, total)
+
+    return {1, before}
+end)
+
+
+redis.register_function('credit_refund', function(keys, args)
+
+    local credit_key = keys[1]
+    local bill_key   = keys[2]
+
+    local total      = tonumber(args[1])
+    local bill       = args[2]
+
+    if not total then
+        return redis.error_reply("total must be numeric")
+    end
+
+    local before = tonumber(redis.call("GET", credit_key) or "0")
+
+    set_balance(credit_key, before, total)
+    push_bill(bill_key, bill, before, total)
+
+    return before
+end)
@@ -2,6 +2,8 @@
 set -e
 
 ACL_FILE="/data/etc/.users/users.acl"
+FUNC_FILE="/functions/ncs-lib.lua"
+FUNC_SUM_FILE="/data/etc/.users/ncs-lib.sha256"
 mkdir -p "$(dirname "$ACL_FILE")"
 
 USER_NAME="vaultadmin-redis"
@@ -40,6 +42,13 @@ else
     echo "ACL file already exists at $ACL_FILE. Skipping creation."
 fi
 
+FUNC_SUM="$(sha256sum "$FUNC_FILE" | cut -d ' ' -f 1)"
+if [ "$TO_LOAD_FUNC" = "false" ] && [ "$FUNC_SUM" != "$(cat "$FUNC_SUM_FILE" 2>/dev/null)" ]; then
+    # The library of the image changed since it was loaded, the app calls its new functions
+    TO_LOAD_FUNC="true"
+    echo "Function library changed. Reloading it..."
+fi
+
 # --- IMPORTANT CHANGE: Configuration directives moved to the EXEC line ---
 
 if [ "$TO_LOAD_FUNC" = "true" ]; then
@@ -52,7 +61,8 @@ if [ "$TO_LOAD_FUNC" = "true" ]; then
     done
 
     echo "[AUDIT] Loading Redis functions..."
-    redis-cli -u "$URL" FUNCTION LOAD REPLACE "$(cat /functions/ncs-lib.lua)"
+    redis-cli -u "$URL" FUNCTION LOAD REPLACE "$(cat "$FUNC_FILE")"
+    echo "$FUNC_SUM" > "$FUNC_SUM_FILE"
     echo "[AUDIT] Functions loaded successfully."
 
     echo "[AUDIT] Shutting down temporary Redis server..."
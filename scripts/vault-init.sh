@@ -409,7 +409,13 @@ setup_database_config(){
       db_name="redis-notifyr" \
       default_ttl="35d" \
       max_ttl="35d" \
-      creation_statements='["~*","&*", "+@string", "+@hash", "+@list", "+@set", "+@sortedset","+@transaction", "+@stream","+@keyspace", "+@pubsub", "-@admin", "-@dangerous", "-@connection", "+PING","+SELECT","+SCAN","+INFO","+KEYS"]'
+      creation_statements='["~*","&*", "+@string", "+@hash", "+@list", "+@set", "+@sortedset","+@transaction", "+@stream","+@keyspace", "+@pubsub", "-@admin", "-@dangerous", "-@connection", "+PING","+SELECT","+SCAN","+INFO","+KEYS","+FCALL"]'
+
+    vault write notifyr-database/roles/app-redis-limiter-ntfr-role \
+      db_name="redis-notifyr" \
+      default_ttl="35d" \
+      max_ttl="35d" \
+      creation_statements='["~LIMITS:*", "+@read", "+@write", "-@dangerous", "+EVAL", "+EVALSHA", "+script|load", "+script|exists", "+PING", "+SELECT"]'
 
     vault write notifyr-database/roles/admin-redis-ntfr-role \
       db_name="redis-notifyr" \
@@ -545,7 +551,7 @@ create_database_config(){
         port=6379 \
         username="vaultadmin-redis" \
         password="$REDIS_NOTIFYR_PASSWORD" \
-        allowed_roles="admin-redis-ntfr-role, app-redis-ntfr-role, credit-redis-ntfr-role"
+        allowed_roles="admin-redis-ntfr-role, app-redis-ntfr-role, app-redis-limiter-ntfr-role, credit-redis-ntfr-role"
     vault write -f notifyr-database/rotate-root/redis-notifyr
     
 
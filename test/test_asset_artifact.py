@@ -0,0 +1,69 @@
+"""
+The on-disk artifacts of the loaded assets: private directory, marshalled templates rendering like the parsed ones,
+and pruning of the versions no longer in the bucket.
+"""
+import os
+import stat
+from app.classes.asset_artifact import TMP_PREFIX, AssetArtifactStore
+from app.classes.template import HTMLTemplate
+
+HTML = '<html><head><title>Welcome</title></head><body><p>{{ intro }}</p></body></html>'
+DATA = {'intro':'hello'}
+
+
+def make_template()->HTMLTemplate:
+    template = HTMLTemplate('welcome.html',HTML,'email',len(HTML))
+    template.loadCSS('p { color: red; }')
+    template.add_tracking_pixel()
+    template.set_content()
+    return template
+
+
+def test_directory_is_private(tmp_path):
+    directory = tmp_path/'artifacts'
+    directory.mkdir(mode=0o755)
+    os.chmod(directory,0o755)
+
+    store = AssetArtifactStore(str(directory))
+    store.store('email/welcome.html','etag-1',{'state':{}})
+
+    for root,_,_ in os.walk(directory):
+        assert stat.S_IMODE(os.stat(root).st_mode) == 0o700
+
+
+def test_restored_template_renders_like_the_parsed_one(tmp_path):
+    store = AssetArtifactStore(str(tmp_path))
+    template = make_template()
+
+    assert store.store('email/welcome.html','etag-1',template.to_artifact())
+    restored = HTMLTemplate.from_artifact(store.load('email/welcome.html','etag-1'))
+
+    assert restored.build(DATA) == template.build(DATA)
+    assert store.load('email/welcome.html','etag-2') == None
+    assert store.stats['hits'] == 1
+
+
+def test_values_of_the_code_are_not_stored(tmp_path):
+    store = AssetArtifactStore(str(tmp_path))
+
+    # NOTE marshal only takes plain values, an object that could run code on load is refused
+    assert not store.store('email/welcome.html','etag-1',{'state':{'template':make_template()}})
+    assert not store.exists('email/welcome.html','etag-1')
+
+
+def test_prune_keeps_the_current_versions(tmp_path):
+    store = AssetArtifactStore(str(tmp_path))
+    for etag in ('etag-1','etag-2'):
+        store.store('email/welcome.html',etag,{'state':{}})
+    store.store('sms/otp.xml','etag-1',{'state':{}})
+    writing = tmp_path/f'{TMP_PREFIX}writing'
+    writing.write_bytes(b'')
+
+    assert store.prune({'email/welcome.html':'etag-2','sms/otp.xml':'etag-1'}) == 1
+    assert not store.exists('email/welcome.html','etag-1')
+    assert store.exists('email/welcome.html','etag-2') and store.exists('sms/otp.xml','etag-1')
+    assert writing.exists()
+
+    # NOTE a new salt, like a change of the template module, drops every artifact
+    store.salt += ':next'
+    assert store.prune({'email/welcome.html':'etag-2','sms/otp.xml':'etag-1'}) == 2
@@ -0,0 +1,115 @@
+"""
+Boot of a worker's `AssetService` with a cold and with a warm artifact directory: the bucket is a stub answering each
+object after `OBJECT_LATENCY` seconds, a warm boot only lists it and restores the templates from the artifacts written
+by the previous boot.
+
+`python test/test_asset_boot.py` prints the boot time and the objects read of both.
+"""
+import hashlib
+import io
+import json
+import time
+from types import SimpleNamespace
+from minio.datatypes import Object
+from app.services.assets_service import AssetService
+from app.services.config_service import AssetMode, ConfigService
+from app.services.file.file_service import FileService
+
+OBJECT_LATENCY = 0.005
+TEMPLATES = 100
+S3_LOAD_CONCURRENCY = 10
+
+HTML = '<html><head><title>Template {i}</title></head><body><p class="intro">{{{{ intro }}}}</p><a href="{{{{ link }}}}">Open</a></body></html>'
+STYLE = '.intro {{ color: #{i:06x}; }} a {{ font-weight: bold; }}'
+
+
+class StubResponse(io.BytesIO):
+
+    def release_conn(self):
+        ...
+
+
+class StubObjectS3:
+
+    def __init__(self):
+        self.contents:dict[str,bytes] = {'globals.json':json.dumps({}).encode()}
+        self.reads:list[str] = []
+        for i in range(TEMPLATES):
+            self.contents[f'email/template{i}/index.html'] = HTML.format(i=i).encode()
+            self.contents[f'email/template{i}/style.css'] = STYLE.format(i=i).encode()
+
+    def stat(self,name:str)->Object:
+        content = self.contents[name]
+        return Object('assets',name,etag=hashlib.md5(content).hexdigest(),size=len(content),is_latest='true',metadata={})
+
+    def iter_objects(self,prefix:str=None,recursive:bool=False):
+        for name in list(self.contents):
+            if prefix == None or name.startswith(prefix):
+                yield self.stat(name)
+
+    def read_object(self,object_name:str):
+        time.sleep(OBJECT_LATENCY)
+        self.reads.append(object_name)
+        return StubResponse(self.contents[object_name])
+
+
+def build_config(artifact_dir:str)->ConfigService:
+    configService = ConfigService.__new__(ConfigService)
+    configService.__dict__.update(
+        ASSETS_DIR='assets/',
+        OBJECTS_DIR='',
+        ASSET_MODE=AssetMode.s3,
+        S3_TO_DISK=False,
+        S3_LOAD_CONCURRENCY=S3_LOAD_CONCURRENCY,
+        S3_DECRYPT_BATCH_SIZE=64,
+        ASSET_ARTIFACT_CACHE=True,
+        ASSET_ARTIFACT_DIR=artifact_dir,
+        TEMPLATE_CACHE_MAX_MEMORY=64*1024*1024,
+    )
+    return configService
+
+
+def boot(bucket:StubObjectS3,artifact_dir:str)->tuple[float,AssetService]:
+    configService = build_config(artifact_dir)
+    settingService = SimpleNamespace(ASSET_LANG='en')
+    start = time.perf_counter()
+    assetService = AssetService(SimpleNamespace(transit_engine=None),None,FileService(configService),configService,bucket,settingService,None)
+    assetService.build()
+    return time.perf_counter()-start,assetService
+
+
+def boots(artifact_dir:str)->dict[str,tuple[float,list[str],AssetService]]:
+    """Boot time, objects read and the service of a cold and of a warm boot"""
+    bucket = StubObjectS3()
+    results = {}
+    for name in ('cold','warm'):
+        bucket.reads.clear()
+        elapsed,assetService = boot(bucket,artifact_dir)
+        results[name] = elapsed,list(bucket.reads),assetService
+    return results
+
+
+def render(assetService:AssetService,i:int)->str:
+    _,(html,_) = assetService.email[f'email/template{i}/index.html'].build({'intro':'hello','link':'https://example.com/'},'en')
+    return html
+
+
+def test_warm_boot_reads_no_template(tmp_path):
+    results = boots(str(tmp_path))
+    cold_elapsed,cold_reads,cold = results['cold']
+    warm_elapsed,warm_reads,warm = results['warm']
+
+    assert len(cold_reads) == 2*TEMPLATES+1
+    # NOTE only the globals are read again
+    assert warm_reads == ['globals.json']
+    assert warm_elapsed < cold_elapsed
+    for i in (0,TEMPLATES-1):
+        assert render(warm,i) == render(cold,i)
+
+
+if __name__ == '__main__':
+    import tempfile
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        print(f'{TEMPLATES} html templates with their css, {OBJECT_LATENCY*1000:.0f} ms per object, {S3_LOAD_CONCURRENCY} in flight')
+        for name,(elapsed,reads,_) in boots(artifact_dir).items():
+            print(f'{name:>5} boot: {elapsed*1000:.0f} ms, {len(reads)} objects read')
@@ -0,0 +1,169 @@
+"""
+Reload of the s3 assets while templates are being rendered, the bucket is a stub answering after `OBJECT_LATENCY` seconds
+and the transit engine of the vault a stub decrypting the `vault:` prefixed objects.
+
+`python test/test_asset_reload.py` prints the reload latency and the renders made meanwhile.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import threading
+import time
+from types import SimpleNamespace
+from minio.datatypes import Object
+from app.services.assets_service import AssetService
+from app.services.config_service import AssetMode, ConfigService
+from app.services.file.file_service import FileService
+from app.utils.constant import MinioConstant
+
+OBJECT_LATENCY = 0.02
+TEMPLATES = 20
+RENDER_THREADS = 4
+RENDER_PAUSE = 0.001 # NOTE a render thread stands for a worker serving requests, not a busy loop
+TEMPLATE = 'email/welcome/index.html'
+STYLE = 'email/welcome/style.css'
+SMS = 'sms/otp/code.xml'
+
+HTML = '<html><head><title>Welcome</title></head><body><p class="intro">{{ intro }}</p></body></html>'
+SMS_XML = '<Response><Message>Your code is {{ code }}</Message></Response>'
+
+
+def style(color:str)->str:
+    return '.intro { color: %s; }' % color
+
+
+class StubResponse(io.BytesIO):
+
+    def release_conn(self):
+        ...
+
+
+class StubObjectS3:
+
+    def __init__(self):
+        self.contents:dict[str,tuple[bytes,bool]] = {}
+        self.reads:list[str] = []
+        self.put('globals.json',json.dumps({}))
+        self.put(STYLE,style('red'))
+        self.put(TEMPLATE,HTML)
+        for i in range(TEMPLATES):
+            self.put(f'email/other{i}/index.html',HTML)
+        self.put(SMS,'vault:'+SMS_XML,encrypted=True)
+
+    def put(self,name:str,content:str,encrypted:bool=False):
+        self.contents[name] = content.encode(),encrypted
+
+    def stat(self,name:str)->Object:
+        content,encrypted = self.contents[name]
+        metadata = {MinioConstant.ENCRYPTED_KEY:True} if encrypted else {}
+        return Object('assets',name,etag=hashlib.md5(content).hexdigest(),size=len(content),is_latest='true',metadata=metadata)
+
+    def iter_objects(self,prefix:str=None,recursive:bool=False):
+        for name in list(self.contents):
+            if prefix == None or name.startswith(prefix):
+                yield self.stat(name)
+
+    def read_object(self,object_name:str):
+        time.sleep(OBJECT_LATENCY)
+        self.reads.append(object_name)
+        return StubResponse(self.contents[object_name][0])
+
+
+class StubTransit:
+
+    def decrypt(self,ciphertext:str,key:str)->str:
+        return ciphertext.removeprefix('vault:')
+
+    def decrypt_batch(self,ciphertexts:list[str],key:str)->list[str]:
+        return [self.decrypt(ciphertext,key) for ciphertext in ciphertexts]
+
+
+def build_config()->ConfigService:
+    configService = ConfigService.__new__(ConfigService)
+    configService.__dict__.update(
+        ASSETS_DIR='assets/',
+        OBJECTS_DIR='',
+        ASSET_MODE=AssetMode.s3,
+        S3_TO_DISK=False,
+        S3_LOAD_CONCURRENCY=10,
+        S3_DECRYPT_BATCH_SIZE=64,
+        ASSET_ARTIFACT_CACHE=False,
+        TEMPLATE_CACHE_MAX_MEMORY=64*1024*1024,
+    )
+    return configService
+
+
+def build_service(bucket:StubObjectS3)->AssetService:
+    configService = build_config()
+    vaultService = SimpleNamespace(transit_engine=StubTransit())
+    settingService = SimpleNamespace(ASSET_LANG='en')
+    assetService = AssetService(vaultService,None,FileService(configService),configService,bucket,settingService,None)
+    assetService.build()
+    return assetService
+
+
+def render_while_reloading(color:str)->dict:
+    bucket = StubObjectS3()
+    assetService = build_service(bucket)
+    bucket.reads.clear()
+    stop = threading.Event()
+    renders = {'count':0,'failed':[],'colors':set()}
+
+    def render():
+        while not stop.is_set():
+            try:
+                _,(html,_) = assetService.email[TEMPLATE].build({'intro':'hello'},'en')
+                _,sms = assetService.sms[SMS].build({'code':'1234'},'en')
+                assert 'Your code is 1234' in sms
+            except Exception as e:
+                renders['failed'].append(e)
+                continue
+            renders['count']+=1
+            renders['colors'].add('blue' if 'blue' in html else 'red')
+            time.sleep(RENDER_PAUSE)
+
+    async def main():
+        threads = [threading.Thread(target=render) for _ in range(RENDER_THREADS)]
+        for thread in threads:
+            thread.start()
+        try:
+            await asyncio.sleep(.05)
+            bucket.put(STYLE,style(color))
+            start = time.perf_counter()
+            await assetService.reload_objects([STYLE])
+            latency = time.perf_counter()-start
+            await asyncio.sleep(.05)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        return latency
+
+    renders['latency'] = asyncio.run(main())
+    renders['reads'] = list(bucket.reads)
+    _,(renders['after'],_) = assetService.email[TEMPLATE].build({'intro':'hello'},'en')
+    return renders
+
+
+def test_reload_does_not_drop_renders():
+    renders = render_while_reloading('blue')
+
+    assert renders['failed'] == []
+    assert renders['count'] > 0
+    assert 'blue' in renders['after']
+    assert renders['colors'] == {'red','blue'}
+
+
+def test_reload_fetches_only_the_changed_objects():
+    renders = render_while_reloading('blue')
+
+    # NOTE the template embedding the css is read again to be compiled with it, the others are untouched
+    assert sorted(renders['reads']) == sorted([STYLE,TEMPLATE])
+    assert renders['latency'] < OBJECT_LATENCY * (TEMPLATES + 2)
+
+
+if __name__ == '__main__':
+    renders = render_while_reloading('blue')
+    print(f"reload of 1 css embedded by 1 of {TEMPLATES+1} templates: {renders['latency']*1000:.1f} ms, objects read {renders['reads']}")
+    print(f"{renders['count']} renders by {RENDER_THREADS} threads meanwhile, {len(renders['failed'])} failed")
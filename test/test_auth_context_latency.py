@@ -0,0 +1,96 @@
+"""
+Latency of the cache reads of an authenticated request: the client, blacklist, policy and challenge keys read with one
+GET after another, like the auth and challenge middlewares did, against the single pipelined read `CacheMany` makes.
+The Redis server is a fakeredis database answering each round trip after `ROUND_TRIP` seconds, `CONCURRENCY` requests
+are in flight at once. The middlewares and the ORM caches need the service container, the reads go through
+`RedisService` the way the caches issue them.
+
+`python test/test_auth_context_latency.py` prints the p50 and p99 of both paths.
+"""
+import asyncio
+import json
+import statistics
+import time
+import fakeredis
+from app.services.database.redis_service import RedisService
+
+ROUND_TRIP = 0.002
+REQUESTS = 500
+CONCURRENCY = 4
+DATABASE = 0
+KEYS = ['client:group-1:client-1','blacklist:group-1:client-1','policy:group-1:client-1','challenge:client-1']
+
+
+class RoundTripRedis(fakeredis.FakeAsyncRedis):
+    """A command, or a whole pipeline, costs one round trip"""
+
+    async def execute_command(self,*args,**options):
+        await asyncio.sleep(ROUND_TRIP)
+        return await super().execute_command(*args,**options)
+
+    def pipeline(self,transaction=True,shard_hint=None):
+        pipe = super().pipeline(transaction,shard_hint)
+        execute = pipe.execute
+
+        async def execute_after_round_trip(raise_on_error=True):
+            await asyncio.sleep(ROUND_TRIP)
+            return await execute(raise_on_error)
+
+        pipe.execute = execute_after_round_trip
+        return pipe
+
+
+def build_service(redis:RoundTripRedis)->RedisService:
+    redisService = RedisService.__new__(RedisService)
+    redisService.db = {DATABASE:redis}
+    return redisService
+
+
+async def serial(redisService:RedisService):
+    return [await redisService.retrieve(DATABASE,key) for key in KEYS]
+
+
+async def pipelined(redisService:RedisService):
+    return [value for value,_ in await redisService.retrieve_many_with_ttl(DATABASE,KEYS)]
+
+
+def latencies(resolve)->list[float]:
+    async def main():
+        redis = RoundTripRedis(decode_responses=True)
+        for key in KEYS:
+            await super(RoundTripRedis,redis).execute_command('SET',key,json.dumps({'key':key}),'EX',3600)
+        redisService = build_service(redis)
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        timings = []
+
+        async def request():
+            async with semaphore:
+                start = time.perf_counter()
+                values = await resolve(redisService)
+                timings.append(time.perf_counter()-start)
+                assert [value['key'] for value in values] == KEYS
+
+        await asyncio.gather(*(request() for _ in range(REQUESTS)))
+        return timings
+    return asyncio.run(main())
+
+
+def percentiles(timings:list[float])->tuple[float,float]:
+    """p50 and p99 in milliseconds"""
+    cuts = statistics.quantiles(timings,n=100)
+    return cuts[49]*1000,cuts[98]*1000
+
+
+def test_pipelined_read_cuts_the_latency():
+    serial_p50,serial_p99 = percentiles(latencies(serial))
+    pipelined_p50,pipelined_p99 = percentiles(latencies(pipelined))
+
+    assert pipelined_p50*2 < serial_p50
+    assert pipelined_p99 < serial_p99
+
+
+if __name__ == '__main__':
+    print(f'{REQUESTS} requests, {CONCURRENCY} in flight, {ROUND_TRIP*1000:.1f} ms per round trip')
+    for name,resolve in (('4 serial GET',serial),('1 pipeline',pipelined)):
+        p50,p99 = percentiles(latencies(resolve))
+        print(f'{name:>12}: p50 {p50:.2f} ms, p99 {p99:.2f} ms')
@@ -0,0 +1,71 @@
+"""
+Shutdown of the buffered broker of `RedisService`: closing the connections while a pipeline is in flight waits for it and
+flushes the commands buffered meanwhile, none is lost.
+"""
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+from app.services.database.redis_service import RedisService
+
+EXECUTE_LATENCY = 0.05
+
+
+class StubPipeline:
+
+    def __init__(self,redis:'StubRedis'):
+        self.redis = redis
+        self.commands = []
+
+    def xadd(self,*args):
+        self.commands.append(args)
+
+    async def execute(self,raise_on_error=True):
+        await asyncio.sleep(EXECUTE_LATENCY)
+        self.redis.executed.extend(self.commands)
+        return [b'id']*len(self.commands)
+
+
+class StubRedis:
+
+    def __init__(self):
+        self.executed = []
+        self.closed = False
+
+    def pipeline(self,transaction=True):
+        return StubPipeline(self)
+
+    async def close(self):
+        self.closed = True
+
+
+def build_service(redis:StubRedis)->RedisService:
+    redisService = RedisService.__new__(RedisService)
+    redisService.db = {0:redis,'events':redis}
+    redisService.to_shutdown = False
+    redisService.monitoringService = None
+    redisService.listener_task = None
+    redisService.callbacks = {'stream':{}}
+    redisService.configService = SimpleNamespace(REDIS_BUFFER_MAX_SIZE=100,REDIS_BUFFER_FLUSH_SIZE=2,REDIS_BUFFER_FLUSH_INTERVAL=10)
+    redisService.buffer = deque()
+    redisService.buffer_event = asyncio.Event()
+    return redisService
+
+
+def test_close_waits_for_the_pipeline_in_flight():
+    async def main():
+        redis = StubRedis()
+        redisService = build_service(redis)
+        redisService.flush_task = asyncio.create_task(redisService._flush_loop())
+
+        for n in range(2):
+            assert redisService._buffer(0,'xadd','stream',{'n':n})
+        # NOTE the flusher is now awaiting the pipeline of the two first commands
+        await asyncio.sleep(EXECUTE_LATENCY/2)
+        assert redisService._buffer(0,'xadd','stream',{'n':2})
+
+        await redisService.close_connections()
+        return redis
+
+    redis = asyncio.run(main())
+    assert [args[1]['n'] for args in redis.executed] == [0,1,2]
+    assert redis.closed
@@ -0,0 +1,123 @@
+"""
+The credit functions of scripts/ncs-lib.lua, run against the redis of `NOTIFYR_TEST_REDIS_URL` when it is set.
+Otherwise the library is evaluated by fakeredis, which has no FUNCTION command: the functions it registers
+are called through EVAL instead of FCALL.
+"""
+import asyncio
+import json
+import os
+from pathlib import Path
+import fakeredis
+from redis.asyncio import Redis
+
+NCS_LIB = (Path(__file__).parent.parent / 'scripts' / 'ncs-lib.lua').read_text()
+REDIS_URL = os.getenv('NOTIFYR_TEST_REDIS_URL')
+
+CREDIT_KEY = 'notifyr/credit:test-email'
+BILL_KEY = f'{CREDIT_KEY}@bill[test]'
+CONCURRENCY = 300
+
+FAKE_FCALL = '\n'.join([
+    'local functions = {}',
+    'local function register(name, fn) functions[name] = fn end',
+    NCS_LIB.split('\n',1)[1].replace('redis.register_function(','register('),
+    'return functions[ARGV[1]](KEYS, {(table.unpack or unpack)(ARGV, 2)})',
+])
+
+
+class Functions:
+
+    def __init__(self,redis:Redis,real:bool):
+        self.redis = redis
+        self.real = real
+
+    async def fcall(self,name:str,keys:list[str],args:list):
+        if self.real:
+            return await self.redis.fcall(name,len(keys),*keys,*args)
+        return await self.redis.eval(FAKE_FCALL,len(keys),*keys,name,*args)
+
+    async def close(self):
+        await self.redis.delete(CREDIT_KEY,BILL_KEY)
+        await self.redis.aclose()
+
+
+async def open_functions()->Functions:
+    if REDIS_URL:
+        redis = Redis.from_url(REDIS_URL,max_connections=CONCURRENCY)
+        await redis.function_load(NCS_LIB,replace=True)
+        functions = Functions(redis,True)
+    else:
+        functions = Functions(fakeredis.FakeAsyncRedis(max_connections=CONCURRENCY),False)
+    await functions.redis.delete(CREDIT_KEY,BILL_KEY)
+    return functions
+
+
+def bill(total:int)->str:
+    return json.dumps({'request_id':'r','definition':'email','purchase_total':total,'refund_total':0,'total':total})
+
+
+def run(test):
+    async def main():
+        functions = await open_functions()
+        try:
+            await test(functions)
+        finally:
+            await functions.close()
+    asyncio.run(main())
+
+
+def test_concurrent_deductions_are_atomic():
+    async def test(functions:Functions):
+        await functions.redis.set(CREDIT_KEY,1000)
+        results = await asyncio.gather(*(functions.fcall('credit_deduct',[CREDIT_KEY,BILL_KEY],[3,0,bill(3)]) for _ in range(CONCURRENCY)))
+
+        assert all(status == 1 for status,_ in results)
+        assert sorted(balance for _,balance in results) == list(range(103,1001,3))
+        assert int(await functions.redis.get(CREDIT_KEY)) == 100
+        assert await functions.redis.llen(BILL_KEY) == CONCURRENCY
+
+    run(test)
+
+
+def test_deduction_refused_without_overdraft():
+    async def test(functions:Functions):
+        await functions.redis.set(CREDIT_KEY,5)
+
+        assert await functions.fcall('credit_deduct',[CREDIT_KEY,BILL_KEY],[10,0,bill(10)]) == [-1,5]
+        assert int(await functions.redis.get(CREDIT_KEY)) == 5
+        assert await functions.redis.llen(BILL_KEY) == 0
+
+        assert await functions.fcall('credit_deduct',[CREDIT_KEY,BILL_KEY],[10,1,bill(10)]) == [1,5]
+        assert int(await functions.redis.get(CREDIT_KEY)) == -5
+
+    run(test)
+
+
+def test_deduction_of_a_missing_credit():
+    async def test(functions:Functions):
+        assert await functions.fcall('credit_deduct',[CREDIT_KEY,BILL_KEY],[1,0,bill(1)]) == [0,0]
+        assert await functions.redis.exists(CREDIT_KEY) == 0
+
+    run(test)
+
+
+def test_refund_pushes_the_bill_with_the_balances():
+    async def test(functions:Functions):
+        await functions.redis.set(CREDIT_KEY,10)
+
+        assert await functions.fcall('credit_refund',[CREDIT_KEY,BILL_KEY],[-4,bill(-4)]) == 10
+        assert int(await functions.redis.get(CREDIT_KEY)) == 14
+
+        pushed = json.loads(await functions.redis.lindex(BILL_KEY,0))
+        assert pushed == {**json.loads(bill(-4)),'balance_before':10,'balance_after':14}
+
+    run(test)
+
+
+def test_empty_bill_is_not_pushed():
+    async def test(functions:Functions):
+        await functions.redis.set(CREDIT_KEY,10)
+        assert await functions.fcall('credit_deduct',[CREDIT_KEY,BILL_KEY],[0,0,bill(0)]) == [1,10]
+        assert await functions.redis.llen(BILL_KEY) == 0
+
+    run(test)
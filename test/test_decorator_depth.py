@@ -0,0 +1,111 @@
+"""
+Cost of the ressource decorators per depth: the guards and pipes resolved once by `compile_stage` and the handlers bound
+once by `chain_decorators`, against the same stages filtered by `APIFilterInject` and chained again on every call.
+The routes of `_ressource.py` need the service container, the stages are driven here the way `UseGuard` and
+`Helper.stack_decorator` drive them.
+
+`python test/test_decorator_depth.py` prints the microseconds per call for 1 to `MAX_DEPTH` stacked decorators.
+"""
+import asyncio
+import time
+from app.definition._utils_decorator import Guard, Handler, call_stage, chain_decorators, compile_stage
+from app.utils.helper import APIFilterInject
+
+MAX_DEPTH = 5
+CALLS = 5000
+KWARGS = {'request':object(),'response':object(),'client':'client-id','scheduler':{'to':['+15550000000']},'taskManager':None,'profile':'main'}
+
+
+class ClientGuard(Guard):
+
+    def guard(self,client:str,profile:str):
+        return client == 'client-id',''
+
+
+class CountHandler(Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def handle(self,function,*args,**kwargs):
+        self.calls+=1
+        return await function(*args,**kwargs)
+
+
+async def endpoint(client:str,scheduler:dict,**kwargs):
+    return client,len(scheduler['to'])
+
+
+def compiled(depth:int):
+    guards = [compile_stage(ClientGuard(),Guard) for _ in range(depth)]
+    handlers = [CountHandler() for _ in range(depth)]
+    chain = chain_decorators(endpoint,handlers,Handler)
+
+    async def call(**kwargs):
+        for stage in guards:
+            flag,_ = await call_stage(stage,(),kwargs)
+            assert flag
+        return await chain(**kwargs)
+    return call,handlers
+
+
+def per_call(depth:int):
+    guards = [ClientGuard() for _ in range(depth)]
+    handlers = [CountHandler() for _ in range(depth)]
+
+    async def call(**kwargs):
+        for guard in guards:
+            flag,_ = APIFilterInject(guard.ref)(**kwargs)
+            assert flag
+        return await chain_decorators(endpoint,handlers,Handler)(**kwargs)
+    return call,handlers
+
+
+def timed(call,calls:int=CALLS)->float:
+    async def main():
+        start = time.perf_counter()
+        for _ in range(calls):
+            await call(**KWARGS)
+        return (time.perf_counter()-start)/calls
+    return asyncio.run(main())
+
+
+def timings()->dict[int,tuple[float,float]]:
+    """Microseconds per call of the compiled and of the per call stages, by depth"""
+    return {depth:(timed(compiled(depth)[0])*1e6,timed(per_call(depth)[0])*1e6) for depth in range(1,MAX_DEPTH+1)}
+
+
+def test_compiled_stages_match_the_per_call_ones():
+    for depth in range(MAX_DEPTH+1):
+        call,handlers = compiled(depth)
+        reference,reference_handlers = per_call(depth)
+        assert asyncio.run(call(**KWARGS)) == asyncio.run(reference(**KWARGS)) == ('client-id',1)
+        assert [handler.calls for handler in handlers] == [handler.calls for handler in reference_handlers] == [1]*depth
+
+
+def test_handlers_run_outermost_first():
+    order = []
+
+    class Named(Handler):
+        def __init__(self,name):
+            super().__init__()
+            self.name = name
+
+        async def handle(self,function,*args,**kwargs):
+            order.append(self.name)
+            return await function(*args,**kwargs)
+
+    asyncio.run(chain_decorators(endpoint,[Named('outer'),Named('inner')],Handler)(**KWARGS))
+    assert order == ['outer','inner']
+
+
+def test_compiled_stages_are_cheaper_at_depth():
+    compiled_cost,per_call_cost = timings()[MAX_DEPTH]
+    assert compiled_cost < per_call_cost
+
+
+if __name__ == '__main__':
+    print(f'{CALLS} calls per depth')
+    for depth,(compiled_cost,per_call_cost) in timings().items():
+        print(f'depth {depth}: {compiled_cost:.1f} us compiled, {per_call_cost:.1f} us resolved per call')
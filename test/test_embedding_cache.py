@@ -0,0 +1,24 @@
+"""
+The batch embedder with its SQLite cache: a text gets the same vector whether it was embedded or read back from the cache.
+"""
+import asyncio
+from app.classes.embedding_batch import BatchEmbedder, EmbeddingCache, StubEmbedding
+
+TEXTS = [f'chunk {i} of the document' for i in range(20)]
+
+
+def test_cached_vectors_match_the_embedded_ones(tmp_path):
+    async def main():
+        stub = StubEmbedding(64)
+        cache = EmbeddingCache(str(tmp_path/'embeddings.db'))
+        cold = BatchEmbedder(stub.aget_text_embedding_batch,stub.model,stub.dimensions,cache,batch_size=8)
+        embedded = await cold.embed(TEXTS)
+
+        warm = BatchEmbedder(stub.aget_text_embedding_batch,stub.model,stub.dimensions,cache,batch_size=8)
+        cached = await warm.embed(TEXTS)
+        cache.close()
+        return embedded,cached,warm.stats
+
+    embedded,cached,stats = asyncio.run(main())
+    assert stats['cache_hits'] == len(TEXTS) and stats['requests'] == 0
+    assert embedded == cached
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import fakeredis
+from mmdb_writer import MMDBWriter
+from netaddr import IPSet
+from app.classes.geo_resolver import CachedGeoResolver, GeoResolutionError, GeoResolver, MMDBGeoResolver
+
+LOCATION = {'country':'US','geo_lat':37.4,'geo_long':-122.1,'region':'California','city':'Mountain View','timezone':'America/Los_Angeles'}
+FAILING_IP = '8.8.4.4'
+
+
+class FakeIPInfo(GeoResolver):
+    name = 'ipinfo'
+    remote = True
+
+    def __init__(self):
+        self.calls = 0
+
+    async def resolve(self,ip_address:str):
+        self.calls+=1
+        await asyncio.sleep(0.01)
+        if ip_address == FAILING_IP:
+            raise GeoResolutionError(503)
+        return dict(LOCATION)
+
+
+def shared_cache(round_trips:list=None):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    round_trips = [] if round_trips == None else round_trips
+
+    async def retrieve(key:str):
+        round_trips.append('GET')
+        value = await redis.get(key)
+        return json.loads(value) if value else value
+
+    async def store(key:str,value,ttl:int):
+        round_trips.append('SET')
+        await redis.set(key,json.dumps(value),ex=ttl)
+
+    async def retrieve_many(keys:list[str]):
+        round_trips.append('MGET')
+        return [json.loads(value) if value else value for value in await redis.mget(keys)]
+
+    async def store_many(items:list[tuple]):
+        round_trips.append('PIPELINE')
+        async with redis.pipeline(transaction=False) as pipe:
+            for key,value,ttl in items:
+                pipe.set(key,json.dumps(value),ex=ttl)
+            await pipe.execute()
+
+    return retrieve,store,retrieve_many,store_many
+
+
+def write_mmdb(path:str,city:str):
+    writer = MMDBWriter(ip_version=4,database_type='GeoLite2-City')
+    writer.insert_network(IPSet(['8.8.8.0/24']),{'country':{'iso_code':'US'},'city':{'names':{'en':city}}})
+    writer.to_db_file(path)
+
+
+def test_concurrent_misses_are_resolved_once():
+    async def main():
+        provider = FakeIPInfo()
+        resolver = CachedGeoResolver(provider,100)
+        results = await asyncio.gather(*(resolver.resolve('8.8.8.8, 10.0.0.1') for _ in range(50)))
+        assert provider.calls == 1
+        assert all(result == LOCATION for result in results)
+    asyncio.run(main())
+
+
+def test_lookups_are_shared_between_workers():
+    async def main():
+        retrieve,store,*_ = shared_cache()
+        first,second = FakeIPInfo(),FakeIPInfo()
+
+        assert await CachedGeoResolver(first,100,retrieve,store).resolve('8.8.8.8') == LOCATION
+        assert await CachedGeoResolver(second,100,retrieve,store).resolve('8.8.8.8') == LOCATION
+        assert (first.calls,second.calls) == (1,0)
+    asyncio.run(main())
+
+
+def test_provider_errors_are_not_cached():
+    async def main():
+        retrieve,store,*_ = shared_cache()
+        provider = FakeIPInfo()
+        resolver = CachedGeoResolver(provider,100,retrieve,store)
+
+        assert await resolver.resolve(FAILING_IP) is None
+        assert await resolver.resolve(FAILING_IP) is None
+        assert provider.calls == 2
+    asyncio.run(main())
+
+
+def test_private_addresses_are_not_resolved():
+    async def main():
+        provider = FakeIPInfo()
+        assert await CachedGeoResolver(provider,100).resolve('10.0.0.1') is None
+        assert provider.calls == 0
+    asyncio.run(main())
+
+
+def test_batch_is_read_and_stored_in_one_round_trip():
+    async def main():
+        round_trips = []
+        retrieve,store,retrieve_many,store_many = shared_cache(round_trips)
+        await CachedGeoResolver(FakeIPInfo(),100,retrieve,store,retrieve_many=retrieve_many,store_many=store_many).resolve('8.8.8.8')
+
+        provider = FakeIPInfo()
+        resolver = CachedGeoResolver(provider,100,retrieve,store,retrieve_many=retrieve_many,store_many=store_many)
+        round_trips.clear()
+        results = await resolver.resolve_many(['8.8.8.8','1.1.1.1','10.0.0.1',None,'1.1.1.1',FAILING_IP,'9.9.9.9'])
+
+        assert results == [LOCATION,LOCATION,None,None,LOCATION,None,LOCATION]
+        assert round_trips == ['MGET','PIPELINE']
+        # NOTE 8.8.8.8 comes from the shared cache and 1.1.1.1 is looked up once
+        assert provider.calls == 3
+        assert await CachedGeoResolver(FakeIPInfo(),100,retrieve,store).resolve('9.9.9.9') == LOCATION
+    asyncio.run(main())
+
+
+def test_mmdb_is_reopened_when_replaced(tmp_path):
+    path = str(tmp_path/'GeoLite2-City.mmdb')
+    write_mmdb(path,'Mountain View')
+    resolver = MMDBGeoResolver(path,check_interval=0)
+    assert resolver.lookup('8.8.8.8')['city'] == 'Mountain View'
+
+    write_mmdb(path+'.tmp','Palo Alto')
+    # NOTE geoipupdate moves the new file in place, the mtime must differ from the replaced one
+    os.utime(path+'.tmp',(resolver.mtime+1,resolver.mtime+1))
+    os.replace(path+'.tmp',path)
+    assert resolver.lookup('8.8.8.8')['city'] == 'Palo Alto'
+
+    os.remove(path)
+    assert resolver.lookup('8.8.8.8')['city'] == 'Palo Alto'
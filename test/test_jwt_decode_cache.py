@@ -0,0 +1,87 @@
+"""
+Decodes per second of `JWTAuthService` with a cold and a warm decoded token cache, the vault holding the keys is a stub.
+The ChaCha20 ciphertext of the outer layer is not valid utf-8, the benchmark carries it as hex so the tokens round trip.
+
+`python test/test_jwt_decode_cache.py` prints the benchmark report.
+"""
+import base64
+import time
+from types import SimpleNamespace
+from app.classes.secrets import ChaCha20SecretsWrapper
+from app.services.security_service import JWTAuthService
+
+CLIENTS = 200
+ROUNDS = 5 # NOTE each client authenticates this many requests with its token
+
+
+class HexJWTAuthService(JWTAuthService):
+
+    def _encode_value(self,value:str,key:str)->str:
+        value = base64.b64encode(value.encode()).decode()
+        return ChaCha20SecretsWrapper(value,key.encode(),self.nonce).cipher_data.hex()
+
+    def _decode_value(self,value:str,key:str)->str:
+        cipher = ChaCha20SecretsWrapper('',key.encode(),self.nonce)
+        cipher.cipher_data = {'value':bytes.fromhex(value)}
+        return base64.b64decode(cipher.to_plain()['value']).decode()
+
+
+def build_service(cache_size:int=10000)->JWTAuthService:
+    configService = SimpleNamespace(JWT_DECODE_CACHE_SIZE=cache_size,JWT_DECODE_CACHE_TTL=60*60*3)
+    settingService = SimpleNamespace(AUTH_EXPIRATION=3600)
+    vaultService = SimpleNamespace(JWT_SECRET_KEY='s'*64,ON_TOP_SECRET_KEY='o'*32,JWT_ALGORITHM='HS256',tokens={})
+    monitoringService = SimpleNamespace(counter_inc=lambda *args,**kwargs:None)
+    jwtAuthService = HexJWTAuthService(configService,None,settingService,vaultService,monitoringService)
+    jwtAuthService.generation_id_data = {'data':{'GENERATION_ID':'generation'}}
+    return jwtAuthService
+
+
+def tokens(jwtAuthService:JWTAuthService)->list[str]:
+    return [jwtAuthService.encode_auth_token(f'authz-{i}',f'client-{i}','challenge',None) for i in range(CLIENTS)]
+
+
+def decodes_per_second(jwtAuthService:JWTAuthService,tokens:list[str])->float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for token in tokens:
+            jwtAuthService._decode_token(token)
+    return ROUNDS*len(tokens)/(time.perf_counter()-start)
+
+
+def run_benchmark()->dict[str,tuple[float,dict]]:
+    results = {}
+    # NOTE a cache smaller than the clients thrashes like the previous 50 entries cache
+    for name,cache_size in (('cold',1),('warm',10000)):
+        jwtAuthService = build_service(cache_size)
+        results[name] = decodes_per_second(jwtAuthService,tokens(jwtAuthService)),jwtAuthService.token_cache_stats
+    return results
+
+
+def test_warm_cache_decodes_faster():
+    results = run_benchmark()
+
+    cold,cold_stats = results['cold']
+    warm,warm_stats = results['warm']
+    assert cold_stats['hits'] == 0
+    assert warm_stats['misses'] == CLIENTS
+    assert warm > cold * 2
+
+
+def test_revoked_client_is_decoded_again():
+    jwtAuthService = build_service()
+    first,second = tokens(jwtAuthService)[:2]
+    for token in (first,second,first,second):
+        jwtAuthService._decode_token(token)
+    assert jwtAuthService.token_cache_stats['misses'] == 2
+
+    jwtAuthService.evict_client_tokens(['client-0'])
+    decoded = jwtAuthService._decode_token(first)
+    jwtAuthService._decode_token(second)
+
+    assert decoded['client_id'] == 'client-0'
+    assert jwtAuthService.token_cache_stats['misses'] == 3
+
+
+if __name__ == '__main__':
+    for name,(rate,stats) in run_benchmark().items():
+        print(f'{name:>5}: {rate:,.0f} decodes/s, {stats}')
@@ -0,0 +1,148 @@
+"""
+Accuracy and overhead of the limiter storages when several workers share one sliding window.
+Against the redis of `NOTIFYR_TEST_REDIS_URL` the workers are forked processes, otherwise they are threads
+with their own storage on one fakeredis server: the fakeredis TCP server can not receive the scripts of the storage.
+
+`python test/test_limiter_storage.py` prints the benchmark report.
+"""
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import os
+import time
+from typing import Callable
+import fakeredis
+from limits import parse
+from limits.storage import MemoryStorage, storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+from redis import ConnectionPool
+from starlette.requests import Request
+from starlette.responses import Response
+from app.classes.limiter_storage import LEASED_REDIS_SCHEME, NotifyrLimiter
+
+REDIS_URL = os.getenv('NOTIFYR_TEST_REDIS_URL')
+
+WORKERS = 4
+ATTEMPTS = 400
+LIMIT = '1000/minute' # NOTE the workers attempt more than the limit to measure the accuracy
+UNREACHED_LIMIT = '100000/minute' # NOTE and less to measure the overhead of the checks that are admitted
+LEASE_SIZE = 10
+
+
+def hammer(args:tuple[str,dict,str,str])->tuple[int,float]:
+    uri,options,key,limit = args
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri,**options))
+    item = parse(limit)
+    admitted = 0
+    start = time.perf_counter()
+    for _ in range(ATTEMPTS):
+        admitted+=limiter.hit(item,key)
+    return admitted,(time.perf_counter()-start)/ATTEMPTS
+
+
+def benchmark(executor:Callable[[],Executor],uri:str,options:dict,key:str)->tuple[int,float]:
+    with executor() as pool:
+        admitted = sum(r[0] for r in pool.map(hammer,[(uri,options,f'{key}-accuracy',LIMIT)]*WORKERS))
+    with executor() as pool:
+        overhead = sum(r[1] for r in pool.map(hammer,[(uri,options,f'{key}-overhead',UNREACHED_LIMIT)]*WORKERS))/WORKERS
+    return admitted,overhead
+
+
+def run_benchmarks()->dict[str,tuple[int,float]]:
+    run_id = time.time_ns()
+    if REDIS_URL:
+        url,options = REDIS_URL,{}
+        executor = lambda: ProcessPoolExecutor(WORKERS,mp_context=multiprocessing.get_context('fork'))
+    else:
+        url,options = 'redis://fakeredis:6379/1',{'connection_pool':ConnectionPool(connection_class=fakeredis.FakeConnection,server=fakeredis.FakeServer())}
+        executor = lambda: ThreadPoolExecutor(WORKERS)
+
+    leased_url = LEASED_REDIS_SCHEME + url[url.index('://'):]
+    return {
+        'redis': benchmark(executor,url,options,f'bench-plain-{run_id}'),
+        'leased': benchmark(executor,leased_url,{**options,'lease_size':LEASE_SIZE,'lease_ttl':5},f'bench-leased-{run_id}'),
+    }
+
+
+def test_shared_window_accuracy():
+    limit = parse(LIMIT).amount
+    results = run_benchmarks()
+
+    admitted,_ = results['redis']
+    assert admitted == limit
+
+    # NOTE a worker can stop with part of its lease unspent, those entries are counted but never admitted
+    admitted,_ = results['leased']
+    assert limit - WORKERS*LEASE_SIZE <= admitted <= limit
+
+
+class SlowStorage(MemoryStorage):
+    """Memory storage whose calls block like a network round trip"""
+
+    def __init__(self,uri:str='memory://',delay:float=.05,**options):
+        super().__init__(uri,**options)
+        self.delay = delay
+
+    def acquire_sliding_window_entry(self,*args,**kwargs):
+        time.sleep(self.delay)
+        return super().acquire_sliding_window_entry(*args,**kwargs)
+
+    def get_sliding_window(self,*args,**kwargs):
+        time.sleep(self.delay)
+        return super().get_sliding_window(*args,**kwargs)
+
+
+def build_request()->Request:
+    return Request({'type':'http','method':'GET','path':'/ping','headers':[],'client':('10.0.0.1',1234),'query_string':b''})
+
+
+def route(limiter:NotifyrLimiter):
+
+    @limiter.limit('100/minute')
+    async def ping(request:Request):
+        return Response('pong')
+
+    return ping
+
+
+def test_limiter_checks_do_not_block_the_loop():
+    limiter = NotifyrLimiter(lambda request:'client',strategy='sliding-window-counter',headers_enabled=True)
+    limiter._storage = SlowStorage()
+    limiter._limiter = SlidingWindowCounterRateLimiter(limiter._storage)
+    ping = route(limiter)
+
+    async def main():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(.005)
+                ticks+=1
+
+        task = asyncio.create_task(ticker())
+        response = await ping(build_request())
+        task.cancel()
+        return response,ticks
+
+    response,ticks = asyncio.run(main())
+    assert response.headers['X-RateLimit-Remaining'] == '99'
+    # NOTE the check and the headers wait 100ms on the storage, the loop keeps running meanwhile
+    assert ticks >= 10
+
+
+def test_limiter_reports_the_memory_fallback():
+    states:list[bool] = []
+    limiter = NotifyrLimiter(lambda request:'client',storage_uri='redis://127.0.0.1:1/1',strategy='sliding-window-counter',in_memory_fallback_enabled=True,on_fallback=states.append)
+    ping = route(limiter)
+
+    response = asyncio.run(ping(build_request()))
+    assert response.body == b'pong'
+    assert states == [True]
+
+    limiter._storage_dead = False
+    assert states == [True,False]
+
+
+if __name__ == '__main__':
+    for name,(admitted,overhead) in run_benchmarks().items():
+        print(f'{name:>8}: {admitted}/{parse(LIMIT).amount} admitted by {WORKERS} workers, {overhead*1000:.3f} ms per check')
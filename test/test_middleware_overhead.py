@@ -0,0 +1,144 @@
+"""
+Overhead of the middleware stack: the raw ASGI `MiddleWare` against the same middleware written on `BaseHTTPMiddleware`,
+each stacked `DEPTH` times in front of an application answering a fixed response, with the `ExcludeOn` rules of the
+server middlewares. A streaming response goes through the raw stack chunk by chunk.
+
+`python test/test_middleware_overhead.py` prints the overhead of one middleware in microseconds per request.
+"""
+import asyncio
+import time
+from fnmatch import fnmatch
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.types import Message, Receive, Scope, Send
+from app.definition._middleware import ExcludeOn, MiddleWare, parse_urls
+
+DEPTH = 4
+REQUESTS = 2000
+EXCLUDED = ['/docs/*','/openapi.json','/auth/generate/*','/link/visits/*','/link/email-track/*','/']
+PATH = '/email/template/welcome'
+
+
+class HeaderMiddleWare(MiddleWare):
+
+    @ExcludeOn(['/docs/*','/openapi.json'])
+    @ExcludeOn(['/auth/generate/*','/link/visits/*','/link/email-track/*'])
+    @ExcludeOn(['/'])
+    async def handle(self, scope:Scope, receive:Receive, send:Send):
+
+        async def send_with_header(message:Message):
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message)['X-Depth'] = 'raw'
+            await send(message)
+
+        await self.app(scope,receive,send_with_header)
+
+
+class PassMiddleWare(MiddleWare):
+
+    @ExcludeOn(['/docs/*','/openapi.json'])
+    @ExcludeOn(['/auth/generate/*','/link/visits/*','/link/email-track/*'])
+    @ExcludeOn(['/'])
+    async def dispatch(self, request:Request):
+        return None
+
+
+class BaseHTTPHeaderMiddleWare(BaseHTTPMiddleware):
+    """
+    The middleware as it was written before, deciding with `fnmatch` on every request
+    """
+    excluded = parse_urls(EXCLUDED)
+
+    async def dispatch(self, request:Request, call_next):
+        if any(fnmatch(request.url.path,path) for path in self.excluded):
+            return await call_next(request)
+        response = await call_next(request)
+        response.headers['X-Depth'] = 'base'
+        return response
+
+
+async def endpoint(scope:Scope, receive:Receive, send:Send):
+    await PlainTextResponse('ok')(scope,receive,send)
+
+
+async def streaming_endpoint(scope:Scope, receive:Receive, send:Send):
+    async def chunks():
+        for i in range(3):
+            yield f'chunk-{i};'
+    await StreamingResponse(chunks())(scope,receive,send)
+
+
+def stack(middleware:type,app,depth:int=DEPTH):
+    for _ in range(depth):
+        app = middleware(app)
+    return app
+
+
+def make_scope(path:str=PATH)->Scope:
+    return {'type':'http','method':'GET','path':path,'raw_path':path.encode(),'query_string':b'','headers':[],'scheme':'http','server':('test',80),'client':('127.0.0.1',1),'root_path':'','http_version':'1.1'}
+
+
+async def call(app,path:str=PATH)->list[Message]:
+    messages:list[Message] = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {'type':'http.disconnect'}
+        received = True
+        return {'type':'http.request','body':b'','more_body':False}
+
+    async def send(message:Message):
+        messages.append(message)
+
+    await app(make_scope(path),receive,send)
+    return messages
+
+
+def per_request(app,requests:int=REQUESTS)->float:
+    async def main():
+        await call(app)
+        start = time.perf_counter()
+        for _ in range(requests):
+            await call(app)
+        return (time.perf_counter()-start)/requests
+    return asyncio.run(main())
+
+
+def overheads(depth:int=DEPTH)->dict[str,float]:
+    """Microseconds added by one middleware to a request"""
+    bare = per_request(endpoint)
+    return {
+        name:(per_request(stack(middleware,endpoint,depth))-bare)/depth*1e6
+        for name,middleware in (('raw dispatch',PassMiddleWare),('raw handle',HeaderMiddleWare),('BaseHTTPMiddleware',BaseHTTPHeaderMiddleWare))
+    }
+
+
+def test_raw_middleware_is_cheaper_than_base_http():
+    timings = overheads()
+    assert timings['raw handle'] < timings['BaseHTTPMiddleware']
+    assert timings['raw dispatch'] < timings['BaseHTTPMiddleware']
+
+
+def test_excluded_paths_skip_the_middleware():
+    messages = asyncio.run(call(stack(HeaderMiddleWare,endpoint),'/docs/index.html'))
+    assert all(name != b'x-depth' for name,_ in messages[0]['headers'])
+
+    messages = asyncio.run(call(stack(HeaderMiddleWare,endpoint)))
+    assert (b'x-depth',b'raw') in messages[0]['headers']
+
+
+def test_streaming_response_goes_through_chunk_by_chunk():
+    messages = asyncio.run(call(stack(HeaderMiddleWare,streaming_endpoint)))
+    bodies = [message['body'] for message in messages if message['type'] == 'http.response.body' and message['body']]
+    assert bodies == [b'chunk-0;',b'chunk-1;',b'chunk-2;']
+    assert (b'x-depth',b'raw') in messages[0]['headers']
+
+
+if __name__ == '__main__':
+    print(f'{REQUESTS} requests through {DEPTH} stacked middlewares')
+    for name,overhead in overheads().items():
+        print(f'{name:>20}: {overhead:.1f} us per middleware')
@@ -0,0 +1,122 @@
+"""
+Cold start of `AssetService` against a local MinIO instance: the bucket is listed and every template fetched and parsed,
+with a single fetch in flight like the serial reader did, then with `S3_LOAD_CONCURRENCY` fetches in flight.
+
+The objects are written to the `BUCKET` bucket of the MinIO server at `MINIO_ENDPOINT`, the test is skipped when it is
+not set, e.g. `MINIO_ENDPOINT=localhost:9000 MINIO_ACCESS_KEY=minioadmin MINIO_SECRET_KEY=minioadmin`.
+
+`python test/test_minio_cold_start.py` prints the cold start time of both.
+"""
+import io
+import json
+import os
+import time
+from types import SimpleNamespace
+import pytest
+from minio import Minio
+from app.services.assets_service import AssetService
+from app.services.config_service import AssetMode, ConfigService
+from app.services.database.object_service import ObjectS3Service
+from app.services.file.file_service import FileService
+
+MINIO_ENDPOINT = os.environ.get('MINIO_ENDPOINT',None)
+BUCKET = 'notifyr-cold-start'
+TEMPLATES = 200
+S3_LOAD_CONCURRENCY = 10
+
+HTML = '<html><head><title>Template {i}</title></head><body><p class="intro">{{{{ intro }}}}</p></body></html>'
+STYLE = '.intro {{ color: #{i:06x}; }}'
+SMS_XML = '<Response><Message>Your code is {{ code }}</Message></Response>'
+
+
+class BenchObjectS3Service(ObjectS3Service):
+    """The object service on the benchmark bucket"""
+
+    def read_object(self,object_name:str,version_id:str=None,buckets=BUCKET):
+        return super().read_object(object_name,version_id,buckets)
+
+    def iter_objects(self,prefix:str='',recursive:bool=True,match:str=None,include_version=True,include_delete_marker=True,buckets=BUCKET):
+        return super().iter_objects(prefix,recursive,match,include_version,include_delete_marker,buckets)
+
+
+def build_client()->Minio:
+    return Minio(MINIO_ENDPOINT,os.environ.get('MINIO_ACCESS_KEY','minioadmin'),os.environ.get('MINIO_SECRET_KEY','minioadmin'),secure=False)
+
+
+def objects()->dict[str,str]:
+    contents = {'globals.json':json.dumps({}),'sms/otp/code.xml':SMS_XML}
+    for i in range(TEMPLATES):
+        contents[f'email/template{i}/index.html'] = HTML.format(i=i)
+        contents[f'email/template{i}/style.css'] = STYLE.format(i=i)
+    return contents
+
+
+def fill_bucket(client:Minio):
+    if not client.bucket_exists(BUCKET):
+        client.make_bucket(BUCKET)
+
+    existing = {obj.object_name for obj in client.list_objects(BUCKET,recursive=True)}
+    for name,content in objects().items():
+        if name in existing:
+            continue
+        data = content.encode()
+        client.put_object(BUCKET,name,io.BytesIO(data),len(data))
+
+
+def build_config(concurrency:int)->ConfigService:
+    configService = ConfigService.__new__(ConfigService)
+    configService.__dict__.update(
+        ASSETS_DIR='assets/',
+        OBJECTS_DIR='',
+        ASSET_MODE=AssetMode.s3,
+        S3_TO_DISK=False,
+        S3_LOAD_CONCURRENCY=concurrency,
+        S3_DECRYPT_BATCH_SIZE=64,
+        ASSET_ARTIFACT_CACHE=False,
+        TEMPLATE_CACHE_MAX_MEMORY=64*1024*1024,
+    )
+    return configService
+
+
+def cold_start(client:Minio,concurrency:int)->tuple[float,AssetService]:
+    configService = build_config(concurrency)
+    fileService = FileService(configService)
+    objectS3Service = BenchObjectS3Service.__new__(BenchObjectS3Service)
+    objectS3Service.client = client
+    objectS3Service.fileService = fileService
+
+    settingService = SimpleNamespace(ASSET_LANG='en')
+    assetService = AssetService(SimpleNamespace(transit_engine=None),None,fileService,configService,objectS3Service,settingService,None)
+    start = time.perf_counter()
+    assetService.build()
+    return time.perf_counter()-start,assetService
+
+
+def timings()->dict[str,float]:
+    client = build_client()
+    fill_bucket(client)
+    return {
+        'serial':cold_start(client,1)[0],
+        f'{S3_LOAD_CONCURRENCY} in flight':cold_start(client,S3_LOAD_CONCURRENCY)[0],
+    }
+
+
+@pytest.mark.skipif(MINIO_ENDPOINT == None,reason='MINIO_ENDPOINT is not set')
+def test_concurrent_fetch_speeds_up_the_cold_start():
+    client = build_client()
+    fill_bucket(client)
+    serial,_ = cold_start(client,1)
+    elapsed,assetService = cold_start(client,S3_LOAD_CONCURRENCY)
+
+    assert len(assetService.email) == TEMPLATES
+    _,(html,_) = assetService.email['email/template1/index.html'].build({'intro':'hello'},'en')
+    assert '#000001' in html
+    assert elapsed < serial
+
+
+if __name__ == '__main__':
+    if MINIO_ENDPOINT == None:
+        raise SystemExit('MINIO_ENDPOINT is not set')
+    print(f'{TEMPLATES} html templates with their css at {MINIO_ENDPOINT}')
+    for name,elapsed in timings().items():
+        print(f'{name:>14}: {elapsed*1000:.0f} ms')
@@ -0,0 +1,61 @@
+"""
+The monitoring helpers record the labelled metrics of the service once it is built.
+"""
+from types import SimpleNamespace
+from prometheus_client import REGISTRY
+from app.definition._service import ServiceStatus
+from app.services.config_service import MODE
+from app.services.monitoring_service import MonitoringService
+from app.utils.constant import MonitorConstant
+
+
+def build_monitoring()->MonitoringService:
+    monitoringService = MonitoringService(SimpleNamespace(MODE=MODE.TEST_MODE))
+    monitoringService.verify_dependency()
+    monitoringService.build()
+    monitoringService.service_status = ServiceStatus.AVAILABLE
+    return monitoringService
+
+
+# NOTE the metrics are registered on the default registry, they can only be built once per process
+monitoringService = build_monitoring()
+
+
+def sample(name:str,**labels)->float:
+    return REGISTRY.get_sample_value(name,labels) or 0.0
+
+
+def test_labelled_counter_is_incremented():
+    before = sample('broker_buffer_ops_total',outcome='flushed')
+    monitoringService.counter_inc(MonitorConstant.BROKER_BUFFER_OPS,3,outcome='flushed')
+    monitoringService.counter_inc(MonitorConstant.JWT_DECODE_CACHE,result='hit')
+
+    assert sample('broker_buffer_ops_total',outcome='flushed') == before + 3
+    assert sample('jwt_decode_cache_total',result='hit') >= 1
+
+
+def test_labelled_histogram_is_observed():
+    before = sample('redis_pubsub_dispatch_latency_seconds_count',channel='asset-reload')
+    monitoringService.histogram_observe(MonitorConstant.PUBSUB_DISPATCH_LATENCY,.002,channel='asset-reload')
+    monitoringService.histogram_observe_many(MonitorConstant.STREAM_EVENT_LATENCY,[.1,.2],stream='events')
+
+    assert sample('redis_pubsub_dispatch_latency_seconds_count',channel='asset-reload') == before + 1
+    assert sample('redis_stream_event_latency_seconds_count',stream='events') >= 2
+
+
+def test_gauges_are_set():
+    monitoringService.gauge_set(MonitorConstant.STREAM_BACKLOG,42,stream='events')
+    monitoringService.gauge_set(MonitorConstant.LIMITER_STORAGE_FALLBACK,1)
+
+    assert sample('redis_stream_backlog',stream='events') == 42
+    assert sample('limiter_storage_fallback') == 1
+
+
+def test_nothing_is_recorded_until_available():
+    monitoringService.service_status = ServiceStatus.NOT_AVAILABLE
+    try:
+        before = sample('broker_buffer_ops_total',outcome='failed')
+        monitoringService.counter_inc(MonitorConstant.BROKER_BUFFER_OPS,outcome='failed')
+        assert sample('broker_buffer_ops_total',outcome='failed') == before
+    finally:
+        monitoringService.service_status = ServiceStatus.AVAILABLE
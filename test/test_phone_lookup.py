@@ -0,0 +1,143 @@
+"""
+Latency of the phone lookup cache against a stubbed Twilio lookup that takes `LOOKUP_LATENCY` seconds,
+the Redis tier is a fakeredis database shared by the caches the way it is shared by the workers.
+
+`python test/test_phone_lookup.py` prints the cold and warm batch timings.
+"""
+import asyncio
+import json
+import time
+import fakeredis
+from twilio.base.exceptions import TwilioRestException
+from app.classes.phone_lookup import PhoneLookupCache, is_transient
+
+LOOKUP_LATENCY = 0.05
+NUMBERS = [f'+1555{i:07d}' for i in range(100)]
+UNKNOWN = set(NUMBERS[::10])
+CONCURRENCY = 10
+QUERY = ['line_type_intelligence']
+
+
+class StubTwilio:
+
+    def __init__(self,failing_status:int|None=None):
+        self.calls = 0
+        self.failing_status = failing_status
+
+    async def lookup(self,phone_number:str,query:list[str])->dict:
+        self.calls+=1
+        await asyncio.sleep(LOOKUP_LATENCY)
+        if self.failing_status != None:
+            raise TwilioRestException(self.failing_status,'/v2/PhoneNumbers','unavailable')
+        if phone_number in UNKNOWN:
+            raise TwilioRestException(404,'/v2/PhoneNumbers','not found',20404)
+        return {'phone_number':phone_number,'carrier':{'type':'mobile'}}
+
+
+def build_cache(twilio:StubTwilio,redis:fakeredis.FakeAsyncRedis)->PhoneLookupCache:
+
+    async def retrieve_many(keys:list[str]):
+        return [None if value == None else json.loads(value) for value in await redis.mget(keys)]
+
+    async def store_many(items:list[tuple[str,dict,int]]):
+        async with redis.pipeline(transaction=False) as pipe:
+            for key,value,ttl in items:
+                pipe.set(key,json.dumps(value),ex=ttl)
+            await pipe.execute()
+
+    return PhoneLookupCache(twilio.lookup,retrieve_many,store_many,concurrency=CONCURRENCY)
+
+
+async def timed(cache:PhoneLookupCache)->tuple[dict,float]:
+    start = time.perf_counter()
+    results = await cache.get_many(NUMBERS,QUERY)
+    return results,time.perf_counter()-start
+
+
+def run_batches()->dict[str,tuple[float,int]]:
+    async def main():
+        redis = fakeredis.FakeAsyncRedis()
+        twilio = StubTwilio()
+        cache = build_cache(twilio,redis)
+        timings = {}
+
+        results,elapsed = await timed(cache)
+        assert sum(status == 200 for status,_ in results.values()) == len(NUMBERS) - len(UNKNOWN)
+        timings['cold'] = elapsed,twilio.calls
+
+        _,elapsed = await timed(cache)
+        timings['local'] = elapsed,twilio.calls
+
+        # NOTE a cache of another worker only shares the Redis tier
+        _,elapsed = await timed(build_cache(twilio,redis))
+        timings['redis'] = elapsed,twilio.calls
+        return timings
+    return asyncio.run(main())
+
+
+def test_warm_batches_do_not_reach_twilio():
+    timings = run_batches()
+
+    elapsed,calls = timings['cold']
+    assert calls == len(NUMBERS)
+    assert elapsed >= LOOKUP_LATENCY * len(NUMBERS) / CONCURRENCY
+
+    for tier in ('local','redis'):
+        elapsed,calls = timings[tier]
+        assert calls == len(NUMBERS)
+        assert elapsed < LOOKUP_LATENCY
+
+
+def test_transient_failures_are_not_cached():
+    async def main():
+        twilio = StubTwilio(503)
+        cache = build_cache(twilio,fakeredis.FakeAsyncRedis())
+        first = await cache.get(NUMBERS[1],QUERY)
+        second = await cache.get(NUMBERS[1],QUERY)
+        return first,second,twilio.calls
+
+    first,second,calls = asyncio.run(main())
+    assert is_transient(first[0]) and is_transient(second[0])
+    assert calls == 2
+
+
+def test_account_failures_are_not_cached():
+    async def main():
+        # NOTE a 401 or a 403 comes from the credentials, not from the number
+        twilio = StubTwilio(401)
+        cache = build_cache(twilio,fakeredis.FakeAsyncRedis())
+        first = await cache.get(NUMBERS[1],QUERY)
+        second = await cache.get(NUMBERS[1],QUERY)
+        return first,second,twilio.calls
+
+    first,second,calls = asyncio.run(main())
+    assert first[0] == second[0] == 401
+    assert calls == 2
+
+
+def test_unknown_numbers_are_cached():
+    async def main():
+        twilio = StubTwilio()
+        cache = build_cache(twilio,fakeredis.FakeAsyncRedis())
+        first = await cache.get(NUMBERS[0],QUERY)
+        second = await cache.get(NUMBERS[0],QUERY)
+        return first,second,twilio.calls
+
+    first,second,calls = asyncio.run(main())
+    assert first[0] == second[0] == 404
+    assert calls == 1
+
+
+def test_concurrent_callers_share_the_lookup():
+    async def main():
+        twilio = StubTwilio()
+        cache = build_cache(twilio,fakeredis.FakeAsyncRedis())
+        await asyncio.gather(*(cache.get(NUMBERS[1],QUERY) for _ in range(20)))
+        return twilio.calls
+
+    assert asyncio.run(main()) == 1
+
+
+if __name__ == '__main__':
+    for tier,(elapsed,calls) in run_batches().items():
+        print(f'{tier:>6}: {len(NUMBERS)} numbers in {elapsed*1000:.1f} ms, {calls} twilio lookups so far')
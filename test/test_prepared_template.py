@@ -0,0 +1,54 @@
+from app.classes.template import URL_PATTERN, HTMLTemplate
+
+HTML = """<html><head><title>Welcome</title></head><body>
+<p>{{ intro | sub_url }}</p>
+<a href="{{ link | sub_url }}">Open</a>
+<p>{{ footer | sub_url }}</p>
+</body></html>"""
+
+DATA = {
+    'intro':'Read https://a.example/x and https://b.example/y?q=1 then https://a.example/x again',
+    'link':'https://c.example/',
+    'footer':'No link in this one',
+}
+
+
+def make_template():
+    template = HTMLTemplate('welcome.html',HTML,'email',len(HTML))
+    template.load()
+    template.add_tracking_pixel()
+    template.set_content()
+    return template
+
+
+def track(contact_id:str):
+    def callback(content:str):
+        if content == None:
+            return None
+        return URL_PATTERN.sub(lambda match: f'https://t.example/link/t/?r={match.group(0)}&contact_id={contact_id}',content)
+    return callback
+
+
+def test_prepare_slots_every_url_of_a_filtered_value():
+    prepared = make_template().prepare(dict(DATA))
+    assert prepared.links == ['https://a.example/x','https://b.example/y?q=1','https://c.example/']
+
+
+def test_prepare_matches_build_for_each_recipient():
+    template = make_template()
+    prepared = template.prepare(dict(DATA))
+
+    for contact_id in ('c1','c2'):
+        callback = track(contact_id)
+        pixel = f'https://t.example/pixel?contact_id={contact_id}'
+        expected = template.build(dict(DATA),None,callback,tracking_url=pixel)
+        assert prepared.build(pixel,[callback(url) for url in prepared.links]) == expected
+
+
+def test_prepare_without_links():
+    template = make_template()
+    data = {key:'plain text' for key in DATA}
+    prepared = template.prepare(dict(data))
+
+    assert prepared.links == []
+    assert prepared.build('pixel',[]) == template.build(dict(data),None,track('c1'),tracking_url='pixel')
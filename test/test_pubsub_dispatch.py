@@ -0,0 +1,59 @@
+"""
+The pubsub listener of `RedisService` against a fakeredis server: a channel whose handler is stuck does not hold back the others.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+import fakeredis
+from app.services.database.redis_service import RedisService
+
+QUEUE_SIZE = 4
+
+
+def build_service(redis:fakeredis.FakeAsyncRedis,callbacks:dict[str,dict])->RedisService:
+    redisService = RedisService.__new__(RedisService)
+    redisService.redis_events = redis
+    redisService.to_shutdown = False
+    redisService.monitoringService = None
+    redisService.callbacks = callbacks
+    redisService.configService = SimpleNamespace(REDIS_PUBSUB_QUEUE_SIZE=QUEUE_SIZE)
+    return redisService
+
+
+def test_stuck_channel_does_not_block_the_others():
+    async def main():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        redisService = build_service(redis,{'slow':{},'fast':{}})
+        stuck = asyncio.Event()
+        received = []
+
+        async def slow(message):
+            await stuck.wait()
+
+        async def fast(message):
+            received.append(message['n'])
+
+        queues = {'slow':asyncio.Queue(QUEUE_SIZE),'fast':asyncio.Queue(QUEUE_SIZE)}
+        tasks = [
+            asyncio.create_task(redisService._dispatch_channel('slow',queues['slow'],redisService._channel_handler('asset-reload',slow))),
+            asyncio.create_task(redisService._dispatch_channel('fast',queues['fast'],redisService._channel_handler('asset-reload',fast))),
+            asyncio.create_task(redisService._listen_channels(queues)),
+        ]
+        await asyncio.sleep(.05)
+        for n in range(QUEUE_SIZE*3):
+            await redis.publish('slow',json.dumps({'n':n}))
+        for n in range(3):
+            await redis.publish('fast',json.dumps({'n':n}))
+
+        for _ in range(100):
+            if len(received) == 3:
+                break
+            await asyncio.sleep(.01)
+
+        stuck.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks,return_exceptions=True)
+        return received
+
+    assert asyncio.run(main()) == [0,1,2]
@@ -0,0 +1,129 @@
+"""
+The pipelined envelope of `pipelined_sendmail` against a stub SMTP server advertising PIPELINING, that answers every
+command of the group on its own like a pipelining server does: a refused envelope whose DATA was accepted must not
+commit a message.
+"""
+import smtplib as smtp
+import socketserver
+import threading
+import pytest
+from app.classes.smtp_pool import pipelined_sendmail
+
+MESSAGE = b'Subject: hello\r\n\r\nbody\r\n'
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self,line:str):
+        self.wfile.write(line.encode()+b'\r\n')
+
+    def handle(self):
+        server:StubSMTPServer = self.server
+        self.reply('220 stub ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith('EHLO'):
+                self.wfile.write(b'250-stub\r\n250-PIPELINING\r\n250 SIZE 1000000\r\n')
+            elif command.startswith('MAIL'):
+                self.reply(server.mail_reply)
+            elif command.startswith('RCPT'):
+                self.reply(server.rcpt_reply)
+            elif command == 'DATA':
+                self.reply(server.data_reply)
+                if server.data_reply.startswith('354'):
+                    self.read_message()
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+    def read_message(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if line == b'.\r\n':
+                break
+            lines.append(line)
+        self.server.delivered.append(b''.join(lines))
+        self.reply('250 queued')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self,mail_reply='250 OK',rcpt_reply='250 OK',data_reply='354 go ahead'):
+        super().__init__(('127.0.0.1',0),StubSMTPHandler)
+        self.mail_reply = mail_reply
+        self.rcpt_reply = rcpt_reply
+        self.data_reply = data_reply
+        self.delivered:list[bytes] = []
+
+
+def send(server:StubSMTPServer,to:list[str]=['to@example.com'])->tuple[smtp.SMTP,Exception|None]:
+    thread = threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+    connector = smtp.SMTP(*server.server_address)
+    try:
+        pipelined_sendmail(connector,'from@example.com',to,MESSAGE)
+        error = None
+    except smtp.SMTPException as e:
+        error = e
+    return connector,error
+
+
+@pytest.fixture
+def servers():
+    started = []
+    def start(**kwargs):
+        server = StubSMTPServer(**kwargs)
+        started.append(server)
+        return server
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_message_is_delivered_once(servers):
+    server = servers()
+    connector,error = send(server)
+    connector.quit()
+
+    assert error == None
+    assert server.delivered == [MESSAGE]
+
+
+def test_refused_sender_after_an_accepted_data_commits_nothing(servers):
+    server = servers(mail_reply='550 sender refused')
+    connector,error = send(server)
+
+    assert isinstance(error,smtp.SMTPSenderRefused)
+    assert server.delivered == []
+    # NOTE the session had to be dropped, it cannot be reused
+    assert connector.sock == None
+
+
+def test_refused_recipients_after_an_accepted_data_commit_nothing(servers):
+    server = servers(rcpt_reply='550 no such user')
+    connector,error = send(server,['a@example.com','b@example.com'])
+
+    assert isinstance(error,smtp.SMTPRecipientsRefused)
+    assert server.delivered == []
+    assert connector.sock == None
+
+
+def test_refused_data_keeps_the_session(servers):
+    server = servers(mail_reply='550 sender refused',data_reply='503 no valid recipients')
+    connector,error = send(server)
+
+    assert isinstance(error,smtp.SMTPSenderRefused)
+    assert connector.noop()[0] == 250
+    connector.quit()
+    assert server.delivered == []
@@ -0,0 +1,99 @@
+"""
+The SMTP connection pool against a local aiosmtpd server: no connection before the first borrow, the messages of a
+pooled connection share one session and a connection is replaced once it sent `max_messages` messages.
+"""
+import smtplib as smtp
+import socket
+from aiosmtpd.controller import Controller
+from app.classes.smtp_pool import SMTPConnectionPool, pipelined_sendmail
+
+MESSAGE = b'Subject: hello\r\n\r\nbody\r\n'
+
+
+class RecordingHandler:
+
+    def __init__(self):
+        self.peers = []
+
+    async def handle_DATA(self,server,session,envelope):
+        self.peers.append(session.peer)
+        return '250 OK'
+
+
+def free_port()->int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1',0))
+        return s.getsockname()[1]
+
+
+def start_server()->tuple[Controller,RecordingHandler]:
+    handler = RecordingHandler()
+    controller = Controller(handler,hostname='127.0.0.1',port=free_port())
+    controller.start()
+    return controller,handler
+
+
+def build_pool(controller:Controller,opened:list,**kwargs)->SMTPConnectionPool:
+
+    def open_connection():
+        connector = smtp.SMTP(controller.hostname,controller.port)
+        opened.append(connector)
+        return connector
+
+    def close_connection(connector:smtp.SMTP):
+        connector.quit()
+
+    return SMTPConnectionPool(open_connection,close_connection,**kwargs)
+
+
+def send(pool:SMTPConnectionPool,pooled=None):
+    pooled = pool.rotate(pooled)
+    pooled.messages+=1
+    pipelined_sendmail(pooled.connector,'from@example.com',['to@example.com'],MESSAGE)
+    return pooled
+
+
+def test_no_connection_before_the_first_borrow():
+    controller,_ = start_server()
+    try:
+        opened = []
+        pool = build_pool(controller,opened,min_size=2,max_size=4)
+        assert opened == []
+
+        pool.release(pool.acquire())
+        assert len(opened) == 2 and pool.size == 2
+        pool.close()
+    finally:
+        controller.stop()
+
+
+def test_messages_share_the_pooled_session():
+    controller,handler = start_server()
+    try:
+        opened = []
+        pool = build_pool(controller,opened,min_size=1,max_size=1)
+        for _ in range(5):
+            pool.release(send(pool))
+        pool.close()
+    finally:
+        controller.stop()
+
+    assert len(opened) == 1
+    assert len(handler.peers) == 5 and len(set(handler.peers)) == 1
+
+
+def test_connection_is_replaced_after_max_messages():
+    controller,handler = start_server()
+    try:
+        opened = []
+        pool = build_pool(controller,opened,min_size=1,max_size=1,max_messages=2)
+        pooled = None
+        for _ in range(5):
+            pooled = send(pool,pooled)
+        pool.release(pooled)
+        pool.close()
+    finally:
+        controller.stop()
+
+    assert len(opened) == 3
+    assert len(handler.peers) == 5 and len(set(handler.peers)) == 3
@@ -0,0 +1,51 @@
+"""
+The stream consumer of `RedisService` against a fakeredis server: an entry its handler keeps failing is reclaimed until
+it was delivered more than `REDIS_STREAM_MAX_DELIVERIES` times, then moved to the dead-letter stream.
+"""
+import asyncio
+from types import SimpleNamespace
+import fakeredis
+from app.services.database.redis_service import RedisService
+from app.utils.constant import StreamConstant
+
+STREAM = 'links-event'
+MAX_DELIVERIES = 2
+
+
+def build_service(redis:fakeredis.FakeAsyncRedis)->RedisService:
+    redisService = RedisService.__new__(RedisService)
+    redisService.redis_events = redis
+    redisService.consumer_name = 'notifyr-consumer=test'
+    redisService.monitoringService = None
+    redisService.configService = SimpleNamespace(REDIS_STREAM_CLAIM_IDLE=0,REDIS_STREAM_MAX_DELIVERIES=MAX_DELIVERIES)
+    return redisService
+
+
+def test_poison_entry_is_moved_to_the_dead_letter_stream():
+    async def main():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        redisService = build_service(redis)
+        await redis.xgroup_create(STREAM,RedisService.GROUP,id='0-0',mkstream=True)
+        poison_id = await redis.xadd(STREAM,{'link_id':'poison'})
+        handled = []
+
+        async def handler(entries):
+            handled.extend(fields['link_id'] for _,fields in entries)
+            return [entry_id for entry_id,fields in entries if fields['link_id'] != 'poison']
+
+        response = await redis.xreadgroup(RedisService.GROUP,redisService.consumer_name,{STREAM:'>'})
+        await redisService._process_entries(STREAM,response[0][1],handler)
+        await redis.xadd(STREAM,{'link_id':'healthy'})
+        await redis.xreadgroup(RedisService.GROUP,redisService.consumer_name,{STREAM:'>'})
+
+        # NOTE the healthy entry is pending once, like one whose consumer died
+        for _ in range(MAX_DELIVERIES+2):
+            await redisService._claim_stream(STREAM,'0-0',10,handler)
+
+        assert handled == ['poison']*MAX_DELIVERIES+['healthy']
+        assert (await redis.xpending(STREAM,RedisService.GROUP))['pending'] == 0
+        assert await redis.xlen(STREAM) == 0
+
+        dead_letters = await redis.xrange(StreamConstant.DEAD_LETTER_STREAM(STREAM))
+        assert [fields for _,fields in dead_letters] == [{'link_id':'poison','dead_letter_id':poison_id,'dead_letter_deliveries':str(MAX_DELIVERIES+1)}]
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+"""
+The stub embedding of the offline runs covers the semantic splitter of the file ingestion as well as the search.
+"""
+import asyncio
+from llama_index.core import Document
+from llama_index.core.node_parser import SemanticSplitterNodeParser, SentenceSplitter
+from app.classes.embedding_batch import StubEmbedding, StubParseEmbedding
+
+TEXT = ' '.join(f'Sentence {i} talks about topic {i%3}.' for i in range(30))
+
+
+def test_parse_embedding_matches_the_search_one():
+    stub = StubEmbedding(64)
+    parse = StubParseEmbedding(stub)
+
+    assert parse.get_text_embedding('hello') == stub.embed('hello')
+    assert asyncio.run(parse.aget_query_embedding('hello')) == asyncio.run(stub.aget_query_embedding('hello'))
+
+
+def test_semantic_splitter_runs_on_the_stub():
+    splitter = SentenceSplitter(chunk_size=1000,chunk_overlap=200)
+    parser = SemanticSplitterNodeParser(buffer_size=3,breakpoint_percentile_threshold=95,sentence_splitter=splitter.split_text,embed_model=StubParseEmbedding(StubEmbedding(64)))
+
+    nodes = asyncio.run(parser.abuild_semantic_nodes_from_documents([Document(text=TEXT)]))
+    assert nodes
+    assert ' '.join(node.text.strip() for node in nodes).split() == TEXT.split()
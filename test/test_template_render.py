@@ -0,0 +1,91 @@
+"""
+Render of a tracked email campaign: `HTMLTemplate.build` once per recipient against `HTMLTemplate.prepare` once for the
+campaign and `PreparedTemplate.build` splicing the pixel and the links of each recipient.
+
+`python test/test_template_render.py` prints the render time per recipient of both paths.
+"""
+import time
+from app.classes.template import URL_PATTERN, HTMLTemplate
+
+RECIPIENTS = 500
+SECTIONS = 20
+
+HTML = """<html><head><title>Newsletter</title></head><body>
+<h1>{{ title }}</h1>
+{% for section in sections %}
+<div class="section"><h2>{{ section.title }}</h2><p>{{ section.text | sub_url }}</p><a href="{{ section.link | sub_url }}">Read more</a></div>
+{% endfor %}
+<p class="footer">{{ footer | sub_url }}</p>
+</body></html>"""
+
+CSS = '.section { padding: 8px; } .footer { color: gray; } h1 { font-size: 20px; }'
+
+DATA = {
+    'title':'The news of the week',
+    'sections':[{'title':f'Section {i}','text':f'Lorem ipsum dolor sit amet, see https://news.example/{i} for the details.','link':f'https://news.example/{i}/more'} for i in range(SECTIONS)],
+    'footer':'Unsubscribe at https://news.example/unsubscribe',
+}
+
+
+def make_template()->HTMLTemplate:
+    template = HTMLTemplate('newsletter.html',HTML,'email',len(HTML))
+    template.loadCSS(CSS)
+    template.add_tracking_pixel()
+    template.set_content()
+    return template
+
+
+def tracking(contact_id:str):
+    def callback(content:str):
+        if content == None:
+            return None
+        return URL_PATTERN.sub(lambda match: f'https://t.example/link/t/?r={match.group(0)}&contact_id={contact_id}',content)
+    return callback
+
+
+def pixel(contact_id:str)->str:
+    return f'https://t.example/pixel?contact_id={contact_id}'
+
+
+def render_per_recipient(template:HTMLTemplate,contact_ids:list[str])->list:
+    return [template.build(dict(DATA),None,tracking(contact_id),tracking_url=pixel(contact_id)) for contact_id in contact_ids]
+
+
+def render_prepared(template:HTMLTemplate,contact_ids:list[str])->list:
+    prepared = template.prepare(dict(DATA))
+    results = []
+    for contact_id in contact_ids:
+        callback = tracking(contact_id)
+        results.append(prepared.build(pixel(contact_id),[callback(url) for url in prepared.links]))
+    return results
+
+
+def timings(recipients:int=RECIPIENTS)->dict[str,float]:
+    """Milliseconds of render per recipient of both paths"""
+    template = make_template()
+    contact_ids = [f'contact-{i}' for i in range(recipients)]
+    timings = {}
+    for name,render in (('per recipient',render_per_recipient),('prepared',render_prepared)):
+        start = time.perf_counter()
+        render(template,contact_ids)
+        timings[name] = (time.perf_counter()-start)/recipients*1000
+    return timings
+
+
+def test_prepared_render_matches_the_per_recipient_one():
+    template = make_template()
+    contact_ids = ['c1','c2','c3']
+    assert render_prepared(template,contact_ids) == render_per_recipient(template,contact_ids)
+
+
+def test_prepared_render_is_an_order_of_magnitude_cheaper():
+    results = timings(100)
+    assert results['prepared']*10 < results['per recipient']
+
+
+if __name__ == '__main__':
+    results = timings()
+    print(f'{RECIPIENTS} recipients, {SECTIONS} sections with 2 links each')
+    for name,per_recipient in results.items():
+        print(f'{name:>14}: {per_recipient:.3f} ms per recipient')
+    print(f'speedup: {results["per recipient"]/results["prepared"]:.1f}x')
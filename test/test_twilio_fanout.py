@@ -0,0 +1,110 @@
+"""
+The retries of the twilio fan-out against a fake twilio server, the SDK sends its requests through the kept-alive client
+rewritten to the fake server so the errors are the ones raised by the real `create_async`.
+"""
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from twilio.rest import Client
+from app.classes.twilio_fanout import KeepAliveTwilioHttpClient, TwilioFanOut
+
+ACCOUNT_SID = 'AC00000000000000000000000000000000'
+TWILIO_API = 'https://api.twilio.com'
+FROM = '+15550000000'
+
+
+class FakeTwilioHttpClient(KeepAliveTwilioHttpClient):
+
+    def __init__(self,base_url:str,**kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    async def request(self,method,url,*args,**kwargs):
+        return await super().request(method,url.replace(TWILIO_API,self.base_url,1),*args,**kwargs)
+
+
+class FakeTwilio:
+    """
+    Answers each recipient with its scripted statuses in order, then with a created message.
+    The status 0 drops the connection once the request is received.
+    """
+
+    def __init__(self,script:dict[str,list[int]]):
+        self.script = script
+        self.received:dict[str,int] = {}
+
+    async def create_message(self,request:web.Request):
+        to = (await request.post())['To']
+        self.received[to] = self.received.get(to,0) + 1
+        statuses = self.script.get(to,[])
+        status = statuses.pop(0) if statuses else 201
+
+        if status == 0:
+            request.transport.close()
+            raise web.HTTPInternalServerError()
+
+        if status != 201:
+            return web.json_response({'code':20000+status,'message':'fake error','status':status},status=status)
+
+        return web.json_response({'sid':f'SM{self.received[to]:032d}','account_sid':ACCOUNT_SID,'to':to,'from':FROM,'status':'queued','body':'hello'},status=201)
+
+    def app(self)->web.Application:
+        app = web.Application()
+        app.router.add_post(f'/2010-04-01/Accounts/{ACCOUNT_SID}/Messages.json',self.create_message)
+        return app
+
+
+async def fanout_to(base_url:str,recipients:list[str],max_retries:int=3):
+    http_client = FakeTwilioHttpClient(base_url)
+    client = Client(ACCOUNT_SID,'token',http_client=http_client)
+    fanout = TwilioFanOut(concurrency=4,rate=0,max_retries=max_retries,backoff=0.01)
+
+    async def send(i:int,to:str):
+        return await client.messages.create_async(to=to,from_=FROM,body='hello')
+
+    try:
+        return await fanout.run(recipients,send)
+    finally:
+        await http_client.close()
+
+
+def run(script:dict[str,list[int]],recipients:list[str]):
+    async def main():
+        fake = FakeTwilio({to:list(statuses) for to,statuses in script.items()})
+        server = TestServer(fake.app())
+        await server.start_server()
+        try:
+            return await fanout_to(str(server.make_url('')).rstrip('/'),recipients),fake.received
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_rejected_requests_are_retried():
+    results,received = run({'+1000':[429,429],'+2000':[503]},['+1000','+2000','+3000'])
+
+    assert [r.error for r in results] == [None,None,None]
+    assert [r.attempts for r in results] == [3,2,1]
+    assert received == {'+1000':3,'+2000':2,'+3000':1}
+
+
+def test_requests_twilio_may_have_processed_are_not_retried():
+    results,received = run({'+1000':[500],'+2000':[502],'+3000':[0]},['+1000','+2000','+3000'])
+
+    assert all(r.error != None for r in results)
+    assert [r.attempts for r in results] == [1,1,1]
+    # NOTE a retry of these could create the message twice
+    assert received == {'+1000':1,'+2000':1,'+3000':1}
+
+
+def test_unreachable_server_is_retried():
+    async def main():
+        server = TestServer(web.Application())
+        await server.start_server()
+        base_url = str(server.make_url('')).rstrip('/')
+        await server.close()
+        return await fanout_to(base_url,['+1000'],max_retries=2)
+
+    results = asyncio.run(main())
+    assert results[0].error != None
+    assert results[0].attempts == 3
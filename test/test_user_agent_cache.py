@@ -0,0 +1,95 @@
+"""
+Ingestion of a batch of link events over a synthetic user agent distribution: a few agents make most of the traffic,
+like the browsers of a real campaign. Every event parsed by `DeviceDetector` as `Add_Link_Event` did, against the
+`UserAgentCache` it goes through now. `DeviceDetector` keeps its own cache of the agents it parsed, it is emptied
+before each cold batch.
+
+`python test/test_user_agent_cache.py` prints the events per second and the hit ratio of both paths.
+"""
+import random
+import time
+from device_detector.settings import DDCache
+from app.classes.user_agent import UserAgentCache, parse_user_agent
+
+EVENTS = 4000
+DISTINCT = 40
+ZIPF = 1.2
+
+TEMPLATES = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{v}.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_{v} like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; Pixel {v}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_{v}) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15',
+]
+
+
+def user_agents(events:int=EVENTS,distinct:int=DISTINCT,seed:int=7)->list[str]:
+    agents = [TEMPLATES[i%len(TEMPLATES)].format(v=i) for i in range(distinct)]
+    weights = [1/(rank+1)**ZIPF for rank in range(distinct)]
+    return random.Random(seed).choices(agents,weights,k=events)
+
+
+def parse_every_event(batch:list[str]):
+    for user_agent in batch:
+        parse_user_agent(user_agent)
+
+
+def throughput(ingest,batch:list[str])->float:
+    start = time.perf_counter()
+    ingest(batch)
+    return len(batch)/(time.perf_counter()-start)
+
+
+def measure(events:int=EVENTS,distinct:int=DISTINCT)->dict[str,dict]:
+    """Events per second of a cold and a warm batch for both paths, with the hit ratio of the cache"""
+    batch = user_agents(events,distinct)
+    cache = UserAgentCache()
+
+    def parse_cached(batch:list[str]):
+        for user_agent in batch:
+            cache.parse(user_agent)
+
+    # NOTE the regexes of DeviceDetector are loaded by the first parse, not by the path measured first
+    for template in TEMPLATES:
+        parse_user_agent(template.format(v=999))
+
+    results = {}
+    for name,ingest in (('every event',parse_every_event),('cache',parse_cached)):
+        DDCache['user_agents'].clear()
+        results[name] = {'cold':throughput(ingest,batch),'warm':throughput(ingest,batch)}
+    results['cache']['hit_ratio'] = cache.stats['hit_ratio']
+    return results
+
+
+def test_cache_speeds_up_the_ingestion():
+    results = measure()
+    assert results['cache']['warm'] > results['every event']['warm']*5
+    assert results['cache']['hit_ratio'] > 0.99
+
+
+def test_cached_agents_match_the_parsed_ones():
+    cache = UserAgentCache()
+    for user_agent in set(user_agents(200,8)):
+        assert cache.parse(user_agent) == parse_user_agent(user_agent)
+
+
+def test_clear_keeps_the_totals():
+    cache = UserAgentCache()
+    batch = user_agents(50,4)
+    for user_agent in batch:
+        cache.parse(user_agent)
+    hits,misses = cache.hits,cache.misses
+
+    cache.clear()
+    cache.parse(batch[0])
+    # NOTE the exported counters only grow, a reset would make the next increment negative
+    assert cache.hits == hits and cache.misses == misses+1
+    assert cache.stats['size'] == 1
+
+
+if __name__ == '__main__':
+    results = measure()
+    print(f'{EVENTS} events over {DISTINCT} user agents, zipf {ZIPF}')
+    for name,result in results.items():
+        print(f"{name:>12}: cold {result['cold']:.0f} events/s, warm {result['warm']:.0f} events/s")
+    print(f"hit ratio {results['cache']['hit_ratio']:.3f}")